@@ -0,0 +1,116 @@
+"""
+Seleção parcial (top-K), filtros e paginação por cursor para resultados de análise
+"""
+import base64
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def parse_filter(value: Optional[str]) -> Optional[List[str]]:
+    """Converte um filtro "Alta,Média" em lista (None = sem filtro)"""
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _encode_cursor(sort: str, key: float, position: int) -> str:
+    payload = json.dumps({"s": sort, "k": key, "p": position}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> Tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key, position = float(payload["k"]), int(payload["p"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if payload.get("s") != sort:
+        raise HTTPException(status_code=400, detail="Cursor gerado com outra ordenação")
+    return key, position
+
+
+def _sort_keys(df: pd.DataFrame, sort: Optional[str], sortable: List[str]) -> Tuple[np.ndarray, str]:
+    """
+    Chave numérica crescente de ordenação de cada linha
+
+    Sem sort: posição na saída do analisador (ordem de negócio já aplicada).
+    "coluna" ordena crescente, "-coluna" decrescente; NaN vai para o fim.
+    """
+    if not sort:
+        return np.arange(len(df), dtype=np.float64), ""
+
+    column = sort.lstrip("-")
+    if column not in sortable:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ordenação inválida: {column}. Opções: {', '.join(sortable)}"
+        )
+    keys = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    if sort.startswith("-"):
+        keys = -keys
+    return np.where(np.isnan(keys), np.inf, keys), sort
+
+
+def select_page(
+    df: pd.DataFrame,
+    limit: Optional[int],
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    sortable: Optional[List[str]] = None,
+    filters: Optional[Dict[str, Optional[List[str]]]] = None
+) -> Tuple[pd.DataFrame, Optional[str], int]:
+    """
+    Seleciona uma página do resultado sem ordenar nem converter o DataFrame inteiro
+
+    A seleção usa np.partition para achar o K-ésimo menor valor da chave e só
+    ordena os candidatos até ele; o cursor (keyset) guarda a chave e a posição
+    da última linha retornada, com a posição como desempate.
+
+    Args:
+        df: Resultado da análise (na ordem do analisador)
+        limit: Tamanho da página (None = todas as linhas restantes)
+        cursor: Cursor devolvido pela página anterior
+        sort: Coluna de ordenação ("-coluna" para decrescente)
+        sortable: Colunas aceitas em sort
+        filters: Coluna -> valores aceitos
+
+    Returns:
+        Tupla (página, próximo cursor ou None, total de linhas após os filtros)
+    """
+    keys, sort_token = _sort_keys(df, sort, sortable or [])
+    positions = np.arange(len(df))
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in (filters or {}).items():
+        if values:
+            mask &= df[column].isin(values).to_numpy()
+    total_matching = int(mask.sum())
+
+    if cursor:
+        cursor_key, cursor_position = _decode_cursor(cursor, sort_token)
+        mask &= (keys > cursor_key) | ((keys == cursor_key) & (positions > cursor_position))
+
+    candidates = np.flatnonzero(mask)
+    remaining = len(candidates)
+    if limit is not None and remaining > limit:
+        candidate_keys = keys[candidates]
+        kth = np.partition(candidate_keys, limit - 1)[limit - 1]
+        # Empates no K-ésimo valor são resolvidos pela posição no lexsort abaixo
+        candidates = candidates[candidate_keys <= kth]
+
+    order = np.lexsort((positions[candidates], keys[candidates]))
+    if limit is not None:
+        order = order[:limit]
+    page_idx = candidates[order]
+
+    next_cursor = None
+    if len(page_idx) and len(page_idx) < remaining:
+        last = page_idx[-1]
+        next_cursor = _encode_cursor(sort_token, float(keys[last]), int(last))
+
+    return df.iloc[page_idx], next_cursor, total_matching
@@ -0,0 +1,218 @@
+"""
+Cache de corpos de resposta já serializados e comprimidos (gzip / brotli)
+"""
+import gzip
+import hashlib
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic.fields import FieldInfo
+
+from app.config import settings
+from app.api.responses import FastJSONResponse, dumps
+from app.services.metrics import CACHE_REQUESTS
+from app.services.profiling import is_profiling
+
+try:
+    import brotli
+except ImportError:  # Opcional: sem brotli, apenas gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Valores aceitos como booleanos nos parâmetros de query (os mesmos do pydantic)
+_BOOL_VALUES = {
+    True: {"1", "on", "t", "true", "y", "yes"},
+    False: {"0", "off", "f", "false", "n", "no"},
+}
+
+
+def _route_defaults(endpoint: Callable) -> Dict[str, Any]:
+    """Parâmetros da rota com valor padrão simples (bool, número, texto)"""
+    defaults = {}
+    for name, parameter in inspect.signature(endpoint).parameters.items():
+        default = parameter.default
+        if isinstance(default, FieldInfo):
+            default = default.default
+        if isinstance(default, (bool, int, float, str)):
+            defaults[name] = default
+    return defaults
+
+
+def _is_default(value: str, default: Any) -> bool:
+    if isinstance(default, bool):
+        return value.strip().lower() in _BOOL_VALUES[default]
+    if isinstance(default, (int, float)):
+        try:
+            return type(default)(value) == default
+        except ValueError:
+            return False
+    return value == default
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.RESPONSE_CACHE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.RESPONSE_CACHE_GZIP_LEVEL, mtime=0)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Escolhe a codificação pelo header Accept-Encoding (br > gzip em empate)
+
+    Returns:
+        "br", "gzip" ou None (sem compressão)
+    """
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CachedBody:
+    """Corpo JSON de uma resposta e suas versões comprimidas (criadas sob demanda)"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        self.encoded: Dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self.encoded.values())
+
+
+class ResponseCache:
+    """
+    Cache LRU de respostas por (rota, parâmetros, fingerprint dos dados)
+
+    Parâmetros com o valor padrão da rota não entram na chave: ?limit=20 ou
+    ?save_to_powerbi=false (como o frontend envia) usam a mesma entrada que a
+    requisição sem parâmetros do aquecimento e dos eventos. Cada corpo é serializado uma vez e comprimido no máximo uma vez por
+    codificação; as requisições seguintes (ex: polling do dashboard)
+    recebem os bytes armazenados. Um novo upload muda o fingerprint e as
+    entradas antigas saem por LRU.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, min_compress_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.min_compress_bytes = min_compress_bytes
+        self._entries: "OrderedDict[Tuple, CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Caminho -> valores padrão dos parâmetros, lidos da rota no primeiro acesso
+        self._defaults: Dict[str, Dict[str, Any]] = {}
+
+    def _params(self, path: str, query_items) -> Tuple:
+        """Parâmetros ordenados, sem os que têm o valor padrão da rota"""
+        defaults = self._defaults.get(path, {})
+        return tuple(sorted(
+            (name, value) for name, value in query_items
+            if not (name in defaults and _is_default(value, defaults[name]))
+        ))
+
+    def _key(self, request: Request, fingerprint: str) -> Tuple:
+        path = request.url.path
+        endpoint = request.scope.get("endpoint")
+        if path not in self._defaults and endpoint is not None:
+            self._defaults[path] = _route_defaults(endpoint)
+        return (path, self._params(path, request.query_params.multi_items()), fingerprint)
+
+    def contains(self, path: str, query_items, fingerprint: Optional[str]) -> bool:
+        """Há resposta armazenada para o caminho e parâmetros (sem contar acerto nem mover no LRU)"""
+        if fingerprint is None:
+            return False
+        with self._lock:
+            return (path, self._params(path, query_items), fingerprint) in self._entries
+
+    def get(self, request: Request, fingerprint: Optional[str]) -> Optional[Response]:
+        """Resposta armazenada para a requisição, ou None (fingerprint None = sem cache)"""
+        if fingerprint is None or is_profiling(request):
+            return None
+        key = self._key(request, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if settings.METRICS_ENABLED:
+            CACHE_REQUESTS.inc(1, "miss" if entry is None else "hit")
+        if entry is None:
+            return None
+        return self._respond(request, key, entry, "HIT")
+
+    def respond(self, request: Request, fingerprint: Optional[str], content: Any) -> Response:
+        """Serializa o conteúdo, armazena (se fingerprint) e devolve a resposta"""
+        if fingerprint is None:
+            return FastJSONResponse(content)
+
+        key = self._key(request, fingerprint)
+        entry = CachedBody(dumps(content))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+        return self._respond(request, key, entry, "MISS")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+
+    def _respond(self, request: Request, key: Tuple, entry: CachedBody, status: str) -> Response:
+        headers = {"ETag": entry.etag, "Vary": "Accept-Encoding", "X-Cache": status}
+
+        if entry.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        body = entry.body
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding and len(body) >= self.min_compress_bytes:
+            body = entry.encoded.get(encoding)
+            if body is None:
+                body = _compress(entry.body, encoding)
+                with self._lock:
+                    if encoding not in entry.encoded:
+                        entry.encoded[encoding] = body
+                        if self._entries.get(key) is entry:
+                            self._bytes += len(body)
+                            self._evict()
+                logger.debug(f"🗜️ Corpo comprimido ({encoding}): {len(entry.body)} -> {len(body)} bytes")
+            headers["Content-Encoding"] = encoding
+
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+    min_compress_bytes=settings.RESPONSE_COMPRESS_MIN_BYTES
+)
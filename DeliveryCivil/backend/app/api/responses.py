@@ -0,0 +1,128 @@
+"""
+Serialização JSON rápida para respostas com DataFrames
+"""
+import datetime
+import json
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.services.metrics import stage_timer
+
+try:
+    import orjson
+except ImportError:  # Opcional: sem orjson usa json da biblioteca padrão
+    orjson = None
+
+
+def sanitize_frame(
+    df: pd.DataFrame,
+    decimals: Optional[int] = None,
+    fill_value: Optional[float] = None,
+    max_abs: Optional[float] = None
+) -> pd.DataFrame:
+    """
+    Trata NaN/inf e arredonda as colunas float de uma vez (NumPy por coluna)
+
+    Args:
+        df: DataFrame a serializar
+        decimals: Casas decimais (None = sem arredondamento)
+        fill_value: Valor para NaN/inf (None = null no JSON)
+        max_abs: Valores com módulo >= max_abs também são tratados como inválidos
+
+    Returns:
+        Cópia rasa do DataFrame com as colunas float tratadas
+    """
+    float_columns = df.select_dtypes(include=[np.floating]).columns
+    if len(float_columns) == 0:
+        return df
+
+    df = df.copy(deep=False)
+    for column in float_columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        invalid = ~np.isfinite(values)
+        if max_abs is not None:
+            invalid |= np.abs(values) >= max_abs
+        if decimals is not None:
+            values = np.round(values, decimals)
+
+        if fill_value is not None:
+            df[column] = np.where(invalid, fill_value, values)
+        elif invalid.any():
+            # NaN vira null no orjson; inf também precisa virar NaN
+            df[column] = np.where(invalid, np.nan, values)
+        elif decimals is not None:
+            df[column] = values
+    return df
+
+
+def frame_records(df: pd.DataFrame, **sanitize) -> List[Dict[str, Any]]:
+    """
+    Converte o DataFrame em lista de registros a partir dos arrays das colunas
+
+    Cada coluna é convertida uma única vez com tolist() (tipos nativos do
+    Python), sem passar pelo jsonable_encoder do FastAPI valor a valor.
+
+    Args:
+        df: DataFrame a converter
+        **sanitize: Opções de sanitize_frame (decimals, fill_value, max_abs)
+    """
+    with stage_timer("serialize.records"):
+        df = sanitize_frame(df, **sanitize)
+        columns = [str(column) for column in df.columns]
+        values = [df[column].tolist() for column in df.columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _default(value: Any) -> Any:
+    """Tipos não nativos do JSON (numpy, pandas, datas)"""
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, pd.Timedelta):
+        return value.total_seconds()
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+@stage_timer("serialize.json")
+def dumps(content: Any) -> bytes:
+    """Serializa em JSON (orjson quando disponível); NaN vira null"""
+    if orjson is not None:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(
+        _replace_nan(content), default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _replace_nan(content: Any) -> Any:
+    """Fallback sem orjson: json.dumps não aceita NaN com allow_nan=False"""
+    if isinstance(content, float) and not np.isfinite(content):
+        return None
+    if isinstance(content, dict):
+        return {key: _replace_nan(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [_replace_nan(value) for value in content]
+    return content
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Resposta JSON serializada com orjson
+
+    Rotas que retornam esta resposta diretamente não passam pelo
+    jsonable_encoder do FastAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,7 +1,8 @@
 """
 Endpoints para análises de negócio
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.datastructures import QueryParams
 from typing import Optional
 import pandas as pd
 import logging
@@ -10,73 +11,283 @@ from pathlib import Path
 from app.config import settings
 from app.etl.extract.sales_extractor import SalesExtractor
 from app.etl.extract.stock_extractor import StockExtractor
-from app.etl.transform.promotion_analyzer import PromotionAnalyzer
-from app.etl.transform.stock_analyzer import StockAnalyzer
-from app.etl.transform.cashback_analyzer import CashbackAnalyzer
-from app.etl.load.powerbi_loader import PowerBILoader
+from app.etl.transform.analyzers import ANALYZERS, build_analyzers
+from app.etl.transform.sharded_analyzer import ShardedAnalyzer
+from app.etl.transform.duckdb_backend import DuckDBAnalyzer
+from app.etl.load.star_schema import StarSchemaExporter
+from app.models.policy import AnalysisPolicy, BatchAnalysisRequest
+from app.api.pagination import parse_filter, select_page
+from app.api.streaming import negotiate_format, stream_dataframe
+from app.api.responses import FastJSONResponse, frame_records
+from app.api.response_cache import response_cache
+from app.services.fingerprint import dataset_fingerprint
+from app.services.export_jobs import export_jobs, ExportQueueFullError
+from app.services.metrics import stage_timer, count_rows
+from app.services.memory import MemoryBudgetExceededError
+from app.services.shared_datasets import shared_datasets
+from app.services.admission import ANALYSIS, dataset_rows, latest_dataset_file, register_cost
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 
-def _load_latest_datasets():
-    """Carrega os datasets mais recentes"""
-    raw_dir = Path(settings.DATA_RAW_DIR)
-    
-    # Encontrar arquivos mais recentes
-    sales_files = list(raw_dir.glob("vendas_*.csv"))
-    stock_files = list(raw_dir.glob("estoque_*.csv"))
+@stage_timer("discover")
+def _latest_dataset_files():
+    """Localiza os arquivos de vendas e estoque mais recentes"""
+    # Envio mais recente (índice de uploads) ou, sem registro, mtime mais recente
+    latest_sales = latest_dataset_file("vendas")
+    latest_stock = latest_dataset_file("estoque")
     
-    if not sales_files:
+    if latest_sales is None:
         raise HTTPException(status_code=404, detail="Dataset de vendas não encontrado")
-    if not stock_files:
+    if latest_stock is None:
         raise HTTPException(status_code=404, detail="Dataset de estoque não encontrado")
     
-    # Pegar arquivo mais recente
-    latest_sales = max(sales_files, key=lambda p: p.stat().st_mtime)
-    latest_stock = max(stock_files, key=lambda p: p.stat().st_mtime)
+    return latest_sales, latest_stock
+
+def _load_latest_datasets():
+    """Carrega os datasets mais recentes"""
+    latest_sales, latest_stock = _latest_dataset_files()
     
     # Carregar dados
     sales_extractor = SalesExtractor()
     stock_extractor = StockExtractor()
     
+    if settings.SHARED_DATASETS_ENABLED:
+        # Geração em memória compartilhada entre os workers (somente leitura)
+        sales_df = shared_datasets.get("vendas", latest_sales, sales_extractor.from_csv)
+        stock_df = shared_datasets.get("estoque", latest_stock, stock_extractor.from_csv)
+        return sales_df, stock_df
+    
     sales_df = sales_extractor.from_csv(str(latest_sales))
     stock_df = stock_extractor.from_csv(str(latest_stock))
     
     return sales_df, stock_df
 
+# Coluna de classificação de cada análise (usada nas distribuições do lote)
+RECOMMENDATION_COLUMNS = {
+    'promocao': 'recomendacao_promocao',
+    'estoque': 'urgencia_reposicao',
+    'cashback': 'recomendacao_cashback',
+}
+
+# Colunas numéricas aceitas no parâmetro sort de cada análise
+SORTABLE_COLUMNS = {
+    'promocao': [
+        'produto_id', 'quantidade_atual', 'dias_estoque', 'margem_lucro', 'preco_medio',
+        'custo_unitario', 'frequencia_vendas', 'vendas_30d', 'vendas_30d_quantidade',
+        'vendas_90d_quantidade', 'desconto_sugerido', 'score_promocao'
+    ],
+    'estoque': [
+        'produto_id', 'quantidade_atual', 'quantidade_minima', 'vendas_media_diaria', 'vendas_7d',
+        'vendas_7d_quantidade', 'vendas_7d_receita', 'dias_ate_ruptura', 'quantidade_sugerida',
+        'custo_reposicao', 'custo_unitario', 'score_reposicao'
+    ],
+    'cashback': [
+        'produto_id', 'margem_lucro', 'frequencia_vendas', 'clientes_unicos', 'ticket_medio',
+        'preco_medio', 'roi_cashback', 'score_cashback', 'cashback_sugerido'
+    ],
+}
+
+def _default_policy() -> AnalysisPolicy:
+    """Política configurada em ANALYSIS_POLICY_FILE (ou limiares padrão)"""
+    if settings.ANALYSIS_POLICY_FILE:
+        return AnalysisPolicy.from_file(settings.ANALYSIS_POLICY_FILE)
+    return AnalysisPolicy()
+
+def _dataset_fingerprint(files=None) -> str:
+    """Fingerprint dos arquivos e configurações que determinam o resultado das análises"""
+    paths = list(files or _latest_dataset_files())
+    if settings.ANALYSIS_POLICY_FILE:
+        paths.append(Path(settings.ANALYSIS_POLICY_FILE))
+    return dataset_fingerprint(paths, extra=(
+        settings.ANALYTICS_BACKEND,
+        settings.CASHBACK_DISTINCT_MODE,
+        settings.HLL_RELATIVE_ERROR,
+    ))
+
+def _cache_fingerprint(cacheable: bool = True) -> Optional[str]:
+    """
+    Fingerprint para o cache de respostas
+    
+    Returns:
+        Fingerprint, ou None quando a resposta não deve usar o cache
+    """
+    if not cacheable or not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    return _dataset_fingerprint()
+
+def _analysis_cost(passes: int):
+    """
+    Estimador de custo para o controle de admissão: linhas de vendas e
+    estoque vezes as passadas da rota (o resumo e o lote rodam as três análises)
+    
+    O estimador devolve None quando a resposta já está no cache (ou não há
+    datasets): a requisição é uma leitura barata.
+    """
+    def estimate(scope) -> Optional[float]:
+        files = (latest_dataset_file("vendas"), latest_dataset_file("estoque"))
+        if None in files:
+            return None
+        if scope["method"] == "GET" and settings.RESPONSE_CACHE_ENABLED:
+            query_items = QueryParams(scope["query_string"]).multi_items()
+            if response_cache.contains(scope["path"], query_items, _dataset_fingerprint(files)):
+                return None
+        return ((dataset_rows("vendas") or 0) + (dataset_rows("estoque") or 0)) * passes
+    return estimate
+
+# Custo das rotas no controle de admissão (caminhos completos, com o prefixo /api)
+register_cost("GET", "/api/analytics/promotion", ANALYSIS, _analysis_cost(1))
+register_cost("GET", "/api/analytics/stock", ANALYSIS, _analysis_cost(1))
+register_cost("GET", "/api/analytics/cashback", ANALYSIS, _analysis_cost(1))
+register_cost("GET", "/api/analytics/summary", ANALYSIS, _analysis_cost(3))
+register_cost("POST", "/api/analytics/batch", ANALYSIS, _analysis_cost(3))
+
+def _submit_export(result_df: pd.DataFrame, table_name: str) -> dict:
+    """Enfileira a exportação para o Power BI e retorna o job para a resposta"""
+    try:
+        job = export_jobs.submit(result_df, table_name, _dataset_fingerprint())
+    except ExportQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/api/exports/{job.job_id}"
+    }
+
+def _count_result_rows(results: dict):
+    """Produtos analisados por análise (métrica deliverycivil_rows_processed_total)"""
+    for name, result_df in results.items():
+        count_rows(f"analyze.{name}", len(result_df))
+
+def _run_analyses(analyses: list, sharded: bool = False, engine: Optional[str] = None):
+    """
+    Executa as análises sobre os datasets mais recentes
+    
+    Args:
+        analyses: Nomes das análises ('promocao', 'estoque', 'cashback')
+        sharded: Particionar por loja e processar em paralelo (backend pandas)
+        engine: Backend de execução ("pandas" ou "duckdb"; padrão: ANALYTICS_BACKEND)
+    
+    Returns:
+        Tupla (dict nome -> DataFrame de resultado, dict de totais para o resumo)
+    """
+    engine = engine or settings.ANALYTICS_BACKEND
+    policy = _default_policy()
+    
+    if engine == "duckdb":
+        if sharded:
+            raise HTTPException(
+                status_code=400,
+                detail="sharded=true só é suportado com engine=pandas (o DuckDB já paraleliza a consulta)"
+            )
+        latest_sales, latest_stock = _latest_dataset_files()
+        analyzer = DuckDBAnalyzer(latest_sales, latest_stock, policy=policy)
+        try:
+            results = analyzer.analyze(analyses)
+            _count_result_rows(results)
+            return results, analyzer.totals()
+        finally:
+            analyzer.close()
+    
+    if engine != "pandas":
+        raise ValueError(f"Backend de análise desconhecido: {engine}")
+    
+    sales_df, stock_df = _load_latest_datasets()
+    totals = {
+        'total_products': int(len(stock_df)),
+        'total_sales': int(len(sales_df)),
+        'total_revenue': float(sales_df['valor_total'].sum()) if 'valor_total' in sales_df.columns else 0.0
+    }
+    
+    if sharded:
+        results = ShardedAnalyzer(policy=policy).analyze(sales_df, stock_df, analyses)
+        _count_result_rows(results)
+        return results, totals
+    
+    latest_sales, _ = _latest_dataset_files()
+    analyzers = build_analyzers(analyses, policy, latest_sales, sales_df)
+    
+    results = {name: analyzer.analyze(sales_df, stock_df) for name, analyzer in analyzers.items()}
+    _count_result_rows(results)
+    return results, totals
+
 @router.get("/analytics/promotion")
-async def analyze_promotion(save_to_powerbi: bool = False):
+async def analyze_promotion(
+    request: Request,
+    save_to_powerbi: bool = False,
+    sharded: bool = False,
+    engine: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    recomendacao: Optional[str] = Query(None, description="Ex: Alta,Média"),
+    sort: Optional[str] = Query(None, description="Coluna numérica; prefixo '-' para decrescente"),
+    format: Optional[str] = Query(None, description="json (padrão), ndjson ou arrow; ou via header Accept")
+):
     """
     Analisa produtos para identificar oportunidades de promoção
     
     Returns:
-        Lista de produtos recomendados para promoção
+        Página de produtos recomendados para promoção (padrão: top 20)
     """
     try:
-        sales_df, stock_df = _load_latest_datasets()
+        # Sem exportação nem streaming: resposta serializada/comprimida em cache por fingerprint
+        media_type = negotiate_format(request, format)
+        fingerprint = _cache_fingerprint(cacheable=not save_to_powerbi and media_type is None)
+        cached = response_cache.get(request, fingerprint)
+        if cached is not None:
+            return cached
         
-        analyzer = PromotionAnalyzer()
-        result_df = analyzer.analyze(sales_df, stock_df)
+        results, _ = _run_analyses(['promocao'], sharded, engine)
+        result_df = results['promocao']
         
-        # Converter para dict
-        result = result_df.to_dict("records")
+        # Exportação para Power BI em segundo plano (não atrasa a resposta)
+        export_job = _submit_export(result_df, "promocao_analise") if save_to_powerbi else None
         
-        # Salvar para Power BI se solicitado
-        if save_to_powerbi:
-            loader = PowerBILoader()
-            loader.save_for_powerbi(result_df, "promocao_analise")
+        # Exportação completa em streaming (NDJSON / Arrow IPC), sem limit
+        if media_type:
+            export_df, _, _ = select_page(
+                result_df, None, None, sort, SORTABLE_COLUMNS['promocao'],
+                {'recomendacao_promocao': parse_filter(recomendacao)}
+            )
+            return stream_dataframe(export_df, media_type, filename="promocao_analise")
         
-        return {
+        # Converter para dict apenas a página retornada
+        page_df, next_cursor, matching = select_page(
+            result_df, limit, cursor, sort, SORTABLE_COLUMNS['promocao'],
+            {'recomendacao_promocao': parse_filter(recomendacao)}
+        )
+        
+        content = {
             "message": "Análise de promoção concluída",
-            "total_products": len(result),
-            "products": result[:20]  # Top 20
+            "total_products": len(result_df),
+            "matching_products": matching,
+            "next_cursor": next_cursor,
+            "products": frame_records(page_df)
         }
+        if export_job:
+            content["export_job"] = export_job
+        
+        return response_cache.respond(request, fingerprint, content)
+    except HTTPException:
+        raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"Erro na análise de promoção: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
 @router.get("/analytics/stock")
-async def analyze_stock(save_to_powerbi: bool = False):
+async def analyze_stock(
+    request: Request,
+    save_to_powerbi: bool = False,
+    sharded: bool = False,
+    engine: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Padrão: todos os produtos"),
+    cursor: Optional[str] = None,
+    urgencia: Optional[str] = Query(None, description="Ex: Crítica,Alta"),
+    sort: Optional[str] = Query(None, description="Coluna numérica; prefixo '-' para decrescente"),
+    format: Optional[str] = Query(None, description="json (padrão), ndjson ou arrow; ou via header Accept")
+):
     """
     Analisa estoque para identificar necessidade de reposição
     
@@ -84,81 +295,139 @@ async def analyze_stock(save_to_powerbi: bool = False):
         Lista de produtos que precisam ser repostos
     """
     try:
-        sales_df, stock_df = _load_latest_datasets()
+        # Sem exportação nem streaming: resposta serializada/comprimida em cache por fingerprint
+        media_type = negotiate_format(request, format)
+        fingerprint = _cache_fingerprint(cacheable=not save_to_powerbi and media_type is None)
+        cached = response_cache.get(request, fingerprint)
+        if cached is not None:
+            return cached
         
-        analyzer = StockAnalyzer()
-        result_df = analyzer.analyze(sales_df, stock_df)
+        results, _ = _run_analyses(['estoque'], sharded, engine)
+        result_df = results['estoque']
         
-        result = result_df.to_dict("records")
+        # Exportação para Power BI em segundo plano (não atrasa a resposta)
+        export_job = _submit_export(result_df, "estoque_analise") if save_to_powerbi else None
         
-        if save_to_powerbi:
-            loader = PowerBILoader()
-            loader.save_for_powerbi(result_df, "estoque_analise")
+        # Exportação completa em streaming (NDJSON / Arrow IPC), sem limit
+        if media_type:
+            export_df, _, _ = select_page(
+                result_df, None, None, sort, SORTABLE_COLUMNS['estoque'],
+                {'urgencia_reposicao': parse_filter(urgencia)}
+            )
+            return stream_dataframe(export_df, media_type, filename="estoque_analise")
         
         # Contar produtos por urgência
-        critical = [r for r in result if r['urgencia_reposicao'] == 'Crítica']
-        high = [r for r in result if r['urgencia_reposicao'] == 'Alta']
-        medium = [r for r in result if r['urgencia_reposicao'] == 'Média']
+        urgency_counts = result_df['urgencia_reposicao'].value_counts()
         
-        # Retornar todos os produtos (não apenas críticos) para exibição completa
-        # Ordenados por urgência (Crítica → Alta → Média → Baixa)
-        return {
+        # Sem limit retorna todos os produtos para exibição completa,
+        # ordenados por urgência (Crítica → Alta → Média → Baixa)
+        page_df, next_cursor, matching = select_page(
+            result_df, limit, cursor, sort, SORTABLE_COLUMNS['estoque'],
+            {'urgencia_reposicao': parse_filter(urgencia)}
+        )
+        
+        content = {
             "message": "Análise de estoque concluída",
-            "total_products": len(result),
-            "critical_products": len(critical),
-            "high_urgency_products": len(high),
-            "medium_urgency_products": len(medium),
-            "products": result  # Todos os produtos ordenados por urgência
+            "total_products": len(result_df),
+            "critical_products": int(urgency_counts.get('Crítica', 0)),
+            "high_urgency_products": int(urgency_counts.get('Alta', 0)),
+            "medium_urgency_products": int(urgency_counts.get('Média', 0)),
+            "matching_products": matching,
+            "next_cursor": next_cursor,
+            "products": frame_records(page_df)
         }
+        if export_job:
+            content["export_job"] = export_job
+        
+        return response_cache.respond(request, fingerprint, content)
+    except HTTPException:
+        raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"Erro na análise de estoque: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
 @router.get("/analytics/cashback")
-async def analyze_cashback(save_to_powerbi: bool = False):
+async def analyze_cashback(
+    request: Request,
+    save_to_powerbi: bool = False,
+    sharded: bool = False,
+    engine: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    recomendacao: Optional[str] = Query(None, description="Ex: Alta,Média"),
+    sort: Optional[str] = Query(None, description="Coluna numérica; prefixo '-' para decrescente"),
+    format: Optional[str] = Query(None, description="json (padrão), ndjson ou arrow; ou via header Accept")
+):
     """
     Analisa produtos para identificar oportunidades de cashback
     
     Returns:
-        Lista de produtos recomendados para cashback
+        Página de produtos recomendados para cashback (padrão: top 20)
     """
     try:
-        sales_df, stock_df = _load_latest_datasets()
+        # Sem exportação nem streaming: resposta serializada/comprimida em cache por fingerprint
+        media_type = negotiate_format(request, format)
+        fingerprint = _cache_fingerprint(cacheable=not save_to_powerbi and media_type is None)
+        cached = response_cache.get(request, fingerprint)
+        if cached is not None:
+            return cached
         
-        analyzer = CashbackAnalyzer()
-        result_df = analyzer.analyze(sales_df, stock_df)
+        results, _ = _run_analyses(['cashback'], sharded, engine)
+        result_df = results['cashback']
         
-        result = result_df.to_dict("records")
+        # Exportação para Power BI em segundo plano (não atrasa a resposta)
+        export_job = _submit_export(result_df, "cashback_analise") if save_to_powerbi else None
         
-        if save_to_powerbi:
-            loader = PowerBILoader()
-            loader.save_for_powerbi(result_df, "cashback_analise")
+        # Exportação completa em streaming (NDJSON / Arrow IPC), sem limit
+        if media_type:
+            export_df, _, _ = select_page(
+                result_df, None, None, sort, SORTABLE_COLUMNS['cashback'],
+                {'recomendacao_cashback': parse_filter(recomendacao)}
+            )
+            return stream_dataframe(export_df, media_type, filename="cashback_analise")
         
-        return {
+        page_df, next_cursor, matching = select_page(
+            result_df, limit, cursor, sort, SORTABLE_COLUMNS['cashback'],
+            {'recomendacao_cashback': parse_filter(recomendacao)}
+        )
+        
+        content = {
             "message": "Análise de cashback concluída",
-            "total_products": len(result),
-            "products": result[:20]  # Top 20
+            "total_products": len(result_df),
+            "matching_products": matching,
+            "next_cursor": next_cursor,
+            "products": frame_records(page_df)
         }
+        if export_job:
+            content["export_job"] = export_job
+        
+        return response_cache.respond(request, fingerprint, content)
+    except HTTPException:
+        raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"Erro na análise de cashback: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
 @router.get("/analytics/summary")
-async def get_analytics_summary():
+async def get_analytics_summary(request: Request, sharded: bool = False, engine: Optional[str] = None):
     """
     Retorna resumo de todas as análises
     """
     try:
-        sales_df, stock_df = _load_latest_datasets()
+        fingerprint = _cache_fingerprint()
+        cached = response_cache.get(request, fingerprint)
+        if cached is not None:
+            return cached
         
         # Análises rápidas
-        promotion_analyzer = PromotionAnalyzer()
-        stock_analyzer = StockAnalyzer()
-        cashback_analyzer = CashbackAnalyzer()
-        
-        promotion_df = promotion_analyzer.analyze(sales_df, stock_df)
-        stock_df_result = stock_analyzer.analyze(sales_df, stock_df)
-        cashback_df = cashback_analyzer.analyze(sales_df, stock_df)
+        results, totals = _run_analyses(['promocao', 'estoque', 'cashback'], sharded, engine)
+        promotion_df = results['promocao']
+        stock_df_result = results['estoque']
+        cashback_df = results['cashback']
         
         # Garantir que as colunas existem e não são NaN antes de filtrar
         promotion_df['recomendacao_promocao'] = promotion_df['recomendacao_promocao'].fillna('Baixa')
@@ -171,36 +440,23 @@ async def get_analytics_summary():
         cashback_high = cashback_df[cashback_df['recomendacao_cashback'] == 'Alta']
         
         # Calcular valor total de vendas (soma dos valores)
-        total_revenue = float(sales_df['valor_total'].sum()) if 'valor_total' in sales_df.columns else 0.0
+        total_revenue = totals['total_revenue']
         
         # Garantir ordenação correta antes de pegar top 5
         # Promotion já está ordenado por score_promocao (desc)
         # Stock já está ordenado por urgência e score
         # Cashback já está ordenado por score_cashback (desc)
         
-        # Converter valores NaN para garantir serialização JSON
-        def clean_dict(d):
-            """Remove NaN e inf dos valores"""
-            import math
-            cleaned = {}
-            for k, v in d.items():
-                if isinstance(v, float):
-                    if math.isnan(v) or math.isinf(v):
-                        cleaned[k] = 0.0
-                    else:
-                        cleaned[k] = round(v, 2) if abs(v) < 1e10 else 0.0
-                else:
-                    cleaned[k] = v
-            return cleaned
+        # NaN/inf -> 0 e arredondamento em 2 casas, por coluna
+        clean = dict(decimals=2, fill_value=0.0, max_abs=1e10)
+        top_promotion = frame_records(promotion_df.head(5), **clean)
+        top_stock = frame_records(stock_df_result[stock_df_result['urgencia_reposicao'].isin(['Crítica', 'Alta'])].head(5), **clean)
+        top_cashback = frame_records(cashback_df.head(5), **clean)
         
-        top_promotion = [clean_dict(r) for r in promotion_df.head(5).to_dict("records")]
-        top_stock = [clean_dict(r) for r in stock_df_result[stock_df_result['urgencia_reposicao'].isin(['Crítica', 'Alta'])].head(5).to_dict("records")]
-        top_cashback = [clean_dict(r) for r in cashback_df.head(5).to_dict("records")]
-        
-        return {
+        return response_cache.respond(request, fingerprint, {
             "summary": {
-                "total_products": int(len(stock_df)),
-                "total_sales": int(len(sales_df)),
+                "total_products": totals['total_products'],
+                "total_sales": totals['total_sales'],
                 "total_revenue": round(total_revenue, 2),
                 "promotion_opportunities": int(len(promotion_high)),
                 "stock_critical": int(len(stock_critical)),
@@ -209,8 +465,122 @@ async def get_analytics_summary():
             "top_promotion": top_promotion,
             "top_stock": top_stock,
             "top_cashback": top_cashback
-        }
+        })
+    except HTTPException:
+        raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"Erro no resumo de análises: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
+
+@router.post("/analytics/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Avalia várias políticas de análise sobre os mesmos dados em uma requisição
+    
+    A agregação das vendas (etapa cara) é calculada uma única vez por
+    combinação de parâmetros que a afetam (ex: janelas da promoção) e
+    compartilhada entre as políticas; apenas as regras por produto e a
+    classificação são refeitas para cada política.
+    
+    Returns:
+        Distribuição das recomendações e top N produtos por política e análise
+    """
+    try:
+        unknown = [name for name in request.analyses if name not in ANALYZERS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Análises desconhecidas: {unknown}")
+        
+        sales_df, stock_df = _load_latest_datasets()
+        data_atual = pd.to_datetime(sales_df['data']).max()
+        
+        # Agregações compartilhadas: (análise, chave de agregação) -> vendas agregadas
+        aggregations = {}
+        policies = []
+        
+        for policy in request.policies:
+            policy_result = {"nome": policy.nome}
+            
+            for name in request.analyses:
+                analyzer = ANALYZERS[name](policy)
+                key = (name, analyzer.aggregation_key())
+                if key not in aggregations:
+                    if name == 'cashback':
+                        aggregations[key] = analyzer.aggregate_sales(sales_df)
+                    else:
+                        aggregations[key] = analyzer.aggregate_sales(sales_df, data_atual)
+                
+                result_df = analyzer.score(analyzer.derive_metrics(stock_df, aggregations[key]))
+                distribution = result_df[RECOMMENDATION_COLUMNS[name]].value_counts()
+                
+                policy_result[name] = {
+                    "total_products": int(len(result_df)),
+                    "distribution": {str(k): int(v) for k, v in distribution.items()},
+                    "products": frame_records(result_df.head(request.top_n))
+                }
+            
+            policies.append(policy_result)
+        
+        logger.info(
+            f"✅ Análise em lote concluída: {len(request.policies)} políticas, "
+            f"{len(aggregations)} agregações compartilhadas"
+        )
+        
+        return FastJSONResponse({
+            "message": "Análise em lote concluída",
+            "policies_count": len(policies),
+            "shared_aggregations": len(aggregations),
+            "policies": policies
+        })
+    except HTTPException:
+        raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro na análise em lote: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
+
+@router.post("/analytics/star-schema")
+async def export_star_schema(include_analyses: bool = True):
+    """
+    Exporta os dados em esquema estrela (Parquet) para o modelo do Power BI
+    
+    Gera dim_product, dim_date, dim_store (multi-loja), fact_sales_daily,
+    fact_stock e, opcionalmente, um fato por análise. A exportação roda em
+    segundo plano; acompanhe pelo job retornado.
+    
+    Returns:
+        Job de exportação
+    """
+    try:
+        analyses = list(ANALYZERS) if include_analyses else []
+        
+        def task():
+            sales_df, stock_df = _load_latest_datasets()
+            policy = _default_policy()
+            results = {name: ANALYZERS[name](policy).analyze(sales_df, stock_df) for name in analyses}
+            return {"files": StarSchemaExporter().export(sales_df, stock_df, results)}
+        
+        table_name = "star_schema" if include_analyses else "star_schema_base"
+        try:
+            job = export_jobs.submit_task(table_name, _dataset_fingerprint(), task)
+        except ExportQueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        
+        return {
+            "message": "Exportação do esquema estrela enfileirada",
+            "export_job": {
+                "job_id": job.job_id,
+                "status": job.status,
+                "status_url": f"/api/exports/{job.job_id}"
+            }
+        }
+    except HTTPException:
+        raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro na exportação do esquema estrela: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro na exportação: {str(e)}")
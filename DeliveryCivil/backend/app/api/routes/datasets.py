@@ -4,6 +4,7 @@ Endpoints para upload e processamento de datasets
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 from typing import List
+import json
 import pandas as pd
 from pathlib import Path
 import logging
@@ -13,9 +14,67 @@ from app.config import settings
 from app.etl.extract.sales_extractor import SalesExtractor
 from app.etl.extract.stock_extractor import StockExtractor
 from app.etl.extract.purchases_extractor import PurchasesExtractor
+from app.api.responses import FastJSONResponse, dumps, frame_records
+from app.services.memory import MemoryBudgetExceededError
+from app.services.uploads import commit_upload, reuse_duplicate, store_upload, upload_index
+from app.services.admission import INGEST, register_cost, upload_rows
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
+
+# Custo dos uploads no controle de admissão (caminhos completos, com o prefixo /api)
+register_cost("POST", "/api/datasets/upload/sales", INGEST, lambda scope: upload_rows(scope, "vendas"))
+register_cost("POST", "/api/datasets/upload/stock", INGEST, lambda scope: upload_rows(scope, "estoque"))
+register_cost("POST", "/api/datasets/upload/purchases", INGEST, lambda scope: upload_rows(scope, "compras"))
+
+async def _process_upload(file: UploadFile, dataset: str, extractor, label: str) -> dict:
+    """
+    Grava o upload (com hash do conteúdo), extrai e valida o CSV
+    
+    Conteúdo idêntico a um upload anterior do mesmo dataset reutiliza o
+    arquivo existente e o resultado da validação, sem extrair de novo.
+    
+    Args:
+        file: Arquivo recebido
+        dataset: Prefixo dos arquivos ("vendas", "estoque", "compras")
+        extractor: Extrator do dataset
+        label: Nome do dataset nas mensagens
+    """
+    upload = await store_upload(file, dataset)
+    logger.info(f"📦 Arquivo recebido: {upload.size} bytes (sha256 {upload.content_hash[:12]})")
+    
+    duplicate = reuse_duplicate(upload)
+    if duplicate is not None:
+        file_path = Path(settings.DATA_RAW_DIR) / duplicate["file_name"]
+        logger.info(f"♻️ Conteúdo já enviado: reutilizando {file_path.name}")
+        return {
+            "message": f"Dataset de {label} já enviado anteriormente (conteúdo idêntico)",
+            "records_count": duplicate["records_count"],
+            "file_path": str(file_path),
+            "sample": duplicate["sample"],
+            "content_hash": upload.content_hash,
+            "duplicate": True
+        }
+    
+    file_path = commit_upload(upload)
+    logger.info(f"💾 Arquivo salvo em: {file_path}")
+    
+    # Extrair e validar dados
+    df = extractor.from_csv(str(file_path))
+    records_count = len(df)
+    sample = json.loads(dumps(frame_records(df.head(5))))
+    upload_index.add(upload, file_path.name, records_count, sample)
+    
+    logger.info(f"✅ Dataset de {label} processado: {records_count} registros")
+    
+    return {
+        "message": f"Dataset de {label} processado com sucesso",
+        "records_count": records_count,
+        "file_path": str(file_path),
+        "sample": sample,
+        "content_hash": upload.content_hash,
+        "duplicate": False
+    }
 
 @router.post("/datasets/upload/sales")
 async def upload_sales_dataset(file: UploadFile = File(...)):
@@ -32,38 +91,11 @@ async def upload_sales_dataset(file: UploadFile = File(...)):
         if not file.filename or not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Arquivo deve ser CSV")
         
-        # Salvar arquivo temporariamente
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = Path(settings.DATA_RAW_DIR) / f"vendas_{timestamp}.csv"
-        
-        # Garantir que o diretório existe
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        content = await file.read()
-        logger.info(f"📦 Arquivo recebido: {len(content)} bytes")
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        logger.info(f"💾 Arquivo salvo em: {file_path}")
-        
-        # Extrair e validar dados
-        extractor = SalesExtractor()
-        df = extractor.from_csv(str(file_path))
-        
-        # Processar dados
-        records = df.to_dict("records")
-        
-        logger.info(f"✅ Dataset de vendas processado: {len(records)} registros")
-        
-        return {
-            "message": "Dataset de vendas processado com sucesso",
-            "records_count": len(records),
-            "file_path": str(file_path),
-            "sample": records[:5] if len(records) > 0 else []
-        }
+        return FastJSONResponse(await _process_upload(file, "vendas", SalesExtractor(), "vendas"))
     except HTTPException:
         raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Erro ao processar dataset de vendas: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
@@ -82,34 +114,11 @@ async def upload_stock_dataset(file: UploadFile = File(...)):
         if not file.filename or not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Arquivo deve ser CSV")
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = Path(settings.DATA_RAW_DIR) / f"estoque_{timestamp}.csv"
-        
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        content = await file.read()
-        logger.info(f"📦 Arquivo recebido: {len(content)} bytes")
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        logger.info(f"💾 Arquivo salvo em: {file_path}")
-        
-        extractor = StockExtractor()
-        df = extractor.from_csv(str(file_path))
-        
-        records = df.to_dict("records")
-        
-        logger.info(f"✅ Dataset de estoque processado: {len(records)} registros")
-        
-        return {
-            "message": "Dataset de estoque processado com sucesso",
-            "records_count": len(records),
-            "file_path": str(file_path),
-            "sample": records[:5] if len(records) > 0 else []
-        }
+        return FastJSONResponse(await _process_upload(file, "estoque", StockExtractor(), "estoque"))
     except HTTPException:
         raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Erro ao processar dataset de estoque: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
@@ -128,34 +137,11 @@ async def upload_purchases_dataset(file: UploadFile = File(...)):
         if not file.filename or not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Arquivo deve ser CSV")
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = Path(settings.DATA_RAW_DIR) / f"compras_{timestamp}.csv"
-        
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        content = await file.read()
-        logger.info(f"📦 Arquivo recebido: {len(content)} bytes")
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        logger.info(f"💾 Arquivo salvo em: {file_path}")
-        
-        extractor = PurchasesExtractor()
-        df = extractor.from_csv(str(file_path))
-        
-        records = df.to_dict("records")
-        
-        logger.info(f"✅ Dataset de compras processado: {len(records)} registros")
-        
-        return {
-            "message": "Dataset de compras processado com sucesso",
-            "records_count": len(records),
-            "file_path": str(file_path),
-            "sample": records[:5] if len(records) > 0 else []
-        }
+        return FastJSONResponse(await _process_upload(file, "compras", PurchasesExtractor(), "compras"))
     except HTTPException:
         raise
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Erro ao processar dataset de compras: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
@@ -173,8 +159,8 @@ async def list_datasets():
             "modified": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
         })
     
-    return {
+    return FastJSONResponse({
         "datasets": files,
         "count": len(files)
-    }
+    })
 
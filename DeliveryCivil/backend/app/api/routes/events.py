@@ -0,0 +1,72 @@
+"""
+Stream de eventos de atualização das análises (Server-Sent Events)
+"""
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import logging
+import time
+
+from app.config import settings
+from app.services.admission import exempt_route
+from app.services.analysis_events import analysis_events, format_event
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Intervalo de reconexão sugerido ao EventSource (ms)
+RETRY_MS = 5000
+
+# Conexão longa e sem processamento: fora do controle de admissão (não prende vaga interativa)
+exempt_route("GET", "/api/events/analyses")
+
+@router.get("/events/analyses")
+async def stream_analysis_events(request: Request, top: int = Query(0, ge=0)):
+    """
+    Eventos das análises (text/event-stream)
+
+    - dataset_changed: chegaram novos arquivos; as análises estão sendo calculadas
+    - analysis_ready: análises da versão N prontas (id do evento = N); com
+      ?top=N traz as linhas do topo de cada análise que mudaram
+
+    Ao conectar, o último analysis_ready é enviado se o header Last-Event-ID
+    não for dessa versão. O stream é encerrado após
+    ANALYSIS_EVENTS_MAX_STREAM_SECONDS e o EventSource reconecta sozinho.
+    """
+    if not settings.ANALYSIS_EVENTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Eventos das análises desativados (ANALYSIS_EVENTS_ENABLED)")
+
+    top = min(top, settings.ANALYSIS_EVENTS_MAX_ROWS)
+    last_event_id = request.headers.get("last-event-id")
+    subscriber = analysis_events.subscribe()
+
+    async def events():
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            current = analysis_events.current_event()
+            if current is not None and str(current["id"]) != last_event_id:
+                yield format_event(current, top)
+
+            deadline = time.monotonic() + settings.ANALYSIS_EVENTS_MAX_STREAM_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        timeout=min(settings.ANALYSIS_EVENTS_KEEPALIVE, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    # Comentário mantém a conexão aberta em proxies
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event, top)
+        finally:
+            analysis_events.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,32 @@
+"""
+Endpoints para acompanhar exportações do Power BI em segundo plano
+"""
+from fastapi import APIRouter, HTTPException
+import logging
+
+from app.services.export_jobs import export_jobs
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/exports")
+async def list_exports():
+    """Lista as exportações recentes (mais recentes primeiro)"""
+    jobs = export_jobs.list_jobs()
+    return {
+        "exports": [job.model_dump(mode="json") for job in jobs],
+        "count": len(jobs)
+    }
+
+@router.get("/exports/{job_id}")
+async def get_export(job_id: str):
+    """
+    Status de uma exportação
+    
+    Returns:
+        Estado do job (queued, running, completed, failed) e caminhos dos arquivos
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Exportação não encontrada: {job_id}")
+    return job.model_dump(mode="json")
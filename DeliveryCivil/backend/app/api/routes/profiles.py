@@ -0,0 +1,39 @@
+"""
+Endpoints para baixar os perfis de requisição (?profile=cpu|mem)
+"""
+from fastapi import APIRouter, HTTPException, Request
+import logging
+
+from app.services.profiling import is_admin, profile_store
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+def _require_admin(request: Request):
+    if not is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Perfis de requisição restritos a administradores")
+
+@router.get("/profiles")
+async def list_profiles(request: Request):
+    """Lista os perfis gravados (mais recentes primeiro)"""
+    _require_admin(request)
+    profiles = profile_store.list()
+    return {
+        "profiles": profiles,
+        "count": len(profiles)
+    }
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """
+    Relatório de um perfil
+    
+    Returns:
+        CPU: amostras por função do app, pilhas no formato folded e duração das etapas
+        Memória: pico total e por etapa e alocações vivas por linha do app
+    """
+    _require_admin(request)
+    report = profile_store.load(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Perfil não encontrado: {profile_id}")
+    return report
@@ -0,0 +1,121 @@
+"""
+Respostas em streaming (NDJSON e Arrow IPC) para exportação de resultados completos
+"""
+import io
+import logging
+import pandas as pd
+from typing import Iterator, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+
+try:
+    import pyarrow as pa
+except ImportError:  # Opcional: só necessário para application/vnd.apache.arrow.stream
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Valores aceitos no parâmetro ?format= (alternativa ao header Accept)
+FORMAT_ALIASES = {
+    "ndjson": NDJSON_MEDIA_TYPE,
+    "arrow": ARROW_STREAM_MEDIA_TYPE,
+    "json": None,
+}
+
+
+def negotiate_format(request: Request, format: Optional[str] = None) -> Optional[str]:
+    """
+    Escolhe o formato de streaming pelo parâmetro format ou pelo header Accept
+
+    Returns:
+        Media type de streaming, ou None para a resposta JSON padrão
+    """
+    if format:
+        if format not in FORMAT_ALIASES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato inválido: {format}. Opções: {', '.join(FORMAT_ALIASES)}"
+            )
+        return FORMAT_ALIASES[format]
+
+    accept = request.headers.get("accept", "")
+    if ARROW_STREAM_MEDIA_TYPE in accept:
+        return ARROW_STREAM_MEDIA_TYPE
+    if NDJSON_MEDIA_TYPE in accept:
+        return NDJSON_MEDIA_TYPE
+    return None
+
+
+def _batches(df: pd.DataFrame, batch_rows: int) -> Iterator[pd.DataFrame]:
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows]
+
+
+def _iter_ndjson(df: pd.DataFrame, batch_rows: int) -> Iterator[bytes]:
+    """Uma linha JSON por registro, serializando um lote por vez"""
+    for batch in _batches(df, batch_rows):
+        chunk = batch.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+        if not chunk.endswith("\n"):
+            chunk += "\n"
+        yield chunk.encode("utf-8")
+
+
+def _arrow_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas object com tipos mistos (ex: alerta None preenchido com 0) viram texto"""
+    object_columns = [col for col in df.columns if df[col].dtype == object]
+    if not object_columns:
+        return df
+    return df.astype({col: "string" for col in object_columns})
+
+
+def _iter_arrow(df: pd.DataFrame, batch_rows: int) -> Iterator[bytes]:
+    """Stream Arrow IPC: schema + um record batch por lote + marcador de fim"""
+    schema = pa.Schema.from_pandas(_arrow_frame(df.head(0)), preserve_index=False)
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate(0)
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for batch in _batches(df, batch_rows):
+            record_batch = pa.RecordBatch.from_pandas(_arrow_frame(batch), schema=schema, preserve_index=False)
+            writer.write_batch(record_batch)
+            yield drain()
+    yield drain()
+
+
+def stream_dataframe(df: pd.DataFrame, media_type: str, filename: Optional[str] = None) -> StreamingResponse:
+    """
+    Transmite o DataFrame em lotes no formato negociado
+
+    A memória extra fica limitada a um lote (STREAM_BATCH_ROWS) e o primeiro
+    byte sai assim que o primeiro lote é serializado.
+    """
+    batch_rows = settings.STREAM_BATCH_ROWS
+
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        if pa is None:
+            raise HTTPException(status_code=406, detail="Formato Arrow indisponível: pacote 'pyarrow' não instalado")
+        body = _iter_arrow(df, batch_rows)
+        extension = "arrows"
+    else:
+        body = _iter_ndjson(df, batch_rows)
+        extension = "ndjson"
+
+    headers = {"X-Total-Count": str(len(df))}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+
+    logger.info(f"📤 Streaming de {len(df)} registros como {media_type}")
+
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -2,7 +2,7 @@
 Configurações da aplicação
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 from pathlib import Path
 
@@ -29,6 +29,132 @@ class Settings(BaseSettings):
     DATA_PROCESSED_DIR: str = "data/processed"
     DATA_OUTPUT_DIR: str = "data/output/powerbi"
     
+    # Exportação para Power BI: formatos gravados por save_for_powerbi (csv, json, parquet)
+    POWERBI_EXPORT_FORMATS: List[str] = ["csv", "json"]
+    POWERBI_PARQUET_COMPRESSION: str = "zstd"
+    POWERBI_FULL_RETENTION: int = 10  # Exportações completas mantidas por tabela (0 = todas)
+    
+    # Exportação incremental (POWERBI_EXPORT_MODE=delta): snapshot + deltas por tabela
+    POWERBI_EXPORT_MODE: str = "full"  # "full" ou "delta"
+    POWERBI_DELTA_MAX_CHAIN: int = 24  # Deltas sobre o snapshot antes de compactar
+    POWERBI_DELTA_COMPACT_RATIO: float = 0.5  # Compactar quando os deltas somam N x as linhas da tabela
+    POWERBI_SNAPSHOT_RETENTION: int = 2  # Gerações (snapshot + deltas) mantidas
+    
+    # Power BI (Service Principal do Azure AD + push datasets)
+    AZURE_TENANT_ID: Optional[str] = None
+    AZURE_CLIENT_ID: Optional[str] = None
+    AZURE_CLIENT_SECRET: Optional[str] = None
+    AZURE_AUTHORITY_URL: str = "https://login.microsoftonline.com"
+    POWER_BI_WORKSPACE_ID: Optional[str] = None
+    POWER_BI_REPORT_ID: Optional[str] = None
+    POWER_BI_DATASET_ID: Optional[str] = None  # Push dataset que recebe as análises
+    POWER_BI_API_URL: str = "https://api.powerbi.com/v1.0/myorg"
+    POWER_BI_SCOPE: str = "https://analysis.windows.net/powerbi/api/.default"
+    POWER_BI_TOKEN_REFRESH_MARGIN: int = 300  # Renovar o token N segundos antes de expirar
+    POWER_BI_TIMEOUT: float = 30.0
+    POWER_BI_MAX_CONNECTIONS: int = 8
+    POWER_BI_PUSH_BATCH_ROWS: int = 10_000  # Limite da API por requisição
+    POWER_BI_PUSH_CONCURRENCY: int = 4
+    POWER_BI_MAX_RETRIES: int = 5
+    POWER_BI_RETRY_BACKOFF: float = 0.5  # Segundos; dobra a cada tentativa
+    POWER_BI_PUSH_ENABLED: bool = False  # Enviar as exportações também para o push dataset
+    
+    # Exportações em segundo plano (save_to_powerbi)
+    EXPORT_WORKERS: int = 2
+    EXPORT_MAX_PENDING: int = 32  # Jobs na fila/em execução antes de recusar novos
+    EXPORT_JOB_HISTORY: int = 200  # Jobs finalizados mantidos para consulta
+    
+    # Streaming de resultados (NDJSON / Arrow IPC): registros por lote
+    STREAM_BATCH_ROWS: int = 10_000
+    
+    # Cache de respostas das análises (JSON serializado + gzip/brotli por fingerprint dos dados)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 256
+    RESPONSE_CACHE_MAX_MB: int = 64
+    RESPONSE_COMPRESS_MIN_BYTES: int = 1024  # Respostas menores seguem sem compressão
+    RESPONSE_CACHE_GZIP_LEVEL: int = 9  # Comprime uma vez por fingerprint: nível alto compensa
+    RESPONSE_CACHE_BROTLI_QUALITY: int = 9
+    
+    # Métricas por etapa e por rota em /metrics (formato Prometheus)
+    METRICS_ENABLED: bool = True
+    METRICS_SHARE_SECONDS: float = 5  # Intervalo da cópia das métricas de cada worker para /metrics somar (0 = só o worker que responde)
+    METRICS_SHARED_DIR: str = ""  # Vazio = /dev/shm/deliverycivil/metrics (ou DATA_PROCESSED_DIR/metrics sem /dev/shm)
+    
+    # Perfil sob demanda (?profile=cpu|mem com X-Admin-Token); vazio = desativado
+    PROFILING_ADMIN_TOKEN: Optional[str] = None
+    PROFILING_SAMPLE_INTERVAL: float = 0.005  # Segundos entre amostras do perfil de CPU
+    PROFILING_TRACEMALLOC_FRAMES: int = 1  # Pilhas mais profundas atribuem mais alocações ao app, mas são bem mais lentas
+    PROFILING_KEEP: int = 50  # Relatórios mantidos em DATA_PROCESSED_DIR/profiles
+    
+    # Memória por etapa (RSS) e orçamento por requisição
+    MEMORY_TRACKING_ENABLED: bool = True
+    MEMORY_SAMPLE_INTERVAL: float = 0.01  # Segundos entre amostras do RSS durante as etapas
+    MEMORY_LOG_MIN_MB: float = 64  # Etapas com pico menor só aparecem no log em DEBUG
+    MEMORY_REQUEST_BUDGET_MB: float = 0  # Crescimento máximo do RSS por requisição (0 = sem limite)
+    MEMORY_CSV_EXPANSION: float = 3.0  # Memória estimada para ler um CSV, em múltiplos do tamanho do arquivo
+    
+    # Aquecimento na inicialização: /ready só responde 200 depois destas requisições internas
+    WARMUP_ENABLED: bool = True
+    WARMUP_PATHS: List[str] = [
+        "/api/analytics/summary",
+        "/api/analytics/promotion",
+        "/api/analytics/stock",
+        "/api/analytics/cashback",
+    ]
+    WARMUP_TIMEOUT: float = 300  # Segundos; ao exceder, o worker fica pronto mesmo assim (0 = sem limite)
+
+    # Logging: escrita em segundo plano, JSON por linha em LOG_DIR/app.<pid>.log (um por processo) com rotação
+    LOG_LEVEL: str = "INFO"
+    LOG_DIR: str = "logs"
+    LOG_FORMAT: str = "text"  # Saída do console: "text" ou "json" (o arquivo é sempre JSON)
+    LOG_MAX_MB: float = 50  # Tamanho do arquivo de cada processo antes de rotacionar
+    LOG_BACKUP_COUNT: int = 5  # Arquivos rotacionados mantidos por processo
+    LOG_QUEUE_SIZE: int = 10_000  # Registros pendentes antes de descartar os novos
+    LOG_SAMPLED_LOGGERS: List[str] = ["app.access", "app.etl.extract", "app.etl.transform"]
+    LOG_SAMPLE_RATE: float = 1.0  # Fração dos registros INFO/DEBUG mantida nesses loggers
+
+    # Controle de admissão: filas justas ponderadas por custo estimado (linhas) e limite por cliente
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 0  # Análises/uploads executados ao mesmo tempo, cada um em sua thread; 0 = número de CPUs
+    ADMISSION_MAX_COST: float = 20_000_000  # Linhas estimadas em processamento por worker
+    ADMISSION_INTERACTIVE_RESERVE: float = 0.1  # Fração do custo reservada às leituras interativas (o restante fica com análises/uploads)
+    ADMISSION_LANE_WEIGHTS: Dict[str, float] = {"interactive": 8, "analysis": 2, "ingest": 1}
+    ADMISSION_CLIENT_MAX_CONCURRENT: int = 0  # Análises/uploads simultâneos por cliente (X-Client-ID ou IP); 0 = sem limite
+    ADMISSION_MAX_QUEUED: int = 256  # Requisições aguardando antes de responder 503
+    ADMISSION_QUEUE_TIMEOUT: float = 60  # Segundos na fila antes de responder 503 (0 = sem limite)
+
+    # Eventos de atualização das análises (SSE em /api/events/analyses)
+    ANALYSIS_EVENTS_ENABLED: bool = True
+    ANALYSIS_EVENTS_POLL_SECONDS: float = 2.0  # Intervalo de verificação de novos arquivos (só stat)
+    ANALYSIS_EVENTS_KEEPALIVE: float = 15.0  # Segundos entre comentários keepalive no stream
+    ANALYSIS_EVENTS_MAX_STREAM_SECONDS: float = 300  # Duração máxima de uma conexão (o EventSource reconecta)
+    ANALYSIS_EVENTS_MAX_ROWS: int = 20  # Linhas alteradas por análise no evento (limite de ?top)
+
+    # Datasets das análises publicados uma vez em memória compartilhada (Arrow IPC mapeado) entre os workers
+    SHARED_DATASETS_ENABLED: bool = True
+    SHARED_DATASETS_DIR: str = ""  # Vazio = /dev/shm/deliverycivil (ou DATA_PROCESSED_DIR/shared sem /dev/shm)
+
+    # Pipeline em lote (run_etl.py): saídas das etapas em cache por hash das entradas
+    ETL_CACHE_DIR: str = ""  # Vazio = DATA_PROCESSED_DIR/etl_cache
+    ETL_CACHE_KEEP: int = 2  # Versões mantidas por etapa (0 = todas)
+
+    # Análise particionada (multi-loja)
+    ANALYSIS_WORKERS: int = 0  # 0 = número de CPUs
+    SHARD_MAX_ROWS: int = 500_000  # Vendas por partição antes de dividir a loja por produto
+    
+    # Política de análise (JSON com limiares; vazio = valores padrão)
+    ANALYSIS_POLICY_FILE: str = ""
+    
+    # Clientes únicos no cashback: "exact" (nunique) ou "hll" (HyperLogLog, mesclável)
+    CASHBACK_DISTINCT_MODE: str = "exact"
+    HLL_RELATIVE_ERROR: float = 0.02  # Erro padrão relativo dos sketches
+    
+    # Backend de análise: "pandas" (padrão) ou "duckdb" (SQL embarcado, out-of-core)
+    ANALYTICS_BACKEND: str = "pandas"
+    DUCKDB_MEMORY_LIMIT: str = "2GB"
+    DUCKDB_THREADS: int = 0  # 0 = padrão do DuckDB (número de CPUs)
+    DUCKDB_MATERIALIZE_PARQUET: bool = True  # Converter CSVs brutos para Parquet em DATA_PROCESSED_DIR
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
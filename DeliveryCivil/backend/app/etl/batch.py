@@ -0,0 +1,197 @@
+"""
+Execução em lote do pipeline ETL (sem servidor web)
+
+Extrai vendas e estoque uma única vez (em paralelo), executa as análises
+em paralelo e grava cada resultado para o Power BI assim que a análise
+termina. As etapas rodam no DAG de app.etl.dag: só é recalculado o que
+teve alguma entrada alterada. Cada etapa tem sua duração e situação
+registradas no relatório.
+"""
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.etl.dag import Node, Pipeline, StageCache
+from app.etl.extract.sales_extractor import SalesExtractor
+from app.etl.extract.stock_extractor import StockExtractor
+from app.etl.load.powerbi_loader import write_json_file
+from app.etl.transform.analyzers import ANALYZERS, build_analyzers
+from app.models.policy import AnalysisPolicy
+from app.services.export_jobs import export_table
+from app.services.fingerprint import dataset_fingerprint
+from app.services.uploads import dataset_selected_at, latest_dataset_file
+
+logger = logging.getLogger(__name__)
+
+# Tabela do Power BI de cada análise (mesmos nomes do save_to_powerbi das rotas)
+TABLE_NAMES = {
+    'promocao': 'promocao_analise',
+    'estoque': 'estoque_analise',
+    'cashback': 'cashback_analise',
+}
+
+STATE_FILE = "etl_batch_state.json"
+
+
+def _state_path() -> Path:
+    return Path(settings.DATA_PROCESSED_DIR) / STATE_FILE
+
+
+def _read_state() -> dict:
+    try:
+        with open(_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_since(value: Optional[str]):
+    """
+    Interpreta --since: "last" (última execução bem-sucedida) ou data/hora ISO
+
+    Raises:
+        ValueError: Valor que não é "last" nem data ISO
+    """
+    if value is None or value == "last":
+        return value
+    return datetime.fromisoformat(value)
+
+
+def build_pipeline(
+    analyses: List[str],
+    policy: AnalysisPolicy,
+    sales_path: Path,
+    stock_path: Path,
+    load: bool = True
+) -> Pipeline:
+    """
+    Monta o DAG: extract.<dataset> -> features.<análise> -> analyze.<análise> -> load.<análise>
+
+    features é a agregação das vendas (etapa cara, depende só das vendas e das
+    janelas da política); analyze aplica as regras e a classificação sobre o
+    estoque com os limiares daquela análise; load grava a tabela do Power BI.
+    """
+    nodes = [
+        Node("extract.vendas", lambda: SalesExtractor().from_csv(str(sales_path)),
+             params=dataset_fingerprint([sales_path])),
+        Node("extract.estoque", lambda: StockExtractor().from_csv(str(stock_path)),
+             params=dataset_fingerprint([stock_path])),
+    ]
+    for name in analyses:
+        analyzer = ANALYZERS[name](policy)
+        features_params = {"aggregation": analyzer.aggregation_key()}
+        if name == 'cashback':
+            features_params.update(distinct_mode=settings.CASHBACK_DISTINCT_MODE, hll_error=settings.HLL_RELATIVE_ERROR)
+
+        def features(sales_df, name=name):
+            return build_analyzers([name], policy, sales_path, sales_df)[name].aggregate_sales(sales_df)
+
+        def analyze(stock_df, sales_metrics, analyzer=analyzer):
+            return analyzer.score(analyzer.derive_metrics(stock_df, sales_metrics))
+
+        nodes.append(Node(f"features.{name}", features, deps=["extract.vendas"], params=features_params))
+        nodes.append(Node(f"analyze.{name}", analyze, deps=["extract.estoque", f"features.{name}"],
+                          params=policy.analysis_params(name)))
+        if load:
+            nodes.append(Node(f"load.{name}", lambda df, table=TABLE_NAMES[name]: export_table(df, table),
+                              deps=[f"analyze.{name}"], params={
+                                  "table": TABLE_NAMES[name],
+                                  "output_dir": str(settings.DATA_OUTPUT_DIR),
+                                  "formats": settings.POWERBI_EXPORT_FORMATS,
+                                  "mode": settings.POWERBI_EXPORT_MODE,
+                                  "push": settings.POWER_BI_PUSH_ENABLED,
+                              }))
+
+    cache_dir = Path(settings.ETL_CACHE_DIR or Path(settings.DATA_PROCESSED_DIR) / "etl_cache")
+    return Pipeline(nodes, StageCache(cache_dir, keep=settings.ETL_CACHE_KEEP))
+
+
+class BatchRun:
+    """Uma execução do pipeline: etapas, durações e resultado"""
+
+    def __init__(self, analyses: List[str], workers: int = 0, load: bool = True, force: bool = False):
+        unknown = [name for name in analyses if name not in ANALYZERS]
+        if unknown:
+            raise ValueError(f"Análises desconhecidas: {unknown}")
+        self.analyses = analyses
+        self.workers = workers or len(analyses) + 1
+        self.load = load
+        self.force = force
+        self.stages: Dict[str, dict] = {}
+        self.status = "pending"
+        self.fingerprint: Optional[str] = None
+
+    def run(self, since=None) -> "BatchRun":
+        """
+        Executa o pipeline (etapas com entradas inalteradas vêm do cache)
+
+        Args:
+            since: "last" para pular se os dados e configurações não mudaram
+                desde a última execução bem-sucedida; datetime para pular se
+                nenhum arquivo de entrada foi modificado depois dessa data
+
+        Returns:
+            A própria execução (status "completed", "failed" ou "up_to_date")
+        """
+        started = time.perf_counter()
+        sales_path = latest_dataset_file("vendas")
+        stock_path = latest_dataset_file("estoque")
+        if sales_path is None or stock_path is None:
+            missing = "vendas" if sales_path is None else "estoque"
+            self.stages["discover"] = {"status": "failed", "seconds": 0.0, "error": f"Dataset de {missing} não encontrado"}
+            self.status = "failed"
+            return self
+
+        inputs = [sales_path, stock_path]
+        if settings.ANALYSIS_POLICY_FILE:
+            inputs.append(Path(settings.ANALYSIS_POLICY_FILE))
+        self.fingerprint = dataset_fingerprint(inputs, extra=(
+            sorted(self.analyses),
+            settings.CASHBACK_DISTINCT_MODE,
+            settings.HLL_RELATIVE_ERROR,
+            settings.POWERBI_EXPORT_FORMATS,
+            settings.POWERBI_EXPORT_MODE,
+        ))
+        if since == "last" and not self.force and _read_state().get("fingerprint") == self.fingerprint:
+            logger.info("✅ Dados inalterados desde a última execução: nada a fazer")
+            self.status = "up_to_date"
+            return self
+        if isinstance(since, datetime) and not self.force and max(dataset_selected_at(path) for path in inputs) <= since.timestamp():
+            logger.info(f"✅ Nenhum arquivo modificado desde {since.isoformat()}: nada a fazer")
+            self.status = "up_to_date"
+            return self
+
+        try:
+            policy = AnalysisPolicy.from_file(settings.ANALYSIS_POLICY_FILE) if settings.ANALYSIS_POLICY_FILE else AnalysisPolicy()
+        except Exception as e:
+            self.stages["policy"] = {"status": "failed", "seconds": 0.0, "error": str(e)}
+            self.status = "failed"
+            return self
+
+        pipeline = build_pipeline(self.analyses, policy, sales_path, stock_path, self.load)
+        runs = pipeline.run(workers=self.workers, force=self.force)
+        self.stages = {name: run.to_dict() for name, run in runs.items()}
+
+        failed = any(run.status in ("failed", "skipped") for run in runs.values())
+        self.status = "failed" if failed else "completed"
+        self.stages["total"] = {"status": self.status, "seconds": round(time.perf_counter() - started, 3)}
+        if not failed:
+            self._save_state(sales_path, stock_path)
+        return self
+
+    def _save_state(self, sales_path: Path, stock_path: Path):
+        state = {
+            "fingerprint": self.fingerprint,
+            "finished_at": datetime.now().isoformat(),
+            "sales_file": sales_path.name,
+            "stock_file": stock_path.name,
+            "analyses": self.analyses,
+        }
+        write_json_file(_state_path(), state)
+
+    def to_dict(self) -> dict:
+        return {"status": self.status, "fingerprint": self.fingerprint, "stages": self.stages}
@@ -0,0 +1,293 @@
+"""
+Executor de DAG do pipeline ETL com cache por conteúdo
+
+Cada nó declara as dependências e os parâmetros que alteram sua saída. A
+chave de um nó é o hash do nome, dos parâmetros e das chaves das
+dependências (como em uma árvore de Merkle): se nada acima dele mudou, a
+chave é a mesma e a saída é lida do cache em vez de recalculada. Nós cuja
+saída já está em cache e que ninguém precisa recalcular nem chegam a ser
+lidos do disco.
+
+Os nós prontos rodam em paralelo em um pool de threads; valores
+intermediários são liberados assim que os dependentes terminam.
+"""
+import hashlib
+import json
+import logging
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from app.etl.load.powerbi_loader import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class Node:
+    """
+    Etapa do pipeline
+
+    Args:
+        name: Nome único (ex: "extract.vendas")
+        func: Recebe as saídas das dependências, na ordem de deps
+        deps: Nomes dos nós dos quais depende
+        params: Valores que alteram a saída além das dependências (entram na chave)
+        cache: Gravar a saída no cache (DataFrames/objetos em pickle, dict em JSON)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        deps: Sequence[str] = (),
+        params: Any = None,
+        cache: bool = True
+    ):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.params = params
+        self.cache = cache
+
+
+class NodeRun:
+    """Resultado de um nó em uma execução"""
+
+    def __init__(self, key: str, status: str = "pending"):
+        self.key = key
+        self.status = status  # ok, cached, loaded, failed, skipped
+        self.seconds = 0.0
+        self.rows: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        entry = {"status": self.status, "seconds": round(self.seconds, 3), "key": self.key}
+        if self.rows is not None:
+            entry["rows"] = self.rows
+        if self.error:
+            entry["error"] = self.error
+        return entry
+
+
+class StageCache:
+    """Saídas dos nós em disco: <root>/<nó>/<chave>.pkl ou .json"""
+
+    def __init__(self, root: Path, keep: int = 3):
+        self.root = Path(root)
+        self.keep = keep
+
+    def _paths(self, node: str, key: str) -> List[Path]:
+        directory = self.root / node
+        return [directory / f"{key}.pkl", directory / f"{key}.json"]
+
+    def has(self, node: str, key: str) -> bool:
+        return any(path.exists() for path in self._paths(node, key))
+
+    def read(self, node: str, key: str):
+        pickle_path, json_path = self._paths(node, key)
+        if json_path.exists():
+            with open(json_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        with open(pickle_path, "rb") as f:
+            return pickle.load(f)
+
+    def write(self, node: str, key: str, value):
+        pickle_path, json_path = self._paths(node, key)
+        pickle_path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(value, dict):
+            def writer(tmp_path: Path):
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(value, f, ensure_ascii=False, default=str)
+            atomic_write(json_path, writer)
+        else:
+            def writer(tmp_path: Path):
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            atomic_write(pickle_path, writer)
+        self._prune(pickle_path.parent)
+
+    def _prune(self, directory: Path):
+        """Mantém apenas as `keep` saídas mais recentes do nó"""
+        if self.keep <= 0:
+            return
+        entries = sorted(
+            (path for path in directory.iterdir() if path.suffix in (".pkl", ".json")),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True
+        )
+        for path in entries[self.keep:]:
+            path.unlink(missing_ok=True)
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=repr).encode("utf-8")).hexdigest()[:20]
+
+
+class Pipeline:
+    """DAG de nós executado com cache por conteúdo"""
+
+    def __init__(self, nodes: Iterable[Node], cache: StageCache):
+        self.nodes: Dict[str, Node] = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise ValueError(f"Nó duplicado: {node.name}")
+            self.nodes[node.name] = node
+        for node in self.nodes.values():
+            missing = [dep for dep in node.deps if dep not in self.nodes]
+            if missing:
+                raise ValueError(f"Dependências desconhecidas de {node.name}: {missing}")
+        self.cache = cache
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, state = [], {}
+
+        def visit(name: str):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Ciclo no pipeline em {name}")
+            state[name] = "visiting"
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def keys(self) -> Dict[str, str]:
+        """Chave de cada nó: hash do nome, dos parâmetros e das chaves das dependências"""
+        keys: Dict[str, str] = {}
+        for name in self.order:
+            node = self.nodes[name]
+            keys[name] = _digest([name, node.params, [keys[dep] for dep in node.deps]])
+        return keys
+
+    def _plan(self, targets: List[str], keys: Dict[str, str], force: bool = False) -> Dict[str, str]:
+        """
+        Ação de cada nó: "run" (calcular), "load" (ler do cache para um
+        dependente) ou "cached" (alvo já em cache, nada a fazer)
+        """
+        actions: Dict[str, str] = {}
+
+        def cached(name: str) -> bool:
+            return not force and self.nodes[name].cache and self.cache.has(name, keys[name])
+
+        def need_value(name: str):
+            if actions.get(name) in ("run", "load"):
+                return
+            if cached(name):
+                actions[name] = "load"
+                return
+            actions[name] = "run"
+            for dep in self.nodes[name].deps:
+                need_value(dep)
+
+        for name in targets:
+            if name in actions:
+                continue
+            if cached(name):
+                actions[name] = "cached"
+            else:
+                actions[name] = "run"
+                for dep in self.nodes[name].deps:
+                    need_value(dep)
+        return actions
+
+    def run(self, targets: Optional[List[str]] = None, workers: int = 4, force: bool = False) -> Dict[str, NodeRun]:
+        """
+        Executa os nós necessários para os alvos
+
+        Args:
+            targets: Nós desejados (padrão: os que não são dependência de ninguém)
+            workers: Threads para nós independentes
+            force: Recalcular todos os nós, ignorando (e regravando) o cache
+
+        Returns:
+            Dict nome do nó -> NodeRun, para todos os nós envolvidos
+        """
+        if targets is None:
+            used = {dep for node in self.nodes.values() for dep in node.deps}
+            targets = [name for name in self.order if name not in used]
+        keys = self.keys()
+        actions = self._plan(targets, keys, force)
+        runs = {name: NodeRun(keys[name]) for name in self.order if name in actions}
+        for name, action in actions.items():
+            if action == "cached":
+                runs[name].status = "cached"
+
+        tasks = [name for name in self.order if actions.get(name) in ("run", "load")]
+        # Dependentes ainda pendentes de cada nó: o valor é liberado quando chega a zero
+        consumers = {name: 0 for name in tasks}
+        for name in tasks:
+            if actions[name] == "run":
+                for dep in self.nodes[name].deps:
+                    consumers[dep] += 1
+
+        values: Dict[str, Any] = {}
+        pending = set(tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dag") as executor:
+            while pending or running:
+                for name in [name for name in self.order if name in pending]:
+                    deps = self.nodes[name].deps if actions[name] == "run" else ()
+                    if any(runs[dep].status in ("failed", "skipped") for dep in deps):
+                        failed_dep = next(dep for dep in deps if runs[dep].status in ("failed", "skipped"))
+                        runs[name].status = "skipped"
+                        runs[name].error = f"{failed_dep} não concluído"
+                        pending.discard(name)
+                        self._release(name, actions, consumers, values)
+                        continue
+                    if all(dep in values for dep in deps):
+                        pending.discard(name)
+                        args = [values[dep] for dep in deps]
+                        running[executor.submit(self._execute, name, actions[name], keys[name], args, runs[name])] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        values[name] = future.result()
+                    except Exception:
+                        pass
+                    self._release(name, actions, consumers, values)
+                    if consumers[name] == 0:
+                        values.pop(name, None)
+        return runs
+
+    def _release(self, name: str, actions: Dict[str, str], consumers: Dict[str, int], values: Dict[str, Any]):
+        """Um dependente terminou (ou foi pulado): libera as dependências sem outros consumidores"""
+        if actions.get(name) != "run":
+            return
+        for dep in self.nodes[name].deps:
+            consumers[dep] -= 1
+            if consumers[dep] == 0:
+                values.pop(dep, None)
+
+    def _execute(self, name: str, action: str, key: str, args: list, run: NodeRun):
+        node = self.nodes[name]
+        start = time.perf_counter()
+        try:
+            if action == "load":
+                value = self.cache.read(name, key)
+                run.status = "loaded"
+            else:
+                value = node.func(*args)
+                if node.cache:
+                    self.cache.write(name, key, value)
+                run.status = "ok"
+        except Exception as e:
+            run.status = "failed"
+            run.error = str(e)
+            logger.error(f"❌ Etapa {name} falhou: {str(e)}", exc_info=True)
+            raise
+        finally:
+            run.seconds = time.perf_counter() - start
+        if hasattr(value, "__len__") and not isinstance(value, dict):
+            run.rows = len(value)
+        return value
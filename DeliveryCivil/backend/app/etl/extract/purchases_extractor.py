@@ -4,11 +4,15 @@ Extractor de dados de compras
 import pandas as pd
 import logging
 
+from app.services.metrics import stage_timer, count_rows, count_bytes_read
+from app.services.memory import check_file_budget
+
 logger = logging.getLogger(__name__)
 
 class PurchasesExtractor:
     """Extrator de dados de compras de CSV"""
     
+    @stage_timer("extract.compras")
     def from_csv(self, file_path: str) -> pd.DataFrame:
         """
         Extrai dados de compras de arquivo CSV
@@ -17,6 +21,8 @@ class PurchasesExtractor:
         data,produto_id,fornecedor,quantidade,custo_total
         """
         try:
+            check_file_budget(file_path, "compras")
+            
             df = pd.read_csv(
                 file_path,
                 encoding='utf-8',
@@ -48,6 +54,9 @@ class PurchasesExtractor:
             if df['custo_total'].min() <= 0:
                 raise ValueError("Custo total deve ser maior que zero")
             
+            count_rows("extract.compras", len(df))
+            count_bytes_read("compras", file_path)
+            
             logger.info(f"✅ Extraídos {len(df)} registros de compras")
             
             return df
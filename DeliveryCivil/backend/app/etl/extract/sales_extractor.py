@@ -6,11 +6,15 @@ from pathlib import Path
 import logging
 from datetime import datetime
 
+from app.services.metrics import stage_timer, count_rows, count_bytes_read
+from app.services.memory import check_file_budget
+
 logger = logging.getLogger(__name__)
 
 class SalesExtractor:
     """Extrator de dados de vendas de CSV"""
     
+    @stage_timer("extract.vendas")
     def from_csv(self, file_path: str) -> pd.DataFrame:
         """
         Extrai dados de vendas de arquivo CSV
@@ -19,6 +23,8 @@ class SalesExtractor:
         data,produto_id,produto_nome,quantidade,valor_total,cliente_id
         """
         try:
+            check_file_budget(file_path, "vendas")
+            
             df = pd.read_csv(
                 file_path,
                 encoding='utf-8',
@@ -28,7 +34,8 @@ class SalesExtractor:
                     'produto_nome': 'string',
                     'quantidade': 'int64',
                     'valor_total': 'float64',
-                    'cliente_id': 'Int64'  # Nullable
+                    'cliente_id': 'Int64',  # Nullable
+                    'loja_id': 'Int64'  # Opcional (análise por loja)
                 }
             )
             
@@ -51,6 +58,9 @@ class SalesExtractor:
             if df['valor_total'].min() <= 0:
                 raise ValueError("Valor total deve ser maior que zero")
             
+            count_rows("extract.vendas", len(df))
+            count_bytes_read("vendas", file_path)
+            
             logger.info(f"✅ Extraídos {len(df)} registros de vendas")
             
             return df
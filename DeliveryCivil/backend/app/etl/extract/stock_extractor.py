@@ -4,11 +4,15 @@ Extractor de dados de estoque
 import pandas as pd
 import logging
 
+from app.services.metrics import stage_timer, count_rows, count_bytes_read
+from app.services.memory import check_file_budget
+
 logger = logging.getLogger(__name__)
 
 class StockExtractor:
     """Extrator de dados de estoque de CSV"""
     
+    @stage_timer("extract.estoque")
     def from_csv(self, file_path: str) -> pd.DataFrame:
         """
         Extrai dados de estoque de arquivo CSV
@@ -17,6 +21,8 @@ class StockExtractor:
         produto_id,produto_nome,quantidade_atual,quantidade_minima,custo_unitario
         """
         try:
+            check_file_budget(file_path, "estoque")
+            
             df = pd.read_csv(
                 file_path,
                 encoding='utf-8',
@@ -25,7 +31,9 @@ class StockExtractor:
                     'produto_nome': 'string',
                     'quantidade_atual': 'int64',
                     'quantidade_minima': 'int64',
-                    'custo_unitario': 'float64'
+                    'custo_unitario': 'float64',
+                    'loja_id': 'Int64',  # Opcional (análise por loja)
+                    'categoria': 'string'  # Opcional (sobrescritas da política)
                 }
             )
             
@@ -51,6 +59,9 @@ class StockExtractor:
             if df['custo_unitario'].min() <= 0:
                 raise ValueError("Custo unitário deve ser maior que zero")
             
+            count_rows("extract.estoque", len(df))
+            count_bytes_read("estoque", file_path)
+            
             logger.info(f"✅ Extraídos {len(df)} registros de estoque")
             
             return df
@@ -4,63 +4,321 @@ Loader para Power BI
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 import logging
 import json
+import os
+import threading
+import uuid
 
 from app.config import settings
+from app.utils.file_lock import FileLock
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Opcional: só necessário para o formato parquet
+    pa = None
+    pq = None
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_FORMATS = ('csv', 'json', 'parquet')
+EXPORT_MODES = ('full', 'delta')
+
+# Coluna das exportações delta com a operação de cada linha
+OPERATION_COLUMN = '_operacao'
+MANIFEST_NAME = '_manifest.json'
+STATE_NAME = '_state.csv.gz'
+LOCK_NAME = '_export.lock'
+
+# Uma exportação delta por vez para cada tabela (manifesto e estado compartilhados):
+# lock de thread no processo e FileLock (LOCK_NAME) entre os workers
+_table_locks: Dict[str, threading.Lock] = {}
+_table_locks_guard = threading.Lock()
+
+
+def _table_lock(table_name: str) -> threading.Lock:
+    with _table_locks_guard:
+        return _table_locks.setdefault(table_name, threading.Lock())
+
+
+def atomic_write(path: Path, writer: Callable[[Path], None]):
+    """
+    Escreve em um arquivo temporário no mesmo diretório e renomeia no final
+
+    O rename é atômico no mesmo sistema de arquivos: leitores (ex: Power BI)
+    veem o arquivo anterior ou o novo completo, nunca um arquivo parcial.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_json_file(path: Path, content: dict):
+    def writer(tmp_path: Path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=2, ensure_ascii=False)
+
+    atomic_write(path, writer)
+
+
+def typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas object com tipos mistos (ex: alerta None preenchido com 0) viram texto"""
+    object_columns = [col for col in df.columns if df[col].dtype == object]
+    if not object_columns:
+        return df
+    return df.astype({col: "string" for col in object_columns})
+
+
 class PowerBILoader:
     """Loader para salvar dados processados para Power BI"""
-    
+
+    def __init__(self, formats: Optional[List[str]] = None, mode: Optional[str] = None):
+        """
+        Args:
+            formats: Formatos de saída (csv, json, parquet); padrão: POWERBI_EXPORT_FORMATS
+            mode: "full" (tabela completa a cada exportação) ou "delta"; padrão: POWERBI_EXPORT_MODE
+        """
+        self.formats = list(formats or settings.POWERBI_EXPORT_FORMATS)
+        self.mode = mode or settings.POWERBI_EXPORT_MODE
+        if self.mode not in EXPORT_MODES:
+            raise ValueError(f"Modo de exportação desconhecido: {self.mode}. Opções: {EXPORT_MODES}")
+        unknown = [fmt for fmt in self.formats if fmt not in SUPPORTED_FORMATS]
+        if unknown:
+            raise ValueError(f"Formatos de exportação desconhecidos: {unknown}. Opções: {SUPPORTED_FORMATS}")
+        if 'parquet' in self.formats and pq is None:
+            raise ImportError("Formato parquet requer o pacote 'pyarrow' (pip install pyarrow)")
+
+    def _write_csv(self, df: pd.DataFrame, path: Path):
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+
+    def _write_json(self, df: pd.DataFrame, path: Path):
+        df.to_json(path, orient='records', date_format='iso', force_ascii=False)
+
+    def _write_parquet(self, df: pd.DataFrame, path: Path):
+        table = pa.Table.from_pandas(typed_frame(df), preserve_index=False)
+        pq.write_table(table, path, compression=settings.POWERBI_PARQUET_COMPRESSION)
+
+    def _write_formats(self, df: pd.DataFrame, base_path: Path) -> Dict[str, str]:
+        """Escreve o DataFrame em todos os formatos, em paralelo e de forma atômica"""
+        writers = {
+            'csv': self._write_csv,
+            'json': self._write_json,
+            'parquet': self._write_parquet,
+        }
+        paths = {fmt: base_path.with_name(f"{base_path.name}.{fmt}") for fmt in self.formats}
+
+        with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+            futures = {
+                fmt: executor.submit(atomic_write, path, lambda tmp, fmt=fmt: writers[fmt](df, tmp))
+                for fmt, path in paths.items()
+            }
+            for future in futures.values():
+                future.result()
+
+        return {fmt: str(path) for fmt, path in paths.items()}
+
     def save_for_powerbi(self, df: pd.DataFrame, table_name: str) -> dict:
         """
         Salva DataFrame em formatos compatíveis com Power BI
-        
+
+        Cada formato é escrito em paralelo e de forma atômica; os metadados
+        (ou o manifesto, no modo delta) são gravados por último, apenas quando
+        todos os arquivos estão completos.
+
         Args:
             df: DataFrame para salvar
             table_name: Nome da tabela
-            
+
         Returns:
             Dict com caminhos dos arquivos salvos
         """
         try:
             output_dir = Path(settings.DATA_OUTPUT_DIR)
             output_dir.mkdir(parents=True, exist_ok=True)
-            
+
+            if self.mode == 'delta':
+                return self._save_delta(df, table_name, output_dir / table_name)
+
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            saved_files = {}
-            
-            # Salvar como CSV (compatível com Power BI)
-            csv_path = output_dir / f"{table_name}_{timestamp}.csv"
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-            saved_files['csv'] = str(csv_path)
-            
-            # Salvar como JSON (alternativa)
-            json_path = output_dir / f"{table_name}_{timestamp}.json"
-            df.to_json(json_path, orient='records', date_format='iso', indent=2)
-            saved_files['json'] = str(json_path)
-            
+
+            saved_files = self._write_formats(df, output_dir / f"{table_name}_{timestamp}")
+
             # Salvar metadados
             metadata = {
                 'table_name': table_name,
                 'timestamp': timestamp,
                 'rows': len(df),
                 'columns': list(df.columns),
+                'dtypes': {str(col): str(dtype) for col, dtype in df.dtypes.items()},
                 'file_paths': saved_files
             }
-            
-            metadata_path = output_dir / f"{table_name}_{timestamp}_metadata.json"
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"✅ Dados salvos para Power BI: {table_name} ({len(df)} registros)")
-            
+
+            write_json_file(output_dir / f"{table_name}_{timestamp}_metadata.json", metadata)
+
+            logger.info(
+                f"✅ Dados salvos para Power BI: {table_name} ({len(df)} registros, {', '.join(self.formats)})"
+            )
+
+            self._apply_full_retention(output_dir, table_name)
+
             return saved_files
-            
+
         except Exception as e:
             logger.error(f"Erro ao salvar dados para Power BI: {str(e)}")
             raise
 
+    def _apply_full_retention(self, output_dir: Path, table_name: str):
+        """Mantém apenas as POWERBI_FULL_RETENTION exportações completas mais recentes da tabela"""
+        keep = settings.POWERBI_FULL_RETENTION
+        if keep <= 0:
+            return
+
+        exports = []
+        for metadata_path in output_dir.glob(f"{table_name}_*_metadata.json"):
+            try:
+                with open(metadata_path, 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if metadata.get('table_name') == table_name:
+                exports.append((metadata.get('timestamp', ''), metadata_path, metadata))
+
+        exports.sort(key=lambda item: item[0])
+        for _, metadata_path, metadata in exports[:-keep]:
+            for path in metadata.get('file_paths', {}).values():
+                Path(path).unlink(missing_ok=True)
+            metadata_path.unlink(missing_ok=True)
+            logger.info(f"🗑️ Exportação antiga removida: {metadata_path.name}")
+
+    @staticmethod
+    def _row_state(df: pd.DataFrame, key_columns: List[str]) -> pd.DataFrame:
+        """Chave e hash do conteúdo de cada linha (para detectar alterações)"""
+        state = df[key_columns].astype('Int64').reset_index(drop=True)
+        state['_hash'] = pd.util.hash_pandas_object(df, index=False).to_numpy().view('int64')
+        return state
+
+    @staticmethod
+    def _read_state(table_dir: Path, key_columns: List[str]) -> Optional[pd.DataFrame]:
+        state_path = table_dir / STATE_NAME
+        if not state_path.exists():
+            return None
+        dtypes = {col: 'Int64' for col in key_columns}
+        dtypes['_hash'] = 'int64'
+        return pd.read_csv(state_path, dtype=dtypes, compression='gzip')
+
+    @staticmethod
+    def _read_manifest(table_dir: Path) -> Optional[dict]:
+        manifest_path = table_dir / MANIFEST_NAME
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _needs_snapshot(self, manifest: Optional[dict], previous: Optional[pd.DataFrame],
+                        df: pd.DataFrame, key_columns: List[str]) -> bool:
+        """Novo snapshot na primeira exportação, em mudança de schema ou ao compactar"""
+        if manifest is None or previous is None:
+            return True
+        if manifest.get('key_columns') != key_columns or manifest.get('columns') != list(map(str, df.columns)):
+            return True
+        deltas = manifest.get('deltas', [])
+        if len(deltas) >= settings.POWERBI_DELTA_MAX_CHAIN:
+            return True
+        delta_rows = sum(delta['upserts'] + delta['deletes'] for delta in deltas)
+        return delta_rows >= settings.POWERBI_DELTA_COMPACT_RATIO * max(len(df), 1)
+
+    def _save_delta(self, df: pd.DataFrame, table_name: str, table_dir: Path) -> dict:
+        """
+        Exportação incremental: snapshot + deltas com as linhas alteradas
+
+        Linhas são identificadas por produto_id (e loja_id, se presente) e
+        comparadas pelo hash do conteúdo. Cada delta traz as linhas novas ou
+        alteradas (_operacao = "upsert") e as chaves removidas ("delete").
+        O estado atual = snapshot do manifesto + deltas aplicados em ordem.
+        Quando a cadeia de deltas fica longa, um novo snapshot a substitui
+        (compactação) e gerações antigas saem pela retenção.
+        """
+        table_dir.mkdir(parents=True, exist_ok=True)
+        key_columns = [col for col in ('loja_id', 'produto_id') if col in df.columns]
+        if 'produto_id' not in key_columns:
+            raise ValueError("Exportação delta requer a coluna 'produto_id'")
+
+        with _table_lock(table_name), FileLock(table_dir / LOCK_NAME):
+            manifest = self._read_manifest(table_dir)
+            previous = self._read_state(table_dir, key_columns) if manifest else None
+            current = self._row_state(df, key_columns)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+            if self._needs_snapshot(manifest, previous, df, key_columns):
+                saved_files = self._write_formats(df, table_dir / f"snapshot_{timestamp}")
+                manifest = {
+                    'table_name': table_name,
+                    'key_columns': key_columns,
+                    'columns': list(map(str, df.columns)),
+                    'operation_column': OPERATION_COLUMN,
+                    'snapshot': {'timestamp': timestamp, 'rows': len(df), 'file_paths': saved_files},
+                    'deltas': [],
+                }
+                logger.info(f"📸 Snapshot Power BI: {table_name} ({len(df)} registros)")
+            else:
+                merged = current.reset_index().merge(
+                    previous, on=key_columns, how='outer', suffixes=('', '_anterior'), indicator=True
+                )
+                changed = (merged['_merge'] == 'left_only') | (
+                    (merged['_merge'] == 'both') & (merged['_hash'] != merged['_hash_anterior'])
+                )
+                removed = merged.loc[merged['_merge'] == 'right_only', key_columns]
+
+                if not changed.any() and removed.empty:
+                    logger.info(f"✅ Power BI sem alterações: {table_name}")
+                    return {}
+
+                upserts = df.iloc[merged.loc[changed, 'index'].astype(int).to_numpy()]
+                delta_df = pd.concat(
+                    [upserts.assign(**{OPERATION_COLUMN: 'upsert'}), removed.assign(**{OPERATION_COLUMN: 'delete'})],
+                    ignore_index=True
+                )
+                saved_files = self._write_formats(delta_df, table_dir / f"delta_{timestamp}")
+                manifest['deltas'].append({
+                    'timestamp': timestamp,
+                    'upserts': int(changed.sum()),
+                    'deletes': int(len(removed)),
+                    'file_paths': saved_files,
+                })
+                logger.info(
+                    f"✅ Delta Power BI: {table_name} ({int(changed.sum())} alterados, {len(removed)} removidos)"
+                )
+
+            atomic_write(table_dir / STATE_NAME, lambda tmp: current.to_csv(tmp, index=False, compression='gzip'))
+            manifest['rows'] = len(df)
+            manifest['updated_at'] = timestamp
+            write_json_file(table_dir / MANIFEST_NAME, manifest)
+
+            self._apply_delta_retention(table_dir, manifest)
+
+        saved_files['manifest'] = str(table_dir / MANIFEST_NAME)
+        return saved_files
+
+    @staticmethod
+    def _apply_delta_retention(table_dir: Path, manifest: dict):
+        """Remove snapshots e deltas de gerações além de POWERBI_SNAPSHOT_RETENTION"""
+        keep = max(settings.POWERBI_SNAPSHOT_RETENTION, 1)
+        snapshots = sorted({path.stem.split('.')[0][len('snapshot_'):] for path in table_dir.glob('snapshot_*')})
+        if len(snapshots) <= keep:
+            return
+
+        # Tudo anterior ao snapshot mais antigo mantido pertence a gerações descartadas
+        oldest_kept = snapshots[-keep]
+        for path in list(table_dir.glob('snapshot_*')) + list(table_dir.glob('delta_*')):
+            file_timestamp = path.name.split('_', 1)[1].split('.')[0]
+            if file_timestamp < oldest_kept:
+                path.unlink(missing_ok=True)
+        logger.info(f"🗑️ Retenção Power BI: {len(snapshots) - keep} gerações antigas removidas de {table_dir.name}")
@@ -0,0 +1,262 @@
+"""
+Exportação em esquema estrela (fatos e dimensões) para Power BI
+"""
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+from app.config import settings
+from app.etl.load.powerbi_loader import atomic_write, typed_frame, write_json_file
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Opcional: o esquema estrela é gravado em Parquet
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+MONTH_NAMES = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+]
+WEEKDAY_NAMES = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+# Atributos do produto que ficam apenas na dimensão (não se repetem nos fatos)
+PRODUCT_ATTRIBUTES = ['produto_nome', 'categoria', 'custo_unitario', 'quantidade_minima']
+
+# Relacionamentos do modelo (fato.coluna -> dimensão.coluna), gravados nos metadados
+RELATIONSHIPS = {
+    'product_key': 'dim_product.product_key',
+    'date_key': 'dim_date.date_key',
+    'store_key': 'dim_store.store_key',
+}
+
+
+def _date_key(dates: pd.Series) -> pd.Series:
+    """Chave inteira AAAAMMDD"""
+    dates = pd.to_datetime(dates)
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype('int32')
+
+
+def _assign_keys(values: pd.Series, previous: Optional[pd.DataFrame], natural: str, key: str) -> pd.DataFrame:
+    """
+    Chaves substitutas inteiras estáveis entre exportações
+
+    Valores já conhecidos mantêm a chave da dimensão anterior; novos valores
+    recebem chaves a partir do maior valor existente.
+    """
+    values = pd.Series(pd.unique(values.dropna()), name=natural).sort_values(ignore_index=True)
+    mapping = pd.DataFrame({natural: values})
+
+    known = pd.Series(dtype='int32')
+    if previous is not None and {natural, key} <= set(previous.columns):
+        known = previous.set_index(natural)[key]
+    mapping[key] = mapping[natural].map(known)
+
+    missing = mapping[key].isna()
+    next_key = int(known.max()) + 1 if len(known) else 1
+    mapping.loc[missing, key] = np.arange(next_key, next_key + missing.sum())
+    mapping[key] = mapping[key].astype('int32')
+    return mapping
+
+
+class StarSchemaExporter:
+    """
+    Gera dim_product, dim_date, dim_store (multi-loja), fact_sales_daily,
+    fact_stock e um fato por análise, em Parquet
+
+    Os fatos guardam apenas chaves inteiras e medidas; nomes e atributos do
+    produto ficam na dimensão. As vendas são pré-agregadas por dia, produto
+    (e loja), e a dimensão de datas cobre o calendário completo do período.
+    """
+
+    def __init__(self, output_dir: Optional[Path] = None):
+        if pq is None:
+            raise ImportError("Esquema estrela requer o pacote 'pyarrow' (pip install pyarrow)")
+        self.output_dir = Path(output_dir or Path(settings.DATA_OUTPUT_DIR) / "star_schema")
+
+    def _read_previous(self, table_name: str) -> Optional[pd.DataFrame]:
+        path = self.output_dir / f"{table_name}.parquet"
+        if not path.exists():
+            return None
+        return pd.read_parquet(path)
+
+    def build_dim_product(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame) -> pd.DataFrame:
+        """Dimensão de produtos (estoque + produtos que só aparecem nas vendas)"""
+        ids = pd.concat([stock_df['produto_id'], sales_df['produto_id']], ignore_index=True)
+        dim = _assign_keys(ids, self._read_previous('dim_product'), 'produto_id', 'product_key')
+
+        attributes = [col for col in PRODUCT_ATTRIBUTES if col in stock_df.columns]
+        stock_attributes = stock_df.drop_duplicates('produto_id').set_index('produto_id')[attributes]
+        dim = dim.join(stock_attributes, on='produto_id')
+
+        # Produtos sem estoque cadastrado usam o nome mais recente das vendas
+        sales_names = sales_df.sort_values('data').drop_duplicates('produto_id', keep='last').set_index('produto_id')['produto_nome']
+        if 'produto_nome' in dim.columns:
+            dim['produto_nome'] = dim['produto_nome'].fillna(dim['produto_id'].map(sales_names))
+        else:
+            dim['produto_nome'] = dim['produto_id'].map(sales_names)
+
+        return dim[['product_key', 'produto_id'] + [col for col in dim.columns if col not in ('product_key', 'produto_id')]]
+
+    def build_dim_date(self, sales_df: pd.DataFrame, data_referencia: pd.Timestamp) -> pd.DataFrame:
+        """Calendário completo do período das vendas (até a data de referência)"""
+        dates = pd.to_datetime(sales_df['data']).dt.normalize()
+        start = dates.min() if len(dates) else data_referencia.normalize()
+        end = max(dates.max(), data_referencia.normalize()) if len(dates) else data_referencia.normalize()
+        calendar = pd.date_range(start, end, freq='D')
+
+        dim = pd.DataFrame({'data': calendar})
+        dim.insert(0, 'date_key', _date_key(dim['data']))
+        dim['ano'] = calendar.year.astype('int16')
+        dim['trimestre'] = calendar.quarter.astype('int8')
+        dim['mes'] = calendar.month.astype('int8')
+        dim['nome_mes'] = pd.Categorical.from_codes(calendar.month - 1, MONTH_NAMES)
+        dim['dia'] = calendar.day.astype('int8')
+        dim['dia_semana'] = pd.Categorical.from_codes(calendar.weekday, WEEKDAY_NAMES)
+        dim['semana_ano'] = calendar.isocalendar().week.to_numpy().astype('int8')
+        dim['fim_de_semana'] = calendar.weekday >= 5
+        dim['ano_mes'] = calendar.strftime('%Y-%m')
+        return dim
+
+    def build_dim_store(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        frames = [df['loja_id'] for df in (sales_df, stock_df) if 'loja_id' in df.columns]
+        if not frames:
+            return None
+        return _assign_keys(pd.concat(frames, ignore_index=True), self._read_previous('dim_store'), 'loja_id', 'store_key')
+
+    def build_fact_sales_daily(self, sales_df: pd.DataFrame, product_keys: pd.Series,
+                               store_keys: Optional[pd.Series]) -> pd.DataFrame:
+        """Vendas agregadas por dia, produto (e loja)"""
+        sales = pd.DataFrame({
+            'date_key': _date_key(sales_df['data']),
+            'product_key': sales_df['produto_id'].map(product_keys).astype('int32'),
+            'quantidade': sales_df['quantidade'],
+            'valor_total': sales_df['valor_total'],
+        })
+        group_keys = ['date_key', 'product_key']
+        if store_keys is not None and 'loja_id' in sales_df.columns:
+            sales['store_key'] = sales_df['loja_id'].map(store_keys).astype('Int32')
+            group_keys.append('store_key')
+        if 'cliente_id' in sales_df.columns:
+            sales['cliente_id'] = sales_df['cliente_id']
+
+        aggregations = {
+            'quantidade': ('quantidade', 'sum'),
+            'valor_total': ('valor_total', 'sum'),
+            'num_vendas': ('quantidade', 'size'),
+        }
+        if 'cliente_id' in sales.columns:
+            aggregations['clientes_unicos'] = ('cliente_id', 'nunique')
+
+        fact = sales.groupby(group_keys, sort=True, observed=True, dropna=False).agg(**aggregations).reset_index()
+        fact['num_vendas'] = fact['num_vendas'].astype('int32')
+        if 'clientes_unicos' in fact.columns:
+            fact['clientes_unicos'] = fact['clientes_unicos'].astype('int32')
+        return fact
+
+    def build_fact_stock(self, stock_df: pd.DataFrame, product_keys: pd.Series,
+                         store_keys: Optional[pd.Series], data_referencia: pd.Timestamp) -> pd.DataFrame:
+        """Posição do estoque na data de referência"""
+        fact = pd.DataFrame({
+            'date_key': np.int32(_date_key(pd.Series([data_referencia])).iloc[0]),
+            'product_key': stock_df['produto_id'].map(product_keys).astype('int32'),
+            'quantidade_atual': stock_df['quantidade_atual'],
+            'valor_estoque': stock_df['quantidade_atual'] * stock_df['custo_unitario'],
+        })
+        if store_keys is not None and 'loja_id' in stock_df.columns:
+            fact.insert(2, 'store_key', stock_df['loja_id'].map(store_keys).astype('Int32'))
+        return fact.reset_index(drop=True)
+
+    def build_fact_analysis(self, result_df: pd.DataFrame, product_keys: pd.Series,
+                            store_keys: Optional[pd.Series]) -> pd.DataFrame:
+        """Resultado de uma análise com chaves no lugar dos atributos do produto"""
+        fact = result_df.drop(columns=[col for col in PRODUCT_ATTRIBUTES if col in result_df.columns])
+        fact.insert(0, 'product_key', fact['produto_id'].map(product_keys).astype('int32'))
+        if store_keys is not None and 'loja_id' in fact.columns:
+            fact.insert(1, 'store_key', fact['loja_id'].map(store_keys).astype('Int32'))
+            fact = fact.drop(columns=['loja_id'])
+        return fact.drop(columns=['produto_id']).reset_index(drop=True)
+
+    def build(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame,
+              analyses: Optional[Dict[str, pd.DataFrame]] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Monta todas as tabelas do esquema estrela
+
+        Args:
+            sales_df: Vendas
+            stock_df: Estoque
+            analyses: Resultados das análises (nome -> DataFrame), opcional
+
+        Returns:
+            Dict nome da tabela -> DataFrame
+        """
+        data_referencia = pd.to_datetime(sales_df['data']).max() if len(sales_df) else pd.Timestamp(datetime.now())
+
+        dim_product = self.build_dim_product(sales_df, stock_df)
+        dim_store = self.build_dim_store(sales_df, stock_df)
+        product_keys = dim_product.set_index('produto_id')['product_key']
+        store_keys = dim_store.set_index('loja_id')['store_key'] if dim_store is not None else None
+
+        tables = {
+            'dim_product': dim_product,
+            'dim_date': self.build_dim_date(sales_df, data_referencia),
+            'fact_sales_daily': self.build_fact_sales_daily(sales_df, product_keys, store_keys),
+            'fact_stock': self.build_fact_stock(stock_df, product_keys, store_keys, data_referencia),
+        }
+        if dim_store is not None:
+            tables['dim_store'] = dim_store
+        for name, result_df in (analyses or {}).items():
+            tables[f"fact_{name}"] = self.build_fact_analysis(result_df, product_keys, store_keys)
+        return tables
+
+    def export(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame,
+               analyses: Optional[Dict[str, pd.DataFrame]] = None) -> Dict[str, str]:
+        """
+        Monta e grava o esquema estrela em Parquet (um arquivo por tabela)
+
+        Os arquivos têm nomes fixos (o modelo do Power BI aponta sempre para
+        os mesmos caminhos) e são substituídos de forma atômica; os metadados
+        com os relacionamentos são gravados por último.
+
+        Returns:
+            Dict nome da tabela -> caminho do arquivo
+        """
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            tables = self.build(sales_df, stock_df, analyses)
+
+            saved_files = {}
+            for name, table_df in tables.items():
+                path = self.output_dir / f"{name}.parquet"
+                table = pa.Table.from_pandas(typed_frame(table_df), preserve_index=False)
+                atomic_write(path, lambda tmp, table=table: pq.write_table(
+                    table, tmp, compression=settings.POWERBI_PARQUET_COMPRESSION
+                ))
+                saved_files[name] = str(path)
+
+            metadata = {
+                'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+                'tables': {name: {'rows': len(df), 'columns': list(map(str, df.columns))} for name, df in tables.items()},
+                'relationships': {
+                    name: {col: target for col, target in RELATIONSHIPS.items() if col in df.columns}
+                    for name, df in tables.items() if name.startswith('fact_')
+                },
+                'file_paths': saved_files,
+            }
+            write_json_file(self.output_dir / "_metadata.json", metadata)
+
+            logger.info(
+                f"✅ Esquema estrela exportado: {len(tables)} tabelas "
+                f"({len(tables['fact_sales_daily'])} linhas em fact_sales_daily)"
+            )
+            return saved_files
+
+        except Exception as e:
+            logger.error(f"Erro ao exportar esquema estrela: {str(e)}")
+            raise
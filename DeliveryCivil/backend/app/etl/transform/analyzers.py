@@ -0,0 +1,48 @@
+"""
+Registro dos analisadores disponíveis, por nome de análise
+"""
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from app.config import settings
+from app.etl.transform.hll import ProductSketches, precision_for_error
+from app.models.policy import AnalysisPolicy
+from app.etl.transform.promotion_analyzer import PromotionAnalyzer
+from app.etl.transform.stock_analyzer import StockAnalyzer
+from app.etl.transform.cashback_analyzer import CashbackAnalyzer
+
+ANALYZERS = {
+    'promocao': PromotionAnalyzer,
+    'estoque': StockAnalyzer,
+    'cashback': CashbackAnalyzer,
+}
+
+
+def build_analyzers(analyses: List[str], policy: AnalysisPolicy, sales_path: Path, sales_df: pd.DataFrame) -> Dict:
+    """
+    Instancia os analisadores pedidos com a política informada
+
+    Com CASHBACK_DISTINCT_MODE=hll, o cashback recebe os sketches de clientes
+    persistidos junto às agregações do arquivo de vendas.
+
+    Args:
+        analyses: Nomes das análises ('promocao', 'estoque', 'cashback')
+        policy: Política de análise (limiares)
+        sales_path: Arquivo de vendas de origem (chave dos sketches)
+        sales_df: Vendas já extraídas
+
+    Returns:
+        Dict nome da análise -> analisador
+    """
+    analyzers = {name: ANALYZERS[name](policy) for name in analyses}
+    if 'cashback' in analyzers and settings.CASHBACK_DISTINCT_MODE == 'hll':
+        sketches = ProductSketches.load_or_build(
+            sales_path,
+            sales_df,
+            precision_for_error(settings.HLL_RELATIVE_ERROR),
+            output_dir=Path(settings.DATA_PROCESSED_DIR)
+        )
+        analyzers['cashback'] = CashbackAnalyzer(policy, distinct_mode='hll', sketches=sketches)
+    return analyzers
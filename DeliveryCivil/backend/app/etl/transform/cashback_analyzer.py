@@ -2,14 +2,40 @@
 Analisador de produtos para cashback
 """
 import pandas as pd
+import numpy as np
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.etl.transform.hll import ProductSketches, precision_for_error
+from app.models.policy import AnalysisPolicy
+from app.services.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
 class CashbackAnalyzer:
     """Analisa produtos para identificar oportunidades de cashback"""
     
+    def __init__(
+        self,
+        policy: Optional[AnalysisPolicy] = None,
+        distinct_mode: Optional[str] = None,
+        sketches: Optional[ProductSketches] = None
+    ):
+        """
+        Args:
+            policy: Limiares de negócio
+            distinct_mode: "exact" (nunique) ou "hll" (HyperLogLog); padrão CASHBACK_DISTINCT_MODE
+            sketches: Sketches de clientes já calculados para as vendas (modo "hll")
+        """
+        self.policy = policy or AnalysisPolicy()
+        self.distinct_mode = distinct_mode or settings.CASHBACK_DISTINCT_MODE
+        self.sketches = sketches
+    
+    def aggregation_key(self) -> tuple:
+        """Parâmetros da política que alteram aggregate_sales() (nenhum)"""
+        return ()
+    
     def analyze(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame) -> pd.DataFrame:
         """
         Analisa produtos e identifica os melhores candidatos para cashback
@@ -20,127 +46,202 @@ class CashbackAnalyzer:
         - Produtos estratégicos
         """
         try:
-            # Calcular métricas de vendas por produto
-            sales_metrics = sales_df.groupby('produto_id').agg({
-                'quantidade': ['sum', 'count'],
-                'valor_total': 'sum',
-                'valor_unitario': 'mean',
-                'cliente_id': 'nunique'
-            }).reset_index()
-            
-            sales_metrics.columns = [
-                'produto_id',
-                'total_vendido',
-                'frequencia_vendas',
-                'receita_total',
-                'preco_medio',
-                'clientes_unicos'
-            ]
-            
-            # Calcular margem de lucro
-            analysis = stock_df.merge(
-                sales_metrics,
-                on='produto_id',
-                how='left'
-            )
-            
-            analysis['margem_lucro'] = (
-                (analysis['preco_medio'] - analysis['custo_unitario']) / 
-                analysis['custo_unitario'] * 100
-            )
-            
-            # Calcular ticket médio do produto
-            analysis['ticket_medio'] = (
-                analysis['receita_total'] / 
-                (analysis['frequencia_vendas'] + 0.001)
-            )
-            
-            # Calcular ROI potencial do cashback
-            # Assumindo cashback de 5% e aumento de 20% nas vendas
-            cashback_rate = 0.05
-            sales_increase = 0.20
-            analysis['roi_cashback'] = (
-                (analysis['margem_lucro'] * (1 + sales_increase)) - 
-                (cashback_rate * 100)
-            )
-            
-            # Preencher valores NaN de produtos sem vendas
-            analysis['total_vendido'] = analysis['total_vendido'].fillna(0)
-            analysis['frequencia_vendas'] = analysis['frequencia_vendas'].fillna(0)
-            analysis['receita_total'] = analysis['receita_total'].fillna(0)
-            analysis['preco_medio'] = analysis['preco_medio'].fillna(analysis['custo_unitario'] * 1.5)
-            analysis['clientes_unicos'] = analysis['clientes_unicos'].fillna(0)
-            analysis['margem_lucro'] = analysis['margem_lucro'].fillna(0)
-            analysis['roi_cashback'] = analysis['roi_cashback'].fillna(0)
-            
-            # Normalizar métricas para score com proteção contra divisão por zero
-            max_margem = analysis['margem_lucro'].max()
-            max_freq = analysis['frequencia_vendas'].max()
-            max_clientes = analysis['clientes_unicos'].max()
-            max_roi = analysis['roi_cashback'].max()
-            
-            if max_margem > 0:
-                analysis['margem_normalizada'] = analysis['margem_lucro'] / max_margem
-            else:
-                analysis['margem_normalizada'] = 0
-            
-            if max_freq > 0:
-                analysis['frequencia_normalizada'] = analysis['frequencia_vendas'] / max_freq
-            else:
-                analysis['frequencia_normalizada'] = 0
-            
-            if max_clientes > 0:
-                analysis['clientes_normalizado'] = analysis['clientes_unicos'] / max_clientes
-            else:
-                analysis['clientes_normalizado'] = 0
-            
-            if max_roi > 0:
-                analysis['roi_normalizado'] = analysis['roi_cashback'] / max_roi
-            else:
-                analysis['roi_normalizado'] = 0
-            
-            # Calcular score de cashback
-            # Score = (margem * 0.4) + (frequência * 0.3) + (clientes * 0.2) + (ROI * 0.1)
-            analysis['score_cashback'] = (
-                (analysis['margem_normalizada'] * 0.4) +
-                (analysis['frequencia_normalizada'] * 0.3) +
-                (analysis['clientes_normalizado'] * 0.2) +
-                (analysis['roi_normalizado'] * 0.1)
-            )
-            
-            # Adicionar recomendações
-            analysis['recomendacao_cashback'] = analysis['score_cashback'].apply(
-                lambda x: 'Alta' if x > 0.7 else 'Média' if x > 0.4 else 'Baixa'
-            )
-            
-            # Sugerir percentual de cashback baseado no score
-            analysis['cashback_sugerido'] = analysis['score_cashback'].apply(
-                lambda x: 10 if x > 0.7 else 5 if x > 0.4 else 2
-            )
-            
-            # Ordenar por score
-            analysis = analysis.sort_values('score_cashback', ascending=False)
-            
-            # Selecionar colunas relevantes
-            result = analysis[[
-                'produto_id',
-                'produto_nome',
-                'margem_lucro',
-                'frequencia_vendas',
-                'clientes_unicos',
-                'ticket_medio',
-                'preco_medio',
-                'roi_cashback',
-                'score_cashback',
-                'recomendacao_cashback',
-                'cashback_sugerido'
-            ]]
+            analysis = self.build_metrics(sales_df, stock_df)
+            result = self.score(analysis)
             
             logger.info(f"✅ Análise de cashback concluída: {len(result)} produtos analisados")
             
-            return result.fillna(0)
+            return result
             
         except Exception as e:
             logger.error(f"Erro na análise de cashback: {str(e)}")
             raise
+    
+    def build_metrics(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calcula margem, frequência e ROI por produto
+        
+        Pode ser executado por partição (loja / faixa de produto_id) e os
+        resultados concatenados antes de chamar score().
+        """
+        sales_metrics = self.aggregate_sales(sales_df)
+        return self.derive_metrics(stock_df, sales_metrics)
+    
+    @stage_timer("aggregate.cashback")
+    def aggregate_sales(self, sales_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Agrega as vendas por produto (volume, receita, preço e clientes únicos)
+        
+        É a etapa cara da análise; backends alternativos (ex: DuckDB) só
+        precisam produzir este mesmo DataFrame.
+        """
+        if self.distinct_mode == 'hll':
+            return self._aggregate_sales_approx(sales_df)
+        
+        # Calcular métricas de vendas por produto
+        sales_metrics = sales_df.groupby('produto_id').agg({
+            'quantidade': ['sum', 'count'],
+            'valor_total': 'sum',
+            'valor_unitario': 'mean',
+            'cliente_id': 'nunique'
+        }).reset_index()
+        
+        sales_metrics.columns = [
+            'produto_id',
+            'total_vendido',
+            'frequencia_vendas',
+            'receita_total',
+            'preco_medio',
+            'clientes_unicos'
+        ]
+        
+        return sales_metrics
+    
+    def _aggregate_sales_approx(self, sales_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Mesma agregação de aggregate_sales(), com clientes_unicos estimado por
+        HyperLogLog (sem a tabela hash de pares produto x cliente do nunique)
+        """
+        sales_metrics = sales_df.groupby('produto_id').agg({
+            'quantidade': ['sum', 'count'],
+            'valor_total': 'sum',
+            'valor_unitario': 'mean'
+        }).reset_index()
+        
+        sales_metrics.columns = [
+            'produto_id',
+            'total_vendido',
+            'frequencia_vendas',
+            'receita_total',
+            'preco_medio'
+        ]
+        
+        sketches = self.sketches
+        if sketches is None:
+            sketches = ProductSketches.from_sales(sales_df, precision_for_error(settings.HLL_RELATIVE_ERROR))
+        
+        sales_metrics['clientes_unicos'] = sales_metrics['produto_id'].map(sketches.estimate()).fillna(0)
+        
+        return sales_metrics
+    
+    @stage_timer("derive.cashback")
+    def derive_metrics(self, stock_df: pd.DataFrame, sales_metrics: pd.DataFrame) -> pd.DataFrame:
+        """
+        Junta as vendas agregadas ao estoque e calcula margem, ticket e ROI
+        
+        Args:
+            stock_df: Estoque
+            sales_metrics: Saída de aggregate_sales()
+        """
+        # Calcular margem de lucro
+        analysis = stock_df.merge(
+            sales_metrics,
+            on='produto_id',
+            how='left'
+        )
+        
+        analysis['margem_lucro'] = (
+            (analysis['preco_medio'] - analysis['custo_unitario']) / 
+            analysis['custo_unitario'] * 100
+        )
+        
+        # Calcular ticket médio do produto
+        analysis['ticket_medio'] = (
+            analysis['receita_total'] / 
+            (analysis['frequencia_vendas'] + 0.001)
+        )
+        
+        # Calcular ROI potencial do cashback
+        # Assumindo cashback de 5% e aumento de 20% nas vendas
+        cashback_rate = 0.05
+        sales_increase = 0.20
+        analysis['roi_cashback'] = (
+            (analysis['margem_lucro'] * (1 + sales_increase)) - 
+            (cashback_rate * 100)
+        )
+        
+        # Preencher valores NaN de produtos sem vendas
+        analysis['total_vendido'] = analysis['total_vendido'].fillna(0)
+        analysis['frequencia_vendas'] = analysis['frequencia_vendas'].fillna(0)
+        analysis['receita_total'] = analysis['receita_total'].fillna(0)
+        analysis['preco_medio'] = analysis['preco_medio'].fillna(analysis['custo_unitario'] * 1.5)
+        analysis['clientes_unicos'] = analysis['clientes_unicos'].fillna(0)
+        analysis['margem_lucro'] = analysis['margem_lucro'].fillna(0)
+        analysis['roi_cashback'] = analysis['roi_cashback'].fillna(0)
+        
+        return analysis
+    
+    @stage_timer("score.cashback")
+    def score(self, analysis: pd.DataFrame) -> pd.DataFrame:
+        """
+        Normaliza as métricas pelo máximo global e classifica os produtos
+        
+        Args:
+            analysis: Saída de build_metrics() (de uma ou mais partições)
+        """
+        # Normalizar métricas para score com proteção contra divisão por zero
+        max_margem = analysis['margem_lucro'].max()
+        max_freq = analysis['frequencia_vendas'].max()
+        max_clientes = analysis['clientes_unicos'].max()
+        max_roi = analysis['roi_cashback'].max()
+        
+        if max_margem > 0:
+            analysis['margem_normalizada'] = analysis['margem_lucro'] / max_margem
+        else:
+            analysis['margem_normalizada'] = 0
+        
+        if max_freq > 0:
+            analysis['frequencia_normalizada'] = analysis['frequencia_vendas'] / max_freq
+        else:
+            analysis['frequencia_normalizada'] = 0
+        
+        if max_clientes > 0:
+            analysis['clientes_normalizado'] = analysis['clientes_unicos'] / max_clientes
+        else:
+            analysis['clientes_normalizado'] = 0
+        
+        if max_roi > 0:
+            analysis['roi_normalizado'] = analysis['roi_cashback'] / max_roi
+        else:
+            analysis['roi_normalizado'] = 0
+        
+        # Calcular score de cashback
+        # Score = (margem * 0.4) + (frequência * 0.3) + (clientes * 0.2) + (ROI * 0.1)
+        analysis['score_cashback'] = (
+            (analysis['margem_normalizada'] * 0.4) +
+            (analysis['frequencia_normalizada'] * 0.3) +
+            (analysis['clientes_normalizado'] * 0.2) +
+            (analysis['roi_normalizado'] * 0.1)
+        )
+        
+        # Adicionar recomendações (faixas de score da política)
+        faixas = [
+            analysis['score_cashback'] > self.policy.values_for(analysis, 'score_alta'),
+            analysis['score_cashback'] > self.policy.values_for(analysis, 'score_media'),
+        ]
+        analysis['recomendacao_cashback'] = np.select(faixas, ['Alta', 'Média'], default='Baixa')
+        
+        # Sugerir percentual de cashback baseado no score
+        analysis['cashback_sugerido'] = np.select(faixas, [10, 5], default=2)
+        
+        # Ordenar por score
+        analysis = analysis.sort_values('score_cashback', ascending=False)
+        
+        # Selecionar colunas relevantes (loja_id só existe na análise por loja)
+        store_cols = ['loja_id'] if 'loja_id' in analysis.columns else []
+        result = analysis[store_cols + [
+            'produto_id',
+            'produto_nome',
+            'margem_lucro',
+            'frequencia_vendas',
+            'clientes_unicos',
+            'ticket_medio',
+            'preco_medio',
+            'roi_cashback',
+            'score_cashback',
+            'recomendacao_cashback',
+            'cashback_sugerido'
+        ]]
+        
+        return result.fillna(0)
 
@@ -0,0 +1,293 @@
+"""
+Backend de análise em DuckDB embarcado (SQL sobre CSV/Parquet, sem servidor)
+"""
+import pandas as pd
+import logging
+import os
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.etl.transform.analyzers import ANALYZERS
+from app.models.policy import AnalysisPolicy
+from app.services.metrics import stage_timer
+
+try:
+    import duckdb
+except ImportError:  # Opcional: só necessário com ANALYTICS_BACKEND=duckdb
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+SALES_TYPES = {
+    'data': 'TIMESTAMP',
+    'produto_id': 'BIGINT',
+    'quantidade': 'BIGINT',
+    'valor_total': 'DOUBLE',
+    'cliente_id': 'BIGINT',
+}
+
+STOCK_TYPES = {
+    'produto_id': 'BIGINT',
+    'quantidade_atual': 'BIGINT',
+    'quantidade_minima': 'BIGINT',
+    'custo_unitario': 'DOUBLE',
+}
+
+# Agregações equivalentes a aggregate_sales() de cada analisador.
+# $data_atual é a data de referência das janelas (venda mais recente);
+# $janela_curta / $janela_longa vêm da política de promoção.
+PROMOTION_SQL = """
+SELECT
+    produto_id,
+    CAST(sum(quantidade) AS BIGINT) AS total_vendido,
+    avg(quantidade) AS media_vendida,
+    count(*) AS frequencia_vendas,
+    sum(valor_total) AS receita_total,
+    avg(valor_total / quantidade) AS preco_medio,
+    CAST(sum(quantidade) FILTER (WHERE data >= $data_atual - to_days($janela_curta)) AS BIGINT) AS vendas_30d_quantidade,
+    sum(valor_total) FILTER (WHERE data >= $data_atual - to_days($janela_curta)) AS vendas_30d_receita,
+    CAST(sum(quantidade) FILTER (WHERE data >= $data_atual - to_days($janela_longa)) AS BIGINT) AS vendas_90d_quantidade,
+    sum(valor_total) FILTER (WHERE data >= $data_atual - to_days($janela_longa)) AS vendas_90d_receita,
+    count(*) FILTER (WHERE data >= $data_atual - to_days($janela_curta)) AS vendas_30d
+FROM sales
+GROUP BY produto_id
+"""
+
+STOCK_SQL = """
+WITH daily AS (
+    SELECT produto_id, CAST(data AS DATE) AS dia, sum(quantidade) AS quantidade
+    FROM sales
+    GROUP BY produto_id, dia
+),
+avg_daily AS (
+    SELECT produto_id, avg(quantidade) AS vendas_media_diaria
+    FROM daily
+    GROUP BY produto_id
+),
+last_7d AS (
+    SELECT
+        produto_id,
+        CAST(sum(quantidade) AS BIGINT) AS vendas_7d_quantidade,
+        sum(valor_total) AS vendas_7d_receita,
+        count(*) AS vendas_7d
+    FROM sales
+    WHERE data >= $data_atual - INTERVAL 7 DAY
+    GROUP BY produto_id
+)
+SELECT a.produto_id, a.vendas_media_diaria, l.vendas_7d_quantidade, l.vendas_7d_receita, l.vendas_7d
+FROM avg_daily a
+LEFT JOIN last_7d l USING (produto_id)
+"""
+
+CASHBACK_SQL = """
+SELECT
+    produto_id,
+    CAST(sum(quantidade) AS BIGINT) AS total_vendido,
+    count(*) AS frequencia_vendas,
+    sum(valor_total) AS receita_total,
+    avg(valor_total / quantidade) AS preco_medio,
+    {clientes_unicos_expr} AS clientes_unicos
+FROM sales
+GROUP BY produto_id
+"""
+
+# clientes_unicos exato ou aproximado (HyperLogLog nativo do DuckDB)
+DISTINCT_EXPRESSIONS = {
+    'exact': 'count(DISTINCT cliente_id)',
+    'hll': 'approx_count_distinct(cliente_id)',
+}
+
+AGGREGATION_SQL = {
+    'promocao': PROMOTION_SQL,
+    'estoque': STOCK_SQL,
+    'cashback': CASHBACK_SQL,
+}
+
+
+def _sql_literal(value: str) -> str:
+    """Escapa um caminho para uso como literal SQL"""
+    return "'" + value.replace("'", "''") + "'"
+
+
+class DuckDBAnalyzer:
+    """
+    Executa as agregações das análises em DuckDB embarcado
+
+    As agregações pesadas (group-bys e janelas de 7/30/90 dias) rodam em SQL
+    direto sobre os arquivos, com execução out-of-core (memory_limit +
+    temp_directory) e leitura apenas das colunas necessárias. Os CSVs brutos
+    são convertidos uma vez para Parquet ordenado por data em
+    DATA_PROCESSED_DIR, o que permite pushdown do filtro de período
+    (data_inicio) via estatísticas dos row groups.
+
+    O resultado agregado (uma linha por produto) passa pelas mesmas etapas
+    derive_metrics() / score() dos analisadores pandas, garantindo regras
+    de negócio idênticas.
+    """
+
+    def __init__(
+        self,
+        sales_path: Path,
+        stock_path: Path,
+        data_inicio: Optional[datetime] = None,
+        policy: Optional[AnalysisPolicy] = None
+    ):
+        if duckdb is None:
+            raise ImportError(
+                "Backend DuckDB requer o pacote 'duckdb' (pip install duckdb)"
+            )
+        self.sales_path = Path(sales_path)
+        self.stock_path = Path(stock_path)
+        self.data_inicio = data_inicio
+        self.policy = policy or AnalysisPolicy()
+        self._con = None
+
+    def _connect(self):
+        """Abre a conexão em memória configurada para execução out-of-core"""
+        if self._con is None:
+            con = duckdb.connect(database=':memory:')
+            temp_dir = Path(settings.DATA_PROCESSED_DIR) / "duckdb_tmp"
+            temp_dir.mkdir(parents=True, exist_ok=True)
+            con.execute(f"SET memory_limit = {_sql_literal(settings.DUCKDB_MEMORY_LIMIT)}")
+            con.execute(f"SET temp_directory = {_sql_literal(str(temp_dir))}")
+            con.execute("SET preserve_insertion_order = false")
+            if settings.DUCKDB_THREADS > 0:
+                con.execute(f"SET threads = {int(settings.DUCKDB_THREADS)}")
+            self._con = con
+            self._register_views()
+        return self._con
+
+    def _csv_source(self, path: Path, types: Dict[str, str]) -> str:
+        """Expressão read_csv com tipos explícitos para as colunas conhecidas"""
+        types_sql = ", ".join(f"{_sql_literal(col)}: {_sql_literal(dtype)}" for col, dtype in types.items())
+        return f"read_csv({_sql_literal(str(path))}, header = true, types = {{{types_sql}}})"
+
+    def _parquet_path(self, csv_path: Path) -> Path:
+        return Path(settings.DATA_PROCESSED_DIR) / f"{csv_path.stem}.parquet"
+
+    def materialize_parquet(self, csv_path: Path, types: Dict[str, str], order_by: Optional[str] = None) -> Path:
+        """
+        Converte um CSV bruto em Parquet (ZSTD) via DuckDB, em streaming
+
+        A conversão é refeita apenas se o CSV for mais novo que o Parquet.
+        """
+        parquet_path = self._parquet_path(csv_path)
+        if parquet_path.exists() and parquet_path.stat().st_mtime >= csv_path.stat().st_mtime:
+            return parquet_path
+
+        con = self._con
+        tmp_path = parquet_path.with_suffix(f".parquet.{os.getpid()}.{threading.get_ident()}.tmp")
+        order_sql = f" ORDER BY {order_by}" if order_by else ""
+        con.execute(
+            f"COPY (SELECT * FROM {self._csv_source(csv_path, types)}{order_sql}) "
+            f"TO {_sql_literal(str(tmp_path))} (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+        tmp_path.replace(parquet_path)
+        logger.info(f"💾 Parquet materializado: {parquet_path}")
+        return parquet_path
+
+    def _source(self, path: Path, types: Dict[str, str], order_by: Optional[str] = None) -> str:
+        if path.suffix == ".parquet":
+            return f"read_parquet({_sql_literal(str(path))})"
+        if settings.DUCKDB_MATERIALIZE_PARQUET:
+            parquet_path = self.materialize_parquet(path, types, order_by)
+            return f"read_parquet({_sql_literal(str(parquet_path))})"
+        return self._csv_source(path, types)
+
+    def _register_views(self):
+        con = self._con
+        sales_source = self._source(self.sales_path, SALES_TYPES, order_by="data")
+        stock_source = self._source(self.stock_path, STOCK_TYPES)
+
+        where_sql = ""
+        if self.data_inicio is not None:
+            where_sql = f" WHERE data >= TIMESTAMP {_sql_literal(pd.Timestamp(self.data_inicio).isoformat(sep=' '))}"
+
+        con.execute(
+            f"CREATE OR REPLACE VIEW sales AS "
+            f"SELECT data, produto_id, quantidade, valor_total, cliente_id FROM {sales_source}{where_sql}"
+        )
+        con.execute(
+            f"CREATE OR REPLACE VIEW stock AS "
+            f"SELECT *, quantidade_atual * custo_unitario AS valor_total_estoque FROM {stock_source}"
+        )
+
+    def load_stock(self) -> pd.DataFrame:
+        """Carrega o estoque (catálogo, pequeno) como DataFrame"""
+        stock_df = self._connect().execute("SELECT * FROM stock").df()
+        if 'produto_nome' in stock_df.columns:
+            stock_df['produto_nome'] = stock_df['produto_nome'].astype('string')
+        return stock_df
+
+    def reference_date(self) -> datetime:
+        """Data da venda mais recente (referência das janelas)"""
+        data_atual = self._connect().execute("SELECT max(data) FROM sales").fetchone()[0]
+        return data_atual or datetime.now()
+
+    def aggregate_sales(self, name: str, data_atual: datetime) -> pd.DataFrame:
+        """Executa a agregação SQL de uma análise (uma linha por produto)"""
+        sql = AGGREGATION_SQL[name]
+        if name == 'cashback':
+            sql = sql.format(clientes_unicos_expr=DISTINCT_EXPRESSIONS[settings.CASHBACK_DISTINCT_MODE])
+        candidates = {
+            'data_atual': data_atual,
+            'janela_curta': self.policy.promocao.janela_curta_dias,
+            'janela_longa': self.policy.promocao.janela_longa_dias,
+        }
+        params = {key: value for key, value in candidates.items() if f"${key}" in sql}
+        with stage_timer(f"aggregate.{name}.duckdb"):
+            return self._connect().execute(sql, params).df()
+
+    def totals(self) -> Dict:
+        """Totais usados no resumo (produtos, vendas e receita)"""
+        con = self._connect()
+        total_sales, total_revenue = con.execute(
+            "SELECT count(*), coalesce(sum(valor_total), 0) FROM sales"
+        ).fetchone()
+        total_products = con.execute("SELECT count(*) FROM stock").fetchone()[0]
+        return {
+            'total_products': int(total_products),
+            'total_sales': int(total_sales),
+            'total_revenue': float(total_revenue),
+        }
+
+    def analyze(self, analyses: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Executa as análises com agregação em DuckDB
+
+        Args:
+            analyses: Subconjunto de 'promocao', 'estoque', 'cashback' (padrão: todas)
+
+        Returns:
+            Dict nome da análise -> DataFrame de resultado
+        """
+        try:
+            analyses = analyses or list(ANALYZERS)
+            unknown = [name for name in analyses if name not in ANALYZERS]
+            if unknown:
+                raise ValueError(f"Análises desconhecidas: {unknown}")
+
+            stock_df = self.load_stock()
+            data_atual = self.reference_date()
+
+            results = {}
+            for name in analyses:
+                analyzer = ANALYZERS[name](self.policy)
+                sales_metrics = self.aggregate_sales(name, data_atual)
+                results[name] = analyzer.score(analyzer.derive_metrics(stock_df, sales_metrics))
+
+            logger.info(f"✅ Análise DuckDB concluída: {analyses} ({len(stock_df)} produtos)")
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Erro na análise DuckDB: {str(e)}")
+            raise
+
+    def close(self):
+        if self._con is not None:
+            self._con.close()
+            self._con = None
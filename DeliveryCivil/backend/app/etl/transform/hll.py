@@ -0,0 +1,361 @@
+"""
+Sketches HyperLogLog por produto para contagem aproximada de clientes únicos
+"""
+import numpy as np
+import pandas as pd
+import hashlib
+import logging
+import os
+import threading
+import math
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+# Muda quando o formato dos sketches salvos muda (invalida os arquivos antigos)
+FORMAT_VERSION = 2
+
+# Sketches mensais guardados para reaproveitar entre arquivos de vendas (os mais recentes ficam)
+PARTITION_CACHE_KEEP = 240
+
+
+def precision_for_error(relative_error: float) -> int:
+    """
+    Menor precisão (log2 do número de registradores) que atende o erro relativo
+
+    O erro padrão do HyperLogLog é ~1.04 / sqrt(m), com m = 2^p registradores.
+    """
+    if relative_error <= 0:
+        raise ValueError("Erro relativo deve ser maior que zero")
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """bit_length() vetorizado e exato para uint64"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = values >= (np.uint64(1) << np.uint64(shift))
+        length[mask] += shift
+        values[mask] >>= np.uint64(shift)
+    length += values > 0
+    return length
+
+
+def _alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+# Bytes por registrador não nulo na forma esparsa (índice uint16 + rank uint8)
+SPARSE_ENTRY_BYTES = 3
+
+# Elementos da matriz temporária ao estimar os produtos densos (linhas por bloco = isto / 2^p)
+ESTIMATE_CHUNK_ELEMENTS = 1 << 20
+
+
+class ProductSketches:
+    """
+    Conjunto de sketches HyperLogLog, um por produto
+
+    A maioria dos produtos tem poucos clientes e poucos registradores não
+    nulos: esses ficam na forma esparsa (pares registrador/rank ordenados
+    por produto, com offsets por produto). Só os produtos com mais de
+    2^p / SPARSE_ENTRY_BYTES registradores preenchidos ocupam uma linha
+    densa uint8 de 2^p registradores. merge()/merge_all() combinam conjuntos
+    de mesma precisão (máximo por registrador): load_or_build() une os
+    sketches mensais, reaproveitados entre arquivos de vendas.
+    """
+
+    def __init__(
+        self,
+        produto_ids: np.ndarray,
+        offsets: np.ndarray,
+        register_idx: np.ndarray,
+        ranks: np.ndarray,
+        dense_rows: np.ndarray,
+        dense: np.ndarray,
+        precision: int
+    ):
+        self.produto_ids = np.asarray(produto_ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.register_idx = np.asarray(register_idx, dtype=np.uint16)
+        self.ranks = np.asarray(ranks, dtype=np.uint8)
+        self.dense_rows = np.asarray(dense_rows, dtype=np.int64)
+        self.dense = np.asarray(dense, dtype=np.uint8).reshape(len(self.dense_rows), 1 << precision)
+        self.precision = precision
+
+    @classmethod
+    def from_entries(
+        cls,
+        product_ids: np.ndarray,
+        register_idx: np.ndarray,
+        ranks: np.ndarray,
+        precision: int,
+        produto_ids: Optional[np.ndarray] = None
+    ) -> "ProductSketches":
+        """
+        Monta os sketches a partir de registradores não nulos (produto, registrador, rank)
+
+        Pares repetidos ficam com o maior rank. produto_ids, se informado,
+        inclui produtos sem registradores preenchidos.
+        """
+        m = 1 << precision
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if produto_ids is None:
+            produto_ids = np.unique(product_ids)
+        else:
+            produto_ids = np.unique(np.concatenate([np.asarray(produto_ids, dtype=np.int64), product_ids]))
+
+        # Máximo do rank por (produto, registrador), já ordenado por produto
+        flat_idx = np.searchsorted(produto_ids, product_ids) * m + np.asarray(register_idx, dtype=np.int64)
+        order = np.lexsort((np.asarray(ranks), flat_idx))
+        flat_idx = flat_idx[order]
+        last = np.ones(len(flat_idx), dtype=bool)
+        last[:-1] = flat_idx[1:] != flat_idx[:-1]
+        flat_idx = flat_idx[last]
+        entry_ranks = np.asarray(ranks, dtype=np.uint8)[order][last]
+        entry_products = flat_idx // m
+        entry_registers = flat_idx % m
+
+        # Produtos com muitos registradores preenchidos: linha densa
+        counts = np.bincount(entry_products, minlength=len(produto_ids))
+        dense_rows = np.flatnonzero(counts * SPARSE_ENTRY_BYTES > m)
+        dense = np.zeros((len(dense_rows), m), dtype=np.uint8)
+        is_dense = np.zeros(len(produto_ids), dtype=bool)
+        is_dense[dense_rows] = True
+        dense_entries = is_dense[entry_products]
+        if len(dense_rows):
+            row_of = np.searchsorted(dense_rows, entry_products[dense_entries])
+            dense[row_of, entry_registers[dense_entries]] = entry_ranks[dense_entries]
+
+        sparse_products = entry_products[~dense_entries]
+        offsets = np.zeros(len(produto_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sparse_products, minlength=len(produto_ids)), out=offsets[1:])
+        return cls(
+            produto_ids,
+            offsets,
+            entry_registers[~dense_entries],
+            entry_ranks[~dense_entries],
+            dense_rows,
+            dense,
+            precision
+        )
+
+    @classmethod
+    def from_sales(cls, sales_df: pd.DataFrame, precision: int) -> "ProductSketches":
+        """
+        Constrói os sketches a partir das vendas (produto_id, cliente_id)
+
+        Vendas sem cliente_id são ignoradas, como no nunique exato.
+        """
+        pairs = sales_df[['produto_id', 'cliente_id']].dropna()
+        product_ids = pairs['produto_id'].to_numpy(dtype=np.int64)
+
+        hashes = pd.util.hash_array(pairs['cliente_id'].to_numpy(dtype=np.int64))
+        register_idx = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << (64 - precision)) - 1)
+        rank = (64 - precision) - _bit_length(remainder) + 1
+
+        return cls.from_entries(product_ids, register_idx, rank.astype(np.uint8), precision)
+
+    def entries(self):
+        """Registradores não nulos como arrays (produto_id, registrador, rank)"""
+        sparse_products = np.repeat(self.produto_ids, np.diff(self.offsets))
+        dense_pos, dense_registers = np.nonzero(self.dense)
+        return (
+            np.concatenate([sparse_products, self.produto_ids[self.dense_rows[dense_pos]]]),
+            np.concatenate([self.register_idx.astype(np.int64), dense_registers]),
+            np.concatenate([self.ranks, self.dense[dense_pos, dense_registers]])
+        )
+
+    def merge(self, other: "ProductSketches") -> "ProductSketches":
+        """Une dois conjuntos de sketches (mesma precisão)"""
+        return ProductSketches.merge_all([self, other], self.precision)
+
+    @classmethod
+    def merge_all(cls, sketches: List["ProductSketches"], precision: int) -> "ProductSketches":
+        """Une vários conjuntos de sketches de uma vez (máximo por registrador)"""
+        for item in sketches:
+            if item.precision != precision:
+                raise ValueError(
+                    f"Precisões diferentes não podem ser combinadas: {item.precision} != {precision}"
+                )
+        if not sketches:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls.from_entries(empty, empty, empty.astype(np.uint8), precision)
+        entries = [item.entries() for item in sketches]
+        return cls.from_entries(
+            *(np.concatenate(parts) for parts in zip(*entries)),
+            precision,
+            produto_ids=np.concatenate([item.produto_ids for item in sketches])
+        )
+
+    @classmethod
+    def from_partitions(cls, sales_df: pd.DataFrame, precision: int, cache_dir: Path) -> "ProductSketches":
+        """
+        Constrói os sketches por mês das vendas e une com merge_all()
+
+        O sketch de cada mês é guardado em cache_dir pelo hash dos pares
+        (produto_id, cliente_id) do mês: um novo arquivo de vendas que repete
+        os meses anteriores (ex: histórico + vendas novas) só processa os
+        meses que mudaram.
+        """
+        if 'data' not in sales_df.columns:
+            return cls.from_sales(sales_df, precision)
+
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        pairs = sales_df[['data', 'produto_id', 'cliente_id']].dropna(subset=['produto_id', 'cliente_id'])
+        datas = pd.to_datetime(pairs['data'])
+        months = (datas.dt.year * 12 + datas.dt.month - 1).to_numpy()
+
+        partitions = []
+        reused = 0
+        for month, month_pairs in pairs[['produto_id', 'cliente_id']].groupby(months, sort=True):
+            row_hashes = pd.util.hash_pandas_object(month_pairs, index=False).to_numpy()
+            digest = hashlib.sha256(row_hashes.tobytes()).hexdigest()[:24]
+            path = cache_dir / f"{month // 12}-{month % 12 + 1:02d}-{digest}.npz"
+            try:
+                partitions.append(cls.load(path))
+                os.utime(path)
+                reused += 1
+                continue
+            except (OSError, ValueError, KeyError):
+                pass
+            sketches = cls.from_sales(month_pairs, precision)
+            sketches.save(path)
+            partitions.append(sketches)
+
+        _prune_partitions(cache_dir)
+        logger.info(f"🧮 Sketches mensais de clientes: {len(partitions)} meses ({reused} reaproveitados)")
+        return cls.merge_all(partitions, precision)
+
+    def estimate(self) -> pd.Series:
+        """
+        Estimativa de clientes únicos por produto (Series indexada por produto_id)
+
+        Usa só a soma harmônica e o número de registradores zerados de cada
+        produto: na forma esparsa, somados sobre os registradores não nulos;
+        nas linhas densas, pelo histograma dos ranks em blocos de linhas.
+        """
+        m = 1 << self.precision
+        n = len(self.produto_ids)
+        if n == 0:
+            return pd.Series(dtype='float64', index=pd.Index([], name='produto_id'))
+
+        # Registradores zerados contribuem 2^0 = 1 cada
+        nonzero = np.diff(self.offsets)
+        sparse_products = np.repeat(np.arange(n), nonzero)
+        harmonic = (m - nonzero) + np.bincount(
+            sparse_products, weights=np.exp2(-self.ranks.astype(np.float64)), minlength=n
+        )
+        zeros = m - nonzero
+
+        max_rank = 64 - self.precision + 1
+        weights = np.exp2(-np.arange(max_rank + 1, dtype=np.float64))
+        chunk_rows = max(1, ESTIMATE_CHUNK_ELEMENTS // m)
+        for start in range(0, len(self.dense_rows), chunk_rows):
+            block = self.dense[start:start + chunk_rows]
+            rows = self.dense_rows[start:start + chunk_rows]
+            histogram = np.bincount(
+                (np.arange(len(block))[:, None] * (max_rank + 1) + block).reshape(-1),
+                minlength=len(block) * (max_rank + 1)
+            ).reshape(len(block), max_rank + 1)
+            harmonic[rows] = histogram @ weights
+            zeros[rows] = histogram[:, 0]
+
+        raw = _alpha(m) * m * m / harmonic
+
+        # Correção para cardinalidades pequenas (linear counting)
+        with np.errstate(divide='ignore'):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        estimate = np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+        return pd.Series(np.round(estimate), index=pd.Index(self.produto_ids, name='produto_id'))
+
+    def save(self, path: Path):
+        """Salva os sketches em .npz (escrita atômica)"""
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                produto_ids=self.produto_ids,
+                offsets=self.offsets,
+                register_idx=self.register_idx,
+                ranks=self.ranks,
+                dense_rows=self.dense_rows,
+                dense=self.dense,
+                precision=self.precision
+            )
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ProductSketches":
+        with np.load(Path(path)) as data:
+            return cls(
+                data['produto_ids'],
+                data['offsets'],
+                data['register_idx'],
+                data['ranks'],
+                data['dense_rows'],
+                data['dense'],
+                int(data['precision'])
+            )
+
+    @classmethod
+    def load_or_build(
+        cls,
+        sales_path: Path,
+        sales_df: pd.DataFrame,
+        precision: int,
+        output_dir: Optional[Path] = None
+    ) -> "ProductSketches":
+        """
+        Carrega os sketches salvos ao lado das agregações do arquivo de vendas,
+        ou constrói e salva se não existirem / estiverem desatualizados
+
+        A construção reaproveita os sketches mensais de arquivos anteriores
+        (from_partitions()).
+        """
+        sales_path = Path(sales_path)
+        output_dir = Path(output_dir) if output_dir else sales_path.parent
+        sketch_path = output_dir / f"{sales_path.stem}_clientes_hll_v{FORMAT_VERSION}_p{precision}.npz"
+
+        if sketch_path.exists() and sketch_path.stat().st_mtime >= sales_path.stat().st_mtime:
+            return cls.load(sketch_path)
+
+        sketches = cls.from_partitions(
+            sales_df, precision, output_dir / f"clientes_hll_v{FORMAT_VERSION}_p{precision}_mensal"
+        )
+        output_dir.mkdir(parents=True, exist_ok=True)
+        sketches.save(sketch_path)
+        logger.info(f"💾 Sketches de clientes salvos: {sketch_path} ({len(sketches.produto_ids)} produtos)")
+        return sketches
+
+
+def _prune_partitions(cache_dir: Path):
+    """Remove os sketches mensais menos usados além de PARTITION_CACHE_KEEP"""
+    def mtime(path: Path) -> float:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return 0.0
+
+    files = sorted(cache_dir.glob("*.npz"), key=mtime, reverse=True)
+    for path in files[PARTITION_CACHE_KEEP:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,286 @@
+"""
+Análise particionada por loja (multi-loja) em pool de processos
+
+O pool é criado na primeira análise particionada e reutilizado pelas
+seguintes (encerrado junto com a aplicação). Quando os datasets vêm da
+memória compartilhada (shared_datasets), cada partição é enviada ao
+processo só como (loja_id, bucket): o processo mapeia os mesmos arquivos
+Arrow e seleciona a partição, sem serializar DataFrames.
+"""
+import pandas as pd
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.etl.transform.analyzers import ANALYZERS
+from app.models.policy import AnalysisPolicy
+from app.services.shared_datasets import SharedDatasetStore, shared_datasets
+
+logger = logging.getLogger(__name__)
+
+# Partição: (loja_id, bucket, número de buckets da loja)
+ShardKey = Tuple[Optional[int], int, int]
+
+
+def _build_shard_metrics(
+    analyses: List[str],
+    sales_df: pd.DataFrame,
+    stock_df: pd.DataFrame,
+    data_atual: datetime,
+    loja_id: Optional[int],
+    policy: AnalysisPolicy
+) -> Dict[str, pd.DataFrame]:
+    """
+    Executa build_metrics() de cada análise em uma partição (roda no worker)
+
+    Função de módulo para poder ser serializada pelo ProcessPoolExecutor.
+    """
+    metrics = {}
+    for name in analyses:
+        analyzer = ANALYZERS[name](policy)
+        if name == 'cashback':
+            shard_metrics = analyzer.build_metrics(sales_df, stock_df)
+        else:
+            shard_metrics = analyzer.build_metrics(sales_df, stock_df, data_atual)
+        if loja_id is not None:
+            shard_metrics['loja_id'] = loja_id
+        metrics[name] = shard_metrics
+    return metrics
+
+
+def _select_shard(
+    sales_df: pd.DataFrame,
+    stock_df: pd.DataFrame,
+    key: ShardKey
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Vendas e estoque de uma partição"""
+    loja_id, bucket, n_buckets = key
+    if loja_id is None:
+        # Vendas/estoque sem loja_id (ou datasets sem a coluna: tudo)
+        store_sales = sales_df[sales_df['loja_id'].isna()] if 'loja_id' in sales_df.columns else sales_df
+        store_stock = stock_df[stock_df['loja_id'].isna()] if 'loja_id' in stock_df.columns else stock_df
+    else:
+        store_sales = sales_df[sales_df['loja_id'] == loja_id]
+        if 'loja_id' in stock_df.columns:
+            store_stock = stock_df[stock_df['loja_id'] == loja_id]
+        else:
+            store_stock = stock_df
+
+    if n_buckets == 1:
+        return store_sales, store_stock
+
+    # Hash estável de produto_id: todas as vendas de um produto caem na mesma partição
+    sales_bucket = pd.util.hash_array(store_sales['produto_id'].to_numpy()) % n_buckets
+    stock_bucket = pd.util.hash_array(store_stock['produto_id'].to_numpy()) % n_buckets
+    return store_sales[sales_bucket == bucket], store_stock[stock_bucket == bucket]
+
+
+# Datasets mapeados no processo do pool: caminho do Arrow -> DataFrame (só a geração em uso)
+_process_datasets: Dict[str, pd.DataFrame] = {}
+
+
+def _mapped_dataset(path: str) -> pd.DataFrame:
+    df = _process_datasets.get(path)
+    if df is None:
+        df = SharedDatasetStore.attach(Path(path))
+        _process_datasets[path] = df
+    return df
+
+
+def _build_mapped_shard_metrics(
+    analyses: List[str],
+    sales_path: str,
+    stock_path: str,
+    key: ShardKey,
+    data_atual: datetime,
+    policy: AnalysisPolicy
+) -> Dict[str, pd.DataFrame]:
+    """Executa build_metrics() de uma partição dos datasets compartilhados (roda no worker)"""
+    for path in [path for path in _process_datasets if path not in (sales_path, stock_path)]:
+        del _process_datasets[path]
+    shard_sales, shard_stock = _select_shard(_mapped_dataset(sales_path), _mapped_dataset(stock_path), key)
+    return _build_shard_metrics(analyses, shard_sales, shard_stock, data_atual, key[0], policy)
+
+
+class ShardPool:
+    """Pool de processos do worker, criado na primeira análise particionada e reutilizado"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def size() -> int:
+        return settings.ANALYSIS_WORKERS or os.cpu_count() or 1
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.size())
+                logger.info(f"⚙️ Pool de análise particionada iniciado com {self.size()} processos")
+            return self._executor
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+shard_pool = ShardPool()
+
+
+class ShardedAnalyzer:
+    """
+    Executa as análises particionando os dados por loja e, dentro de lojas
+    grandes, por hash de produto_id
+
+    Cada partição contém todas as vendas dos seus produtos, então as métricas
+    por produto são exatas. A normalização pelo máximo (score()) é feita uma
+    única vez sobre as métricas concatenadas, garantindo scores comparáveis
+    entre partições.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_rows_per_shard: Optional[int] = None,
+        policy: Optional[AnalysisPolicy] = None
+    ):
+        self.policy = policy or AnalysisPolicy()
+        self.max_workers = max_workers or settings.ANALYSIS_WORKERS or os.cpu_count() or 1
+        self.max_rows_per_shard = max_rows_per_shard or settings.SHARD_MAX_ROWS
+
+    def plan_shard_keys(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame) -> List[ShardKey]:
+        """
+        Partições dos datasets como (loja_id, bucket, número de buckets)
+
+        - Sem coluna loja_id nas vendas: uma única "loja" global
+        - Estoque sem loja_id: o mesmo catálogo é usado para todas as lojas
+        - Vendas (ou estoque) com loja_id vazio: partição própria, loja_id None
+        - Lojas com mais de max_rows_per_shard vendas: subdivididas por hash de produto_id
+        """
+        if 'loja_id' in sales_df.columns:
+            store_ids = sales_df['loja_id'].dropna().unique().tolist()
+            has_null = bool(sales_df['loja_id'].isna().any())
+            if 'loja_id' in stock_df.columns:
+                store_ids = sorted(set(store_ids) | set(stock_df['loja_id'].dropna().unique().tolist()))
+                has_null = has_null or bool(stock_df['loja_id'].isna().any())
+            else:
+                store_ids = sorted(store_ids)
+            store_rows = sales_df['loja_id'].value_counts()
+            null_rows = int(sales_df['loja_id'].isna().sum())
+            if has_null:
+                store_ids.append(None)
+        else:
+            store_ids = [None]
+            store_rows = None
+            null_rows = len(sales_df)
+
+        keys = []
+        for loja_id in store_ids:
+            if loja_id is None:
+                rows = null_rows
+            else:
+                loja_id = int(loja_id)
+                rows = int(store_rows.get(loja_id, 0))
+            n_buckets = max(1, math.ceil(rows / self.max_rows_per_shard))
+            keys.extend((loja_id, bucket, n_buckets) for bucket in range(n_buckets))
+        return keys
+
+    def plan_shards(
+        self,
+        sales_df: pd.DataFrame,
+        stock_df: pd.DataFrame
+    ) -> List[Tuple[Optional[int], pd.DataFrame, pd.DataFrame]]:
+        """Divide os datasets em partições (loja_id, vendas, estoque)"""
+        return [
+            (key[0],) + _select_shard(sales_df, stock_df, key)
+            for key in self.plan_shard_keys(sales_df, stock_df)
+        ]
+
+    def analyze(
+        self,
+        sales_df: pd.DataFrame,
+        stock_df: pd.DataFrame,
+        analyses: Optional[List[str]] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Executa as análises particionadas e combina os resultados
+
+        Args:
+            sales_df: Vendas (com coluna opcional loja_id)
+            stock_df: Estoque (com coluna opcional loja_id)
+            analyses: Subconjunto de 'promocao', 'estoque', 'cashback' (padrão: todas)
+
+        Returns:
+            Dict nome da análise -> DataFrame de resultado
+        """
+        try:
+            analyses = analyses or list(ANALYZERS)
+            unknown = [name for name in analyses if name not in ANALYZERS]
+            if unknown:
+                raise ValueError(f"Análises desconhecidas: {unknown}")
+
+            # Data de referência global: todas as partições usam as mesmas janelas
+            data_atual = pd.to_datetime(sales_df['data']).max() if not sales_df.empty else datetime.now()
+
+            keys = self.plan_shard_keys(sales_df, stock_df)
+            workers = min(self.max_workers, shard_pool.size(), len(keys))
+
+            if workers <= 1:
+                shard_results = [
+                    _build_shard_metrics(
+                        analyses, *_select_shard(sales_df, stock_df, key), data_atual, key[0], self.policy
+                    )
+                    for key in keys
+                ]
+            else:
+                executor = shard_pool.get()
+                sales_path = shared_datasets.source_path(sales_df)
+                stock_path = shared_datasets.source_path(stock_df)
+                if sales_path is not None and stock_path is not None:
+                    # Datasets em memória compartilhada: o processo mapeia os arquivos e seleciona a partição
+                    futures = [
+                        executor.submit(
+                            _build_mapped_shard_metrics,
+                            analyses, str(sales_path), str(stock_path), key, data_atual, self.policy
+                        )
+                        for key in keys
+                    ]
+                else:
+                    futures = [
+                        executor.submit(
+                            _build_shard_metrics,
+                            analyses, *_select_shard(sales_df, stock_df, key), data_atual, key[0], self.policy
+                        )
+                        for key in keys
+                    ]
+                shard_results = [future.result() for future in futures]
+
+            results = {}
+            for name in analyses:
+                metrics = pd.concat([shard[name] for shard in shard_results], ignore_index=True)
+                result = ANALYZERS[name](self.policy).score(metrics)
+                if 'loja_id' in metrics.columns:
+                    # score() preenche vazios com 0: as linhas sem loja voltam a ter loja_id vazio
+                    no_store = metrics.index[metrics['loja_id'].isna()]
+                    result['loja_id'] = result['loja_id'].where(~result.index.isin(no_store))
+                results[name] = result
+
+            logger.info(
+                f"✅ Análise particionada concluída: {len(keys)} partições, "
+                f"{workers} processos, análises {analyses}"
+            )
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Erro na análise particionada: {str(e)}")
+            raise
@@ -2,16 +2,32 @@
 Analisador de estoque para reposição
 """
 import pandas as pd
+import numpy as np
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 
+from app.models.policy import AnalysisPolicy
+from app.services.metrics import stage_timer
+
 logger = logging.getLogger(__name__)
 
 class StockAnalyzer:
     """Analisa estoque para identificar necessidade de reposição"""
     
-    def analyze(self, sales_df: pd.DataFrame, stock_df: pd.DataFrame) -> pd.DataFrame:
+    def __init__(self, policy: Optional[AnalysisPolicy] = None):
+        self.policy = policy or AnalysisPolicy()
+    
+    def aggregation_key(self) -> tuple:
+        """Parâmetros da política que alteram aggregate_sales() (nenhum)"""
+        return ()
+    
+    def analyze(
+        self,
+        sales_df: pd.DataFrame,
+        stock_df: pd.DataFrame,
+        data_atual: Optional[datetime] = None
+    ) -> pd.DataFrame:
         """
         Analisa estoque e identifica produtos que precisam ser repostos
         
@@ -21,189 +37,245 @@ class StockAnalyzer:
         - Previsão de ruptura
         """
         try:
-            # Data atual (usar a data mais recente das vendas)
-            sales_df_copy = sales_df.copy()
-            sales_df_copy['data'] = pd.to_datetime(sales_df_copy['data'])
-            data_atual = sales_df_copy['data'].max() if not sales_df_copy.empty else datetime.now()
-            data_7d_atras = data_atual - timedelta(days=7)
-            
-            # Filtrar vendas dos últimos 7 dias para alertas de oportunidade
-            vendas_7d = sales_df_copy[sales_df_copy['data'] >= data_7d_atras]
-            
-            # Calcular vendas dos últimos 7 dias por produto
-            vendas_7d_metrics = vendas_7d.groupby('produto_id').agg({
-                'quantidade': 'sum',
-                'valor_total': 'sum'
-            }).reset_index()
-            vendas_7d_metrics.columns = ['produto_id', 'vendas_7d_quantidade', 'vendas_7d_receita']
-            
-            # Contar número de transações nos últimos 7 dias
-            vendas_7d_count = vendas_7d.groupby('produto_id').size().reset_index(name='vendas_7d')
-            
-            # Calcular velocidade de venda (unidades por dia) - histórico completo
-            daily_sales = sales_df_copy.groupby(['produto_id', sales_df_copy['data'].dt.date]).agg({
-                'quantidade': 'sum'
-            }).reset_index()
-            
-            # Calcular média diária de vendas
-            avg_daily_sales = daily_sales.groupby('produto_id')['quantidade'].mean().reset_index()
-            avg_daily_sales.columns = ['produto_id', 'vendas_media_diaria']
-            
-            # Merge com estoque
-            analysis = stock_df.merge(
-                avg_daily_sales,
-                on='produto_id',
-                how='left'
-            ).merge(
-                vendas_7d_metrics,
-                on='produto_id',
-                how='left'
-            ).merge(
-                vendas_7d_count,
-                on='produto_id',
-                how='left'
-            )
-            
-            # Preencher NaN com 0
-            analysis['vendas_media_diaria'] = analysis['vendas_media_diaria'].fillna(0)
-            analysis['vendas_7d_quantidade'] = analysis['vendas_7d_quantidade'].fillna(0)
-            analysis['vendas_7d_receita'] = analysis['vendas_7d_receita'].fillna(0)
-            analysis['vendas_7d'] = analysis['vendas_7d'].fillna(0)
-            
-            # Calcular dias até ruptura
-            analysis['dias_ate_ruptura'] = (
-                analysis['quantidade_atual'] / 
-                (analysis['vendas_media_diaria'] + 0.001)
-            )
-            
-            # Calcular quantidade sugerida para reposição
-            # Sugestão = (vendas_media_diaria * lead_time) + estoque_minimo - estoque_atual
-            lead_time = 7  # dias (pode ser configurável)
-            analysis['quantidade_sugerida'] = (
-                (analysis['vendas_media_diaria'] * lead_time) + 
-                analysis['quantidade_minima'] - 
-                analysis['quantidade_atual']
-            )
-            analysis['quantidade_sugerida'] = analysis['quantidade_sugerida'].clip(lower=0)
-            
-            # Calcular custo de reposição
-            analysis['custo_reposicao'] = (
-                analysis['quantidade_sugerida'] * 
-                analysis['custo_unitario']
-            )
-            
-            # Classificar urgência
-            analysis['urgencia_reposicao'] = analysis.apply(
-                lambda row: self._classify_urgency(row),
-                axis=1
-            )
-            
-            # Calcular score de reposição
-            analysis['score_reposicao'] = analysis.apply(
-                lambda row: self._calculate_reorder_score(row),
-                axis=1
-            )
-            
-            # RF-06: Gerar alertas de oportunidade
-            # Ex: "Item X teve 30 compras no período de 7 dias. Considere uma reposição de estoque"
-            def gerar_alerta(row):
-                alertas = []
-                
-                # Alerta de alta demanda recente
-                if row['vendas_7d'] >= 20:  # 20 ou mais transações em 7 dias
-                    alertas.append(
-                        f"⚠️ Alta demanda: {int(row['vendas_7d'])} compras nos últimos 7 dias. "
-                        f"Considere uma reposição de estoque."
-                    )
-                elif row['vendas_7d'] >= 10:  # 10-19 transações
-                    alertas.append(
-                        f"📈 Demanda crescente: {int(row['vendas_7d'])} compras nos últimos 7 dias. "
-                        f"Monitore o estoque."
-                    )
-                
-                # Alerta de estoque baixo com alta venda
-                if row['quantidade_atual'] < row['quantidade_minima'] and row['vendas_7d_quantidade'] > 0:
-                    alertas.append(
-                        f"🔴 Estoque crítico: {int(row['quantidade_atual'])} unidades "
-                        f"(mínimo: {int(row['quantidade_minima'])}). "
-                        f"Reposição urgente recomendada."
-                    )
-                
-                # Alerta de ruptura iminente
-                if row['dias_ate_ruptura'] < 7 and row['vendas_media_diaria'] > 0:
-                    alertas.append(
-                        f"⏰ Ruptura prevista em {row['dias_ate_ruptura']:.1f} dias. "
-                        f"Repor {int(row['quantidade_sugerida'])} unidades."
-                    )
-                
-                return ' | '.join(alertas) if alertas else None
-            
-            analysis['alerta_oportunidade'] = analysis.apply(gerar_alerta, axis=1)
-            
-            # Adicionar recomendações
-            analysis['recomendacao_reposicao'] = analysis.apply(
-                lambda x: f"Repor {x['quantidade_sugerida']} unidades" if x['quantidade_sugerida'] > 0 else "Estoque adequado",
-                axis=1
-            )
-            
-            # Ordenar por urgência e score
-            analysis = analysis.sort_values(
-                ['urgencia_reposicao', 'score_reposicao'],
-                ascending=[False, False]
-            )
-            
-            # Selecionar colunas relevantes
-            result = analysis[[
-                'produto_id',
-                'produto_nome',
-                'quantidade_atual',
-                'quantidade_minima',
-                'vendas_media_diaria',
-                'vendas_7d',
-                'vendas_7d_quantidade',
-                'vendas_7d_receita',
-                'dias_ate_ruptura',
-                'quantidade_sugerida',
-                'custo_reposicao',
-                'custo_unitario',
-                'urgencia_reposicao',
-                'score_reposicao',
-                'recomendacao_reposicao',
-                'alerta_oportunidade'
-            ]]
+            analysis = self.build_metrics(sales_df, stock_df, data_atual)
+            result = self.score(analysis)
             
             logger.info(f"✅ Análise de estoque concluída: {len(result)} produtos analisados")
             
-            return result.fillna(0)
+            return result
             
         except Exception as e:
             logger.error(f"Erro na análise de estoque: {str(e)}")
             raise
     
-    def _classify_urgency(self, row) -> str:
+    def build_metrics(
+        self,
+        sales_df: pd.DataFrame,
+        stock_df: pd.DataFrame,
+        data_atual: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """
+        Calcula as métricas de giro e reposição por produto
+        
+        Pode ser executado por partição (loja / faixa de produto_id) e os
+        resultados concatenados antes de chamar score().
+        
+        Args:
+            sales_df: Vendas
+            stock_df: Estoque
+            data_atual: Data de referência da janela de 7 dias (padrão: venda mais recente)
+        """
+        sales_metrics = self.aggregate_sales(sales_df, data_atual)
+        return self.derive_metrics(stock_df, sales_metrics)
+    
+    @stage_timer("aggregate.estoque")
+    def aggregate_sales(self, sales_df: pd.DataFrame, data_atual: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Agrega as vendas por produto (média diária e janela de 7 dias)
+        
+        É a etapa cara da análise; backends alternativos (ex: DuckDB) só
+        precisam produzir este mesmo DataFrame.
+        """
+        # Só a coluna de datas é convertida (sem copiar o DataFrame de vendas inteiro)
+        datas = sales_df['data']
+        if not pd.api.types.is_datetime64_any_dtype(datas):
+            datas = pd.to_datetime(datas)
+        if data_atual is None:
+            # Data atual (usar a data mais recente das vendas)
+            data_atual = datas.max() if not sales_df.empty else datetime.now()
+        data_7d_atras = data_atual - timedelta(days=7)
+        
+        # Filtrar vendas dos últimos 7 dias para alertas de oportunidade
+        vendas_7d = sales_df.loc[datas >= data_7d_atras, ['produto_id', 'quantidade', 'valor_total']]
+        
+        # Calcular vendas dos últimos 7 dias por produto
+        vendas_7d_metrics = vendas_7d.groupby('produto_id').agg({
+            'quantidade': 'sum',
+            'valor_total': 'sum'
+        }).reset_index()
+        vendas_7d_metrics.columns = ['produto_id', 'vendas_7d_quantidade', 'vendas_7d_receita']
+        
+        # Contar número de transações nos últimos 7 dias
+        vendas_7d_count = vendas_7d.groupby('produto_id').size().reset_index(name='vendas_7d')
+        
+        # Calcular velocidade de venda (unidades por dia) - histórico completo
+        daily_sales = sales_df.groupby(['produto_id', datas.dt.normalize()])['quantidade'].sum().reset_index()
+        
+        # Calcular média diária de vendas
+        avg_daily_sales = daily_sales.groupby('produto_id')['quantidade'].mean().reset_index()
+        avg_daily_sales.columns = ['produto_id', 'vendas_media_diaria']
+        
+        # Todo produto com venda na janela de 7 dias também aparece na média diária
+        return avg_daily_sales.merge(
+            vendas_7d_metrics,
+            on='produto_id',
+            how='left'
+        ).merge(
+            vendas_7d_count,
+            on='produto_id',
+            how='left'
+        )
+    
+    @stage_timer("derive.estoque")
+    def derive_metrics(self, stock_df: pd.DataFrame, sales_metrics: pd.DataFrame) -> pd.DataFrame:
+        """
+        Junta as vendas agregadas ao estoque e calcula ruptura e reposição
+        
+        Args:
+            stock_df: Estoque
+            sales_metrics: Saída de aggregate_sales()
+        """
+        # Merge com estoque
+        analysis = stock_df.merge(
+            sales_metrics,
+            on='produto_id',
+            how='left'
+        )
+        
+        # Preencher NaN com 0
+        analysis['vendas_media_diaria'] = analysis['vendas_media_diaria'].fillna(0)
+        analysis['vendas_7d_quantidade'] = analysis['vendas_7d_quantidade'].fillna(0)
+        analysis['vendas_7d_receita'] = analysis['vendas_7d_receita'].fillna(0)
+        analysis['vendas_7d'] = analysis['vendas_7d'].fillna(0)
+        
+        # Calcular dias até ruptura
+        analysis['dias_ate_ruptura'] = (
+            analysis['quantidade_atual'] / 
+            (analysis['vendas_media_diaria'] + 0.001)
+        )
+        
+        # Calcular quantidade sugerida para reposição
+        # Sugestão = (vendas_media_diaria * lead_time) + estoque_minimo - estoque_atual
+        lead_time = self.policy.values_for(analysis, 'lead_time')  # dias (política)
+        analysis['quantidade_sugerida'] = (
+            (analysis['vendas_media_diaria'] * lead_time) + 
+            analysis['quantidade_minima'] - 
+            analysis['quantidade_atual']
+        )
+        analysis['quantidade_sugerida'] = analysis['quantidade_sugerida'].clip(lower=0)
+        
+        # Calcular custo de reposição
+        analysis['custo_reposicao'] = (
+            analysis['quantidade_sugerida'] * 
+            analysis['custo_unitario']
+        )
+        
+        return analysis
+    
+    @stage_timer("score.estoque")
+    def score(self, analysis: pd.DataFrame) -> pd.DataFrame:
+        """
+        Classifica urgência, gera alertas e ordena os produtos
+        
+        Args:
+            analysis: Saída de build_metrics() (de uma ou mais partições)
+        """
+        # Classificar urgência
+        analysis['urgencia_reposicao'] = self._classify_urgency(analysis)
+        
+        # Calcular score de reposição
+        analysis['score_reposicao'] = self._calculate_reorder_score(analysis)
+        
+        # RF-06: Gerar alertas de oportunidade
+        # Ex: "Item X teve 30 compras no período de 7 dias. Considere uma reposição de estoque"
+        def gerar_alerta(row):
+            alertas = []
+            
+            # Alerta de alta demanda recente
+            if row['vendas_7d'] >= 20:  # 20 ou mais transações em 7 dias
+                alertas.append(
+                    f"⚠️ Alta demanda: {int(row['vendas_7d'])} compras nos últimos 7 dias. "
+                    f"Considere uma reposição de estoque."
+                )
+            elif row['vendas_7d'] >= 10:  # 10-19 transações
+                alertas.append(
+                    f"📈 Demanda crescente: {int(row['vendas_7d'])} compras nos últimos 7 dias. "
+                    f"Monitore o estoque."
+                )
+            
+            # Alerta de estoque baixo com alta venda
+            if row['quantidade_atual'] < row['quantidade_minima'] and row['vendas_7d_quantidade'] > 0:
+                alertas.append(
+                    f"🔴 Estoque crítico: {int(row['quantidade_atual'])} unidades "
+                    f"(mínimo: {int(row['quantidade_minima'])}). "
+                    f"Reposição urgente recomendada."
+                )
+            
+            # Alerta de ruptura iminente
+            if row['dias_ate_ruptura'] < 7 and row['vendas_media_diaria'] > 0:
+                alertas.append(
+                    f"⏰ Ruptura prevista em {row['dias_ate_ruptura']:.1f} dias. "
+                    f"Repor {int(row['quantidade_sugerida'])} unidades."
+                )
+            
+            return ' | '.join(alertas) if alertas else None
+        
+        analysis['alerta_oportunidade'] = analysis.apply(gerar_alerta, axis=1)
+        
+        # Adicionar recomendações
+        analysis['recomendacao_reposicao'] = analysis.apply(
+            lambda x: f"Repor {x['quantidade_sugerida']} unidades" if x['quantidade_sugerida'] > 0 else "Estoque adequado",
+            axis=1
+        )
+        
+        # Ordenar por urgência e score
+        analysis = analysis.sort_values(
+            ['urgencia_reposicao', 'score_reposicao'],
+            ascending=[False, False]
+        )
+        
+        # Selecionar colunas relevantes (loja_id só existe na análise por loja)
+        store_cols = ['loja_id'] if 'loja_id' in analysis.columns else []
+        result = analysis[store_cols + [
+            'produto_id',
+            'produto_nome',
+            'quantidade_atual',
+            'quantidade_minima',
+            'vendas_media_diaria',
+            'vendas_7d',
+            'vendas_7d_quantidade',
+            'vendas_7d_receita',
+            'dias_ate_ruptura',
+            'quantidade_sugerida',
+            'custo_reposicao',
+            'custo_unitario',
+            'urgencia_reposicao',
+            'score_reposicao',
+            'recomendacao_reposicao',
+            'alerta_oportunidade'
+        ]]
+        
+        return result.fillna(0)
+    
+    def _urgency_conditions(self, analysis: pd.DataFrame) -> list:
+        """Condições Crítica / Alta / Média com os multiplicadores da política"""
+        quantidade_atual = analysis['quantidade_atual']
+        quantidade_minima = analysis['quantidade_minima']
+        multiplicador_alta = self.policy.values_for(analysis, 'multiplicador_alta')
+        multiplicador_media = self.policy.values_for(analysis, 'multiplicador_media')
+        
+        return [
+            quantidade_atual < quantidade_minima,
+            quantidade_atual <= quantidade_minima * multiplicador_alta,
+            quantidade_atual <= quantidade_minima * multiplicador_media,
+        ]
+    
+    def _classify_urgency(self, analysis: pd.DataFrame) -> pd.Series:
         """
         Classifica urgência de reposição baseado em percentual acima do estoque mínimo
         
-        Regras:
+        Regras (multiplicadores padrão da política):
         - Crítica: abaixo do estoque mínimo
         - Alta: até 10% acima do estoque mínimo
         - Média: até 40% acima do estoque mínimo
         - Baixa: mais de 40% acima do estoque mínimo
         """
-        quantidade_atual = row['quantidade_atual']
-        quantidade_minima = row['quantidade_minima']
-        
-        # Calcular percentual acima do mínimo
-        if quantidade_atual < quantidade_minima:
-            return 'Crítica'
-        elif quantidade_atual <= quantidade_minima * 1.1:  # Até 10% acima
-            return 'Alta'
-        elif quantidade_atual <= quantidade_minima * 1.4:  # Até 40% acima
-            return 'Média'
-        else:  # Mais de 40% acima
-            return 'Baixa'
+        return pd.Series(
+            np.select(self._urgency_conditions(analysis), ['Crítica', 'Alta', 'Média'], default='Baixa'),
+            index=analysis.index
+        )
     
-    def _calculate_reorder_score(self, row) -> float:
+    def _calculate_reorder_score(self, analysis: pd.DataFrame) -> pd.Series:
         """
         Calcula score de reposição (0-1) baseado na urgência
         
@@ -213,15 +285,8 @@ class StockAnalyzer:
         - Média: 0.5
         - Baixa: 0.2
         """
-        quantidade_atual = row['quantidade_atual']
-        quantidade_minima = row['quantidade_minima']
-        
-        if quantidade_atual < quantidade_minima:
-            return 1.0  # Crítica
-        elif quantidade_atual <= quantidade_minima * 1.1:
-            return 0.8  # Alta
-        elif quantidade_atual <= quantidade_minima * 1.4:
-            return 0.5  # Média
-        else:
-            return 0.2  # Baixa
+        return pd.Series(
+            np.select(self._urgency_conditions(analysis), [1.0, 0.8, 0.5], default=0.2),
+            index=analysis.index
+        )
 
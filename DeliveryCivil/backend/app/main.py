@@ -2,16 +2,26 @@
 FastAPI Application - DeliveryCivil SAD
 Sistema de Apoio à Decisão para análise de vendas, estoque e promoções
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
 import uvicorn
 import os
 from dotenv import load_dotenv
 
-from app.api.routes import datasets, analytics, reports
+from app.api.routes import datasets, analytics, reports, exports, profiles, events
 from app.config import settings
-from app.utils.logger import setup_logging
+from app.utils.logger import RequestContextMiddleware, setup_logging, stop_logging
+from app.services.export_jobs import export_jobs
+from app.services.metrics import MetricsMiddleware, PROMETHEUS_MEDIA_TYPE, metrics_sharing, registry
+from app.services.profiling import ProfilingMiddleware
+from app.services.memory import MemoryBudgetMiddleware
+from app.services.admission import AdmissionMiddleware
+from app.services.warmup import start_warmup, warmup_state
+from app.services.analysis_events import analysis_events
+from app.etl.transform.sharded_analyzer import shard_pool
 
 # Configurar logging
 setup_logging()
@@ -19,14 +29,54 @@ setup_logging()
 # Carregar variáveis de ambiente
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ciclo de vida da aplicação"""
+    # Aquecer em segundo plano: /health responde desde já, /ready só ao final
+    start_warmup(app)
+    # Cópia periódica das métricas deste worker (o /metrics soma todos os workers)
+    metrics_sharing.start()
+    # Novos dados: análises recalculadas uma vez e evento no stream SSE
+    analysis_events.start(app)
+    yield
+    analysis_events.stop()
+    # Aguardar exportações em andamento antes de encerrar
+    export_jobs.shutdown(wait=True)
+    # Encerrar os processos da análise particionada
+    shard_pool.shutdown()
+    metrics_sharing.stop()
+    # Escrever os registros de log pendentes
+    stop_logging()
+
 # Criar aplicação FastAPI
 app = FastAPI(
     title="DeliveryCivil SAD API",
     description="API para Sistema de Apoio à Decisão - Análise de Vendas, Estoque e Promoções",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Configurar CORS
+# Compressão gzip das respostas sem cache (as análises em cache já saem comprimidas
+# com Content-Encoding e não são comprimidas de novo)
+app.add_middleware(GZipMiddleware, minimum_size=settings.RESPONSE_COMPRESS_MIN_BYTES)
+
+# Orçamento de memória por requisição (MEMORY_REQUEST_BUDGET_MB)
+app.add_middleware(MemoryBudgetMiddleware)
+
+# Perfil sob demanda das rotas de análise e upload (?profile=cpu|mem, restrito a administradores)
+app.add_middleware(ProfilingMiddleware)
+
+# Filas por custo estimado: análises e uploads em threads próprias, fora do event loop
+app.add_middleware(AdmissionMiddleware)
+
+# Duração das requisições por rota (inclui a espera na fila e a compressão)
+app.add_middleware(MetricsMiddleware)
+
+# X-Request-ID e registro de acesso com a duração de cada etapa
+app.add_middleware(RequestContextMiddleware)
+
+# CORS por último (mais externo): as respostas geradas pelos middlewares, como o 503
+# da admissão e o 400/403 do perfil, também levam Access-Control-Allow-Origin
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -39,6 +89,9 @@ app.add_middleware(
 app.include_router(datasets.router, prefix="/api", tags=["Datasets"])
 app.include_router(analytics.router, prefix="/api", tags=["Analytics"])
 app.include_router(reports.router, prefix="/api", tags=["Reports"])
+app.include_router(exports.router, prefix="/api", tags=["Exports"])
+app.include_router(profiles.router, prefix="/api", tags=["Profiles"])
+app.include_router(events.router, prefix="/api", tags=["Events"])
 
 @app.get("/")
 async def root():
@@ -54,6 +107,18 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 somente após o aquecimento deste worker"""
+    if not warmup_state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "warmup": warmup_state.to_dict()})
+    return {"status": "ready", "warmup": warmup_state.to_dict()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas no formato de exposição do Prometheus"""
+    return Response(content=registry.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Handler global de exceções"""
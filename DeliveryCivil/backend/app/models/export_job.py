@@ -0,0 +1,25 @@
+"""
+Modelo de Job de Exportação (Power BI em segundo plano)
+"""
+from pydantic import BaseModel, Field
+from typing import Dict, Optional
+from datetime import datetime
+
+
+class ExportJob(BaseModel):
+    """Estado de uma exportação de tabela para o Power BI"""
+    job_id: str = Field(..., description="ID do job")
+    table_name: str = Field(..., description="Tabela exportada")
+    fingerprint: str = Field(..., description="Fingerprint dos datasets de origem")
+    status: str = Field("queued", description="queued, running, completed ou failed")
+    rows: int = Field(0, ge=0, description="Registros exportados")
+    created_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    files: Dict[str, str] = Field(default_factory=dict, description="Formato -> caminho do arquivo")
+    powerbi_push: Optional[Dict] = Field(None, description="Resultado do envio ao push dataset (POWER_BI_PUSH_ENABLED)")
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
@@ -0,0 +1,141 @@
+"""
+Modelo de Política de Análise (limiares de negócio configuráveis)
+"""
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from pathlib import Path
+import json
+import pandas as pd
+
+
+class StockPolicy(BaseModel):
+    """Limiares da análise de reposição de estoque"""
+    lead_time: int = Field(7, ge=0, description="Dias de cobertura na quantidade sugerida")
+    multiplicador_alta: float = Field(1.1, ge=1, description="Urgência Alta até N x o estoque mínimo")
+    multiplicador_media: float = Field(1.4, ge=1, description="Urgência Média até N x o estoque mínimo")
+
+
+class PromotionPolicy(BaseModel):
+    """Limiares da análise de promoção"""
+    janela_curta_dias: int = Field(30, gt=0, description="Janela de vendas recentes")
+    janela_longa_dias: int = Field(90, gt=0, description="Janela para considerar o produto encalhado")
+    vendas_minimas: int = Field(5, ge=0, description="Promoção se vendas na janela curta < N")
+    estoque_minimo_promocao: int = Field(20, ge=0, description="Promoção se estoque > N")
+    fator_excedente: float = Field(3.0, gt=0, description="Excedente se estoque > N x vendas da janela curta")
+
+
+class CashbackPolicy(BaseModel):
+    """Limiares da análise de cashback"""
+    score_alta: float = Field(0.7, ge=0, le=1, description="Recomendação Alta se score > N")
+    score_media: float = Field(0.4, ge=0, le=1, description="Recomendação Média se score > N")
+
+
+class PolicyOverride(BaseModel):
+    """Sobrescrita de limiares para uma categoria ou produto (campos ausentes herdam)"""
+    lead_time: Optional[int] = Field(None, ge=0)
+    multiplicador_alta: Optional[float] = Field(None, ge=1)
+    multiplicador_media: Optional[float] = Field(None, ge=1)
+    vendas_minimas: Optional[int] = Field(None, ge=0)
+    estoque_minimo_promocao: Optional[int] = Field(None, ge=0)
+    fator_excedente: Optional[float] = Field(None, gt=0)
+    score_alta: Optional[float] = Field(None, ge=0, le=1)
+    score_media: Optional[float] = Field(None, ge=0, le=1)
+
+
+# Campo sobrescrevível -> seção da política onde está o valor padrão
+OVERRIDABLE_FIELDS = {
+    'lead_time': 'estoque',
+    'multiplicador_alta': 'estoque',
+    'multiplicador_media': 'estoque',
+    'vendas_minimas': 'promocao',
+    'estoque_minimo_promocao': 'promocao',
+    'fator_excedente': 'promocao',
+    'score_alta': 'cashback',
+    'score_media': 'cashback',
+}
+
+
+class AnalysisPolicy(BaseModel):
+    """
+    Política de análise: limiares globais + sobrescritas por categoria e produto
+
+    Precedência: produto > categoria (coluna opcional 'categoria' do estoque) > global.
+    As janelas de tempo da promoção são sempre globais, pois definem a agregação.
+    """
+    nome: str = "padrao"
+    estoque: StockPolicy = StockPolicy()
+    promocao: PromotionPolicy = PromotionPolicy()
+    cashback: CashbackPolicy = CashbackPolicy()
+    por_categoria: Dict[str, PolicyOverride] = {}
+    por_produto: Dict[int, PolicyOverride] = {}
+
+    def values_for(self, analysis: pd.DataFrame, field: str) -> pd.Series:
+        """
+        Resolve o limiar de cada linha (produto) já aplicando as sobrescritas
+
+        Args:
+            analysis: DataFrame com produto_id (e opcionalmente categoria)
+            field: Nome do limiar (ver OVERRIDABLE_FIELDS)
+
+        Returns:
+            Series alinhada ao índice de analysis
+        """
+        default = getattr(getattr(self, OVERRIDABLE_FIELDS[field]), field)
+        values = pd.Series(default, index=analysis.index, dtype='float64')
+
+        if self.por_categoria and 'categoria' in analysis.columns:
+            category_values = {
+                categoria: getattr(override, field)
+                for categoria, override in self.por_categoria.items()
+                if getattr(override, field) is not None
+            }
+            if category_values:
+                mapped = analysis['categoria'].map(category_values)
+                values = mapped.astype('float64').fillna(values)
+
+        if self.por_produto:
+            product_values = {
+                produto_id: getattr(override, field)
+                for produto_id, override in self.por_produto.items()
+                if getattr(override, field) is not None
+            }
+            if product_values:
+                mapped = analysis['produto_id'].map(product_values)
+                values = mapped.astype('float64').fillna(values)
+
+        return values
+
+    def analysis_params(self, analysis: str) -> dict:
+        """
+        Limiares que afetam uma análise: a seção dela e as sobrescritas dos seus campos
+
+        Usado como chave de cache: mudar um limiar do estoque não invalida a promoção.
+        """
+        fields = [field for field, section in OVERRIDABLE_FIELDS.items() if section == analysis]
+
+        def overrides(items: Dict) -> Dict:
+            selected = {}
+            for key, override in items.items():
+                values = {field: getattr(override, field) for field in fields if getattr(override, field) is not None}
+                if values:
+                    selected[str(key)] = values
+            return selected
+
+        return {
+            analysis: getattr(self, analysis).model_dump(),
+            "por_categoria": overrides(self.por_categoria),
+            "por_produto": overrides(self.por_produto),
+        }
+
+    @classmethod
+    def from_file(cls, path: str) -> "AnalysisPolicy":
+        """Carrega uma política de um arquivo JSON"""
+        with open(Path(path), 'r', encoding='utf-8') as f:
+            return cls.model_validate(json.load(f))
+
+
+class BatchAnalysisRequest(BaseModel):
+    """Requisição de análise em lote (N políticas sobre os mesmos dados)"""
+    policies: List[AnalysisPolicy] = Field(..., min_length=1, max_length=50)
+    analyses: List[str] = ['promocao', 'estoque', 'cashback']
+    top_n: int = Field(20, ge=0, le=500, description="Produtos retornados por análise e política")
@@ -0,0 +1,489 @@
+"""
+Controle de admissão por custo e filas justas ponderadas por tipo de rota
+
+Cada requisição da API entra em uma fila (lane):
+- interactive: leituras baratas (listas, exportações, análises já em cache)
+- analysis: análises que leem os datasets
+- ingest: uploads de CSV
+
+O custo é estimado em linhas a processar: o número de registros dos
+datasets mais recentes (índice de uploads ou estimativa pelo tamanho do
+arquivo) vezes as passadas da rota, ou o tamanho do upload. As filas são
+atendidas por ordem de tag virtual (start-time fair queuing): cada fila
+avança custo / peso a cada requisição, então uma rajada de /summary não
+passa na frente das leituras interativas nem dos uploads, e vice-versa.
+
+ADMISSION_MAX_COST é dividido entre as leituras interativas (fração
+ADMISSION_INTERACTIVE_RESERVE) e as análises/uploads (o restante): cada
+grupo só é limitado pelo próprio custo em processamento, então uma análise
+grande não atrasa as leituras baratas. O custo de uma análise ou upload é
+limitado ao orçamento das pesadas, e elas só são admitidas se o cliente
+não tiver ADMISSION_CLIENT_MAX_CONCURRENT requisições pesadas em andamento. As análises e uploads admitidos rodam em threads
+próprias, cada uma com seu event loop (como no aquecimento): as rotas são
+síncronas por dentro e bloqueariam o loop que responde /health e as
+leituras interativas.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.metrics import registry
+from app.services.uploads import latest_dataset_file, upload_index
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+ANALYSIS = "analysis"
+INGEST = "ingest"
+LANES = (INTERACTIVE, ANALYSIS, INGEST)
+
+# Custo de uma leitura interativa (em linhas)
+INTERACTIVE_COST = 1_000
+
+# Bytes lidos do início do CSV para estimar o tamanho médio de uma linha
+ROW_SAMPLE_BYTES = 64 * 1024
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+ADMISSION_WAIT = registry.histogram(
+    "deliverycivil_admission_wait_seconds",
+    "Tempo na fila de admissão por lane",
+    ["lane"],
+    buckets=QUEUE_WAIT_BUCKETS
+)
+ADMISSION_REJECTED = registry.counter(
+    "deliverycivil_admission_rejected_total",
+    "Requisições recusadas pelo controle de admissão (503), por lane e motivo",
+    ["lane", "reason"]
+)
+ADMISSION_QUEUED = registry.gauge(
+    "deliverycivil_admission_queued",
+    "Requisições aguardando admissão por lane",
+    ["lane"]
+)
+ADMISSION_IN_FLIGHT_COST = registry.gauge(
+    "deliverycivil_admission_in_flight_cost",
+    "Custo estimado (linhas) das requisições em andamento por lane",
+    ["lane"]
+)
+
+
+class AdmissionRejectedError(Exception):
+    """Fila cheia ou tempo de espera esgotado (HTTP 503)"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+# (método, caminho) -> (lane, estimador de custo)
+_route_costs: Dict[Tuple[str, str], Tuple[str, Callable[[dict], Optional[float]]]] = {}
+
+
+def register_cost(method: str, path: str, lane: str, estimator: Callable[[dict], Optional[float]]):
+    """
+    Declara a lane e o estimador de custo de uma rota (caminho completo, ex: /api/analytics/summary)
+
+    O estimador recebe o scope ASGI e devolve o custo em linhas, ou None
+    quando a requisição é barata (ex: resposta em cache) e entra como
+    leitura interativa. Rotas não registradas são leituras interativas.
+    """
+    _route_costs[(method, path)] = (lane, estimator)
+
+
+# (método, caminho) fora do controle de admissão
+_exempt_routes: Set[Tuple[str, str]] = set()
+
+
+def exempt_route(method: str, path: str):
+    """
+    Tira uma rota do controle de admissão (caminho completo)
+
+    Para conexões longas que quase não processam (ex: stream SSE): uma vaga
+    presa por minutos atrasaria as leituras interativas.
+    """
+    _exempt_routes.add((method, path))
+
+
+def max_concurrent() -> int:
+    """Análises/uploads simultâneos (ADMISSION_MAX_CONCURRENT; 0 = número de CPUs)"""
+    return settings.ADMISSION_MAX_CONCURRENT or os.cpu_count() or 1
+
+
+# (caminho, mtime, tamanho) -> (linhas, bytes por linha)
+_row_estimates: Dict[Tuple[str, int, int], Tuple[int, float]] = {}
+_row_estimates_lock = threading.Lock()
+
+
+def file_rows(path: Path, dataset: str) -> Tuple[int, float]:
+    """
+    Registros do CSV e bytes médios por linha
+
+    A contagem vem do índice de uploads quando o arquivo foi enviado pela
+    API; senão é estimada pelo tamanho médio das primeiras linhas.
+    """
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _row_estimates_lock:
+        cached = _row_estimates.get(key)
+    if cached is not None:
+        return cached
+
+    with open(path, "rb") as f:
+        sample = f.read(ROW_SAMPLE_BYTES)
+    lines = max(1, sample.count(b"\n"))
+    bytes_per_row = max(1.0, len(sample) / lines)
+    rows = upload_index.records_count(dataset, path.name)
+    if rows is None:
+        rows = int(stat.st_size / bytes_per_row)
+
+    with _row_estimates_lock:
+        # Uma entrada por arquivo: versões antigas saem ao chegar a nova
+        for old_key in [old for old in _row_estimates if old[0] == key[0]]:
+            del _row_estimates[old_key]
+        _row_estimates[key] = (rows, bytes_per_row)
+    return rows, bytes_per_row
+
+
+def dataset_rows(dataset: str) -> Optional[int]:
+    """Registros do arquivo mais recente do dataset (None se não há arquivo)"""
+    path = latest_dataset_file(dataset)
+    if path is None:
+        return None
+    try:
+        return file_rows(path, dataset)[0]
+    except OSError:
+        return None
+
+
+def upload_rows(scope: dict, dataset: str) -> float:
+    """
+    Registros estimados de um upload pelo Content-Length e pelo tamanho de
+    linha do dataset atual (sem Content-Length: registros do dataset atual)
+    """
+    headers = dict(scope.get("headers") or [])
+    try:
+        size = int(headers.get(b"content-length", b""))
+    except ValueError:
+        return float(dataset_rows(dataset) or INTERACTIVE_COST)
+    bytes_per_row = 100.0
+    path = latest_dataset_file(dataset)
+    if path is not None:
+        try:
+            bytes_per_row = file_rows(path, dataset)[1]
+        except OSError:
+            pass
+    return size / bytes_per_row
+
+
+class Ticket:
+    """Uma requisição na fila de admissão (ou em andamento)"""
+
+    __slots__ = ("lane", "client", "cost", "tag", "loop", "future", "enqueued_at")
+
+    def __init__(self, lane: str, client: str, cost: float, loop: asyncio.AbstractEventLoop):
+        self.lane = lane
+        self.client = client
+        self.cost = cost
+        self.tag = 0.0
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued_at = time.perf_counter()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Filas por lane com start-time fair queuing e limites de custo e por cliente
+
+    O estado é protegido por um lock de thread: o aquecimento faz
+    requisições a partir do event loop de outra thread, e cada requisição
+    é acordada no loop em que está esperando.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[Ticket]] = {lane: deque() for lane in LANES}
+        self._lane_finish: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._virtual_time = 0.0
+        self._cost: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._clients: Dict[str, int] = {}
+
+    @staticmethod
+    def _weight(lane: str) -> float:
+        return max(settings.ADMISSION_LANE_WEIGHTS.get(lane, 1.0), 1e-6)
+
+    def _heavy_running(self) -> int:
+        return self._running[ANALYSIS] + self._running[INGEST]
+
+    def _heavy_cost(self) -> float:
+        return self._cost[ANALYSIS] + self._cost[INGEST]
+
+    def _client_allowed(self, ticket: Ticket) -> bool:
+        limit = settings.ADMISSION_CLIENT_MAX_CONCURRENT
+        return ticket.lane == INTERACTIVE or limit <= 0 or self._clients.get(ticket.client, 0) < limit
+
+    @staticmethod
+    def _interactive_limit() -> float:
+        return settings.ADMISSION_MAX_COST * settings.ADMISSION_INTERACTIVE_RESERVE
+
+    @staticmethod
+    def _heavy_limit() -> float:
+        return settings.ADMISSION_MAX_COST * (1.0 - settings.ADMISSION_INTERACTIVE_RESERVE)
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if ticket.lane == INTERACTIVE:
+            # Orçamento próprio: análises e uploads em andamento não atrasam as leituras interativas
+            return (
+                self._running[INTERACTIVE] == 0
+                or self._cost[INTERACTIVE] + ticket.cost <= self._interactive_limit()
+            )
+        if self._heavy_running() >= max_concurrent():
+            return False
+        # Requisição maior que o limite sozinha (custo já limitado a ele): admitida quando nenhuma outra pesada está em andamento
+        return self._heavy_running() == 0 or self._heavy_cost() + ticket.cost <= self._heavy_limit()
+
+    def _admit(self, ticket: Ticket):
+        self._queues[ticket.lane].remove(ticket)
+        self._virtual_time = max(self._virtual_time, ticket.tag)
+        self._cost[ticket.lane] += ticket.cost
+        self._running[ticket.lane] += 1
+        if ticket.lane != INTERACTIVE:
+            self._clients[ticket.client] = self._clients.get(ticket.client, 0) + 1
+        ticket.loop.call_soon_threadsafe(_wake, ticket.future)
+
+    def _dispatch(self):
+        """Admite, por ordem de tag, as requisições que cabem (com o lock)"""
+        while True:
+            candidates = []
+            for queue in self._queues.values():
+                # Primeira requisição da lane cujo cliente está abaixo do limite
+                ticket = next((ticket for ticket in queue if self._client_allowed(ticket)), None)
+                if ticket is not None:
+                    candidates.append(ticket)
+            admitted = False
+            heavy_blocked = False
+            for ticket in sorted(candidates, key=lambda ticket: ticket.tag):
+                if ticket.lane != INTERACTIVE and heavy_blocked:
+                    continue
+                if self._fits(ticket):
+                    self._admit(ticket)
+                    admitted = True
+                    break
+                if ticket.lane != INTERACTIVE:
+                    # Pesadas menores não ultrapassam a que está esperando espaço
+                    heavy_blocked = True
+            if not admitted:
+                break
+        self._publish_gauges()
+
+    def _publish_gauges(self):
+        if not settings.METRICS_ENABLED:
+            return
+        for lane in LANES:
+            ADMISSION_QUEUED.set(len(self._queues[lane]), lane)
+            ADMISSION_IN_FLIGHT_COST.set(self._cost[lane], lane)
+
+    async def acquire(self, lane: str, client: str, cost: float) -> Ticket:
+        """
+        Espera a vez da requisição na lane
+
+        Raises:
+            AdmissionRejectedError: Fila cheia ou ADMISSION_QUEUE_TIMEOUT esgotado
+        """
+        if lane != INTERACTIVE:
+            # Uma requisição estimada acima do orçamento das pesadas não o ultrapassa
+            cost = min(cost, self._heavy_limit())
+        ticket = Ticket(lane, client, cost, asyncio.get_running_loop())
+        with self._lock:
+            ticket.tag = max(self._virtual_time, self._lane_finish[lane])
+            self._queues[lane].append(ticket)
+            self._dispatch()
+            # Só recusa quem teria de esperar: o que é admitido de imediato não ocupa a fila
+            if ticket in self._queues[lane] and sum(len(queue) for queue in self._queues.values()) > settings.ADMISSION_MAX_QUEUED:
+                self._queues[lane].remove(ticket)
+                self._reject(lane, "queue_full")
+                self._publish_gauges()
+                raise AdmissionRejectedError("Servidor ocupado: fila de requisições cheia", "queue_full")
+            self._lane_finish[lane] = ticket.tag + cost / self._weight(lane)
+
+        timeout = settings.ADMISSION_QUEUE_TIMEOUT or None
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if ticket in self._queues[lane]:
+                    self._queues[lane].remove(ticket)
+                    self._reject(lane, "timeout")
+                    self._dispatch()
+                    raise AdmissionRejectedError(
+                        f"Servidor ocupado: requisição aguardou mais de {settings.ADMISSION_QUEUE_TIMEOUT:.0f}s na fila",
+                        "timeout"
+                    )
+        except asyncio.CancelledError:
+            # Cliente desconectou ou servidor encerrando: sai da fila ou devolve a vaga
+            with self._lock:
+                if ticket in self._queues[lane]:
+                    self._queues[lane].remove(ticket)
+                    self._dispatch()
+                    raise
+            self.release(ticket)
+            raise
+
+        if settings.METRICS_ENABLED:
+            ADMISSION_WAIT.observe(time.perf_counter() - ticket.enqueued_at, lane)
+        return ticket
+
+    def _reject(self, lane: str, reason: str):
+        if settings.METRICS_ENABLED:
+            ADMISSION_REJECTED.inc(1, lane, reason)
+        logger.warning(f"🚦 Requisição recusada na fila {lane}: {reason}")
+
+    def release(self, ticket: Ticket):
+        """Requisição terminou: devolve o custo e a vaga do cliente"""
+        with self._lock:
+            self._cost[ticket.lane] = max(0.0, self._cost[ticket.lane] - ticket.cost)
+            self._running[ticket.lane] -= 1
+            if ticket.lane != INTERACTIVE:
+                remaining = self._clients.get(ticket.client, 0) - 1
+                if remaining > 0:
+                    self._clients[ticket.client] = remaining
+                else:
+                    self._clients.pop(ticket.client, None)
+            self._dispatch()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                lane: {
+                    "queued": len(self._queues[lane]),
+                    "running": self._running[lane],
+                    "cost": self._cost[lane]
+                }
+                for lane in LANES
+            }
+
+
+admission_controller = AdmissionController()
+
+
+def _route_admission(scope) -> Tuple[str, Optional[float]]:
+    """Lane e custo da requisição pela rota registrada (None = leitura interativa)"""
+    registered = _route_costs.get((scope["method"], scope["path"].rstrip("/") or "/"))
+    if registered is None:
+        return INTERACTIVE, None
+    lane, estimator = registered
+    try:
+        return lane, estimator(scope)
+    except Exception as e:
+        logger.debug(f"Estimativa de custo falhou para {scope['path']}: {str(e)}")
+        return lane, None
+
+
+def _client_id(scope) -> str:
+    """Cliente para o limite de concorrência: header X-Client-ID ou IP"""
+    for name, value in scope.get("headers") or ():
+        if name == b"x-client-id" and value:
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "anonymous"
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI que enfileira as requisições da API por lane e custo
+
+    As requisições pesadas admitidas rodam em ADMISSION_MAX_CONCURRENT
+    threads; receive/send são repassados ao event loop da conexão.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max_concurrent(),
+                    thread_name_prefix="admission"
+                )
+            return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.ADMISSION_ENABLED
+            or scope["method"] == "OPTIONS"
+            or not scope["path"].startswith("/api/")
+            or (scope["method"], scope["path"].rstrip("/")) in _exempt_routes
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        lane, cost = _route_admission(scope)
+        if cost is None:
+            lane, cost = INTERACTIVE, INTERACTIVE_COST
+
+        try:
+            ticket = await admission_controller.acquire(lane, _client_id(scope), cost)
+        except AdmissionRejectedError as e:
+            await _send_busy(send, str(e))
+            return
+
+        if lane == INTERACTIVE:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                admission_controller.release(ticket)
+        else:
+            await self._run_in_thread(scope, receive, send, ticket)
+
+    async def _run_in_thread(self, scope, receive, send, ticket: Ticket):
+        loop = asyncio.get_running_loop()
+
+        async def thread_receive():
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(receive(), loop))
+
+        async def thread_send(message):
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(send(message), loop))
+
+        def run():
+            asyncio.run(self.app(scope, thread_receive, thread_send))
+
+        # Copia do contexto: request_id e etapas da requisição seguem para a thread
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self._get_executor(), context.run, run)
+        # A vaga só é devolvida quando a thread termina, mesmo que esta espera seja cancelada
+        future.add_done_callback(lambda _: admission_controller.release(ticket))
+        await future
+
+
+async def _send_busy(send, message: str):
+    body = json.dumps({"detail": message}, ensure_ascii=False).encode("utf-8")
+    retry_after = str(max(1, int(settings.ADMISSION_QUEUE_TIMEOUT / 2)))
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode()),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
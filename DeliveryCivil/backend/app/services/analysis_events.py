@@ -0,0 +1,248 @@
+"""
+Eventos de atualização das análises (Server-Sent Events)
+
+Uma thread por worker verifica a cada ANALYSIS_EVENTS_POLL_SECONDS se os
+arquivos mais recentes de vendas/estoque (ou a política) mudaram, só com
+stat. Quando mudam, publica "dataset_changed", refaz as requisições de
+WARMUP_PATHS (as análises são calculadas uma vez e ficam no cache de
+respostas) e publica "analysis_ready" com a versão N. Os clientes do
+stream buscam as análises só ao receber o evento, e a busca é um acerto
+de cache.
+
+A versão é numerada em DATA_PROCESSED_DIR/analysis_versions.json (com
+lock entre processos): todos os workers dão o mesmo N aos mesmos
+arquivos. O evento "analysis_ready" leva também as linhas do topo de cada
+análise que mudaram em relação à versão anterior (?top=N no stream).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from app.config import settings
+from app.etl.load.powerbi_loader import write_json_file
+from app.services.admission import latest_dataset_file
+from app.services.fingerprint import dataset_fingerprint
+from app.utils.file_lock import FileLock
+from app.services.warmup import warmup_state
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_FILE = "analysis_versions.json"
+VERSIONS_KEEP = 100
+
+# Eventos pendentes por assinante: um cliente lento perde os mais antigos (o mais recente basta)
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class VersionStore:
+    """Número de versão de cada fingerprint dos datasets, compartilhado entre os workers"""
+
+    @staticmethod
+    def _path() -> Path:
+        return Path(settings.DATA_PROCESSED_DIR) / VERSIONS_FILE
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"versions": []}
+
+    def assign(self, fingerprint: str) -> int:
+        """Versão já dada a este fingerprint, ou a próxima"""
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with FileLock(path.with_suffix(".lock")):
+            state = self._read()
+            versions = state.get("versions", [])
+            for entry in versions:
+                if entry["fingerprint"] == fingerprint:
+                    return entry["version"]
+            version = max((entry["version"] for entry in versions), default=0) + 1
+            versions.append({"version": version, "fingerprint": fingerprint, "created_at": datetime.now().isoformat()})
+            state["versions"] = versions[-VERSIONS_KEEP:]
+            write_json_file(path, state)
+            return version
+
+
+version_store = VersionStore()
+
+
+def _row_key(record: dict):
+    return (record.get("produto_id"), record.get("loja_id"))
+
+
+def _changed_rows(previous: Optional[List[dict]], current: List[dict]) -> List[dict]:
+    """Linhas do topo novas ou com valores diferentes da versão anterior"""
+    if previous is None:
+        return current
+    before = {_row_key(record): record for record in previous}
+    return [record for record in current if before.get(_row_key(record)) != record]
+
+
+def format_event(event: dict, top: int = 0) -> str:
+    """Evento no formato text/event-stream (linhas alteradas limitadas a top; 0 = sem linhas)"""
+    data = dict(event["data"])
+    changed = data.pop("changed", None)
+    if changed is not None and top > 0:
+        data["changed"] = {name: rows[:top] for name, rows in changed.items()}
+    lines = []
+    if event.get("id") is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str))
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscriber:
+    """Conexão do stream: fila de eventos no event loop da conexão"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event: dict):
+        """Chamado no loop do assinante"""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class AnalysisEvents:
+    """Versão atual das análises deste worker e assinantes do stream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Set[Subscriber] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.fingerprint: Optional[str] = None
+        self.version: Optional[int] = None
+        self._ready_event: Optional[dict] = None
+        self._top_rows: Dict[str, List[dict]] = {}
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def current_event(self) -> Optional[dict]:
+        """Último "analysis_ready" (enviado a quem conecta sem tê-lo recebido)"""
+        with self._lock:
+            return self._ready_event
+
+    def publish(self, event: dict):
+        with self._lock:
+            if event["event"] == "analysis_ready":
+                self._ready_event = event
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+            except RuntimeError:
+                # Loop da conexão já encerrado
+                self.unsubscribe(subscriber)
+
+    def start(self, app):
+        """Inicia a verificação de novos dados em segundo plano (após o aquecimento)"""
+        if not settings.ANALYSIS_EVENTS_ENABLED or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._watch(app),), name="analysis-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def _sleep(self, seconds: float):
+        await asyncio.get_running_loop().run_in_executor(None, self._stop.wait, seconds)
+
+    async def _watch(self, app):
+        # As análises da inicialização ficam com o aquecimento
+        while not warmup_state.ready and not self._stop.is_set():
+            await self._sleep(0.5)
+        while not self._stop.is_set():
+            try:
+                await self._check(app)
+            except Exception as e:
+                logger.error(f"❌ Erro ao verificar novos dados das análises: {str(e)}", exc_info=True)
+            await self._sleep(settings.ANALYSIS_EVENTS_POLL_SECONDS)
+
+    async def _check(self, app):
+        files = {dataset: latest_dataset_file(dataset) for dataset in ("vendas", "estoque")}
+        if None in files.values():
+            return
+        paths = list(files.values())
+        if settings.ANALYSIS_POLICY_FILE:
+            paths.append(Path(settings.ANALYSIS_POLICY_FILE))
+        fingerprint = dataset_fingerprint(paths)
+        if fingerprint == self.fingerprint:
+            return
+
+        # Primeira verificação: os dados são os do aquecimento (só registra a versão atual)
+        first_check = self.fingerprint is None
+        self.fingerprint = fingerprint
+        version = version_store.assign(fingerprint)
+        if not first_check:
+            logger.info(f"🔔 Novos dados para as análises (versão {version})")
+            self.publish({"event": "dataset_changed", "data": {
+                "version": version,
+                "fingerprint": fingerprint,
+                "files": {dataset: path.name for dataset, path in files.items()}
+            }})
+
+        start = time.perf_counter()
+        results = await _request_paths(app, settings.WARMUP_PATHS, f"events-v{version}")
+        failed = {path: response.status_code for path, response in results if response.status_code >= 400}
+        if failed:
+            # Sem evento: a versão é tentada de novo só quando chegarem outros arquivos
+            logger.warning(f"⚠️ Análises da versão {version} falharam: {failed}")
+            return
+
+        changed = {}
+        for path, response in results:
+            products = response.json().get("products")
+            if products is None:
+                continue
+            name = path.rstrip("/").rsplit("/", 1)[-1]
+            changed[name] = _changed_rows(self._top_rows.get(name), products)[:settings.ANALYSIS_EVENTS_MAX_ROWS]
+            self._top_rows[name] = products
+        self.version = version
+        seconds = round(time.perf_counter() - start, 3)
+        logger.info(f"✅ Análises da versão {version} prontas em {seconds:.2f}s")
+        self.publish({"event": "analysis_ready", "id": version, "data": {
+            "version": version,
+            "fingerprint": fingerprint,
+            "ready_at": datetime.now().isoformat(),
+            "seconds": seconds,
+            "analyses": [path for path, _ in results],
+            "changed": changed
+        }})
+
+
+async def _request_paths(app, paths: List[str], request_id: str) -> List[tuple]:
+    """Requisições internas (ASGI, sem rede), como no aquecimento; para no primeiro 404"""
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://events", timeout=None) as client:
+        for path in paths:
+            response = await client.get(path, headers={"X-Request-ID": f"{request_id}{path.replace('/', '-')}"})
+            results.append((path, response))
+            if response.status_code == 404:
+                break
+    return results
+
+
+analysis_events = AnalysisEvents()
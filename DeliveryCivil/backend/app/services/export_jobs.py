@@ -0,0 +1,222 @@
+"""
+Fila de exportações para Power BI em segundo plano
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from app.config import settings
+from app.etl.load.powerbi_loader import PowerBILoader, write_json_file
+from app.models.export_job import ExportJob
+from app.services.powerbi_service import get_powerbi_service
+from app.utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+JOBS_FILE = "export_jobs.json"
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def export_table(df: pd.DataFrame, table_name: str) -> Dict:
+    """
+    Grava a tabela para o Power BI (e envia ao push dataset, se habilitado)
+
+    Returns:
+        {"files": caminhos gravados, "powerbi_push": resultado do push (opcional)}
+    """
+    files = PowerBILoader().save_for_powerbi(df, table_name)
+    result = {"files": files}
+    if settings.POWER_BI_PUSH_ENABLED:
+        result["powerbi_push"] = get_powerbi_service().push_rows_sync(df, table_name, replace=True)
+    return result
+
+
+class ExportQueueFullError(RuntimeError):
+    """Limite de exportações pendentes atingido"""
+
+
+class ExportJobManager:
+    """
+    Executa save_for_powerbi em um pool limitado de threads
+
+    A requisição recebe o job_id imediatamente. Um pedido para a mesma
+    tabela e o mesmo fingerprint dos dados enquanto um job equivalente
+    está na fila ou em execução reutiliza esse job.
+
+    Os jobs ficam em DATA_PROCESSED_DIR/export_jobs.json (com lock entre
+    processos): o status pode ser consultado em qualquer worker e a
+    reutilização vale entre workers. Cada registro guarda o pid e um id de
+    inicialização do worker que executa o job; jobs ativos de um worker que
+    não existe mais (inclusive um processo anterior com o mesmo pid) são
+    marcados como falhos.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, history: int):
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _path() -> Path:
+        return Path(settings.DATA_PROCESSED_DIR) / JOBS_FILE
+
+    def _read(self) -> List[dict]:
+        try:
+            with open(self._path(), "r", encoding="utf-8") as f:
+                return json.load(f).get("jobs", [])
+        except (OSError, ValueError):
+            return []
+
+    @contextmanager
+    def _records(self):
+        """Registros dos jobs para leitura e alteração, gravados ao final (com lock)"""
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, FileLock(path.with_suffix(".lock")):
+            records = self._read()
+            yield records
+            write_json_file(path, {"jobs": records})
+
+    def submit(self, df: pd.DataFrame, table_name: str, fingerprint: str) -> ExportJob:
+        """
+        Enfileira a exportação (ou retorna o job equivalente em andamento)
+
+        Args:
+            df: Resultado da análise (não deve ser alterado depois)
+            table_name: Nome da tabela no Power BI
+            fingerprint: Fingerprint dos datasets que geraram o resultado
+
+        Returns:
+            Job criado ou reutilizado
+        """
+        return self.submit_task(table_name, fingerprint, lambda: export_table(df, table_name), rows=len(df))
+
+    def submit_task(self, table_name: str, fingerprint: str, task: Callable[[], Dict], rows: int = 0) -> ExportJob:
+        """
+        Enfileira uma exportação qualquer (task devolve os caminhos dos arquivos e,
+        opcionalmente, o resultado do push em "powerbi_push")
+        """
+        with self._records() as records:
+            _fail_orphans(records)
+            active = [record for record in records if record["status"] in ACTIVE_STATUSES]
+            for record in active:
+                if record["table_name"] == table_name and record["fingerprint"] == fingerprint:
+                    logger.info(f"♻️ Exportação já em andamento: {table_name} (job {record['job_id']})")
+                    return ExportJob.model_validate(record)
+
+            if len(active) >= self.max_pending:
+                raise ExportQueueFullError(
+                    f"Limite de {self.max_pending} exportações pendentes atingido, tente novamente"
+                )
+
+            job = ExportJob(job_id=uuid.uuid4().hex, table_name=table_name, fingerprint=fingerprint, rows=rows)
+            records.append({**job.model_dump(mode="json"), "pid": os.getpid(), "worker": _worker_id()})
+            self._trim_history(records)
+
+        self._executor.submit(self._run, job.job_id, task)
+        logger.info(f"📤 Exportação enfileirada: {table_name} (job {job.job_id})")
+        return job
+
+    def _current(self) -> List[dict]:
+        """Registros para consulta (jobs de workers encerrados já aparecem como falhos)"""
+        records = self._read()
+        _fail_orphans(records)
+        return records
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        for record in self._current():
+            if record["job_id"] == job_id:
+                return ExportJob.model_validate(record)
+        return None
+
+    def list_jobs(self) -> List[ExportJob]:
+        """Jobs mais recentes primeiro"""
+        return [ExportJob.model_validate(record) for record in reversed(self._current())]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _update(self, job_id: str, **changes):
+        with self._records() as records:
+            for record in records:
+                if record["job_id"] == job_id:
+                    job = ExportJob.model_validate(record).model_copy(update=changes)
+                    record.update(job.model_dump(mode="json"))
+                    return
+            logger.warning(f"⚠️ Exportação {job_id} não está mais no histórico")
+
+    def _run(self, job_id: str, task: Callable[[], Dict]):
+        self._update(job_id, status="running", started_at=datetime.now())
+        try:
+            result = task()
+            self._update(job_id, status="completed", finished_at=datetime.now(), **result)
+        except Exception as e:
+            logger.error(f"❌ Erro na exportação (job {job_id}): {str(e)}", exc_info=True)
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now())
+
+    def _trim_history(self, records: List[dict]):
+        """Descarta os jobs finalizados mais antigos além do limite do histórico"""
+        excess = len(records) - self.history
+        if excess <= 0:
+            return
+        finished = {record["job_id"] for record in [
+            record for record in records if record["status"] not in ACTIVE_STATUSES
+        ][:excess]}
+        records[:] = [record for record in records if record["job_id"] not in finished]
+
+
+# (pid, id) deste processo: o id muda a cada inicialização, mesmo que o pid se repita
+_worker = (None, None)
+
+
+def _worker_id() -> str:
+    global _worker
+    if _worker[0] != os.getpid():
+        _worker = (os.getpid(), uuid.uuid4().hex)
+    return _worker[1]
+
+
+def _worker_alive(record: dict) -> bool:
+    """O worker que executa o job ainda existe"""
+    if record.get("worker") == _worker_id():
+        return True
+    pid = record.get("pid")
+    if pid is None or pid == os.getpid():
+        # Sem registro do worker, ou pid reaproveitado por este processo (ex: pid 1 no container)
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Processo existe, mas de outro usuário
+        return True
+    return True
+
+
+def _fail_orphans(records: List[dict]):
+    """Jobs ativos de workers encerrados nunca terminariam: marcados como falhos"""
+    for record in records:
+        if record["status"] in ACTIVE_STATUSES and not _worker_alive(record):
+            record.update(
+                status="failed",
+                error="Worker encerrado antes de concluir a exportação",
+                finished_at=datetime.now().isoformat()
+            )
+
+
+export_jobs = ExportJobManager(
+    max_workers=settings.EXPORT_WORKERS,
+    max_pending=settings.EXPORT_MAX_PENDING,
+    history=settings.EXPORT_JOB_HISTORY
+)
@@ -0,0 +1,33 @@
+"""
+Impressão digital (fingerprint) dos datasets usados nas análises
+"""
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
+
+def dataset_fingerprint(paths: Iterable[Path], extra: Iterable = ()) -> str:
+    """
+    Identificador curto que muda quando algum arquivo de entrada muda
+
+    Usa nome, tamanho e mtime de cada arquivo (sem ler o conteúdo), mais
+    valores extras que também alteram o resultado (ex: configurações).
+
+    Args:
+        paths: Arquivos de entrada (arquivos ausentes entram como "ausente")
+        extra: Outros valores que compõem a impressão digital
+
+    Returns:
+        Hash hexadecimal de 16 caracteres
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        path = Path(path)
+        try:
+            stat = path.stat()
+            digest.update(f"{path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+        except FileNotFoundError:
+            digest.update(f"{path}|ausente\n".encode("utf-8"))
+    for value in extra:
+        digest.update(f"{value!r}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,245 @@
+"""
+Contabilidade de memória por etapa e orçamento de memória por requisição
+
+Cada etapa medida com stage_timer (extratores, agregações, scores,
+serialização) registra o RSS do processo no início e no fim; uma thread
+amostra o RSS enquanto há etapas abertas para capturar o pico. O pico e a
+memória retida por etapa vão para /metrics e para o log.
+
+Com MEMORY_REQUEST_BUDGET_MB > 0, cada requisição da API tem um orçamento
+sobre o crescimento do RSS desde o seu início: ao ultrapassá-lo, a próxima
+fronteira de etapa interrompe a requisição com MemoryBudgetExceededError
+(HTTP 507) em vez de deixar o worker ser encerrado pelo sistema. Antes de
+ler um CSV, o tamanho esperado em memória também é conferido.
+
+O RSS é do processo inteiro: com requisições simultâneas os valores por
+etapa e por requisição são aproximados.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+from app.services.metrics import registry, stage_listeners
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Buckets (bytes) de 1 MB a 16 GB
+MEMORY_BUCKETS = tuple(MB * size for size in (1, 4, 16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+
+STAGE_PEAK_BYTES = registry.histogram(
+    "deliverycivil_stage_peak_memory_bytes",
+    "Pico de RSS acima do início de cada etapa",
+    ["stage"],
+    buckets=MEMORY_BUCKETS
+)
+STAGE_RETAINED_BYTES = registry.gauge(
+    "deliverycivil_stage_retained_memory_bytes",
+    "RSS retido ao final da última execução de cada etapa",
+    ["stage"]
+)
+PROCESS_RSS_BYTES = registry.gauge(
+    "deliverycivil_process_rss_bytes",
+    "RSS do processo na última fronteira de etapa"
+)
+BUDGET_EXCEEDED = registry.counter(
+    "deliverycivil_memory_budget_exceeded_total",
+    "Requisições interrompidas pelo orçamento de memória, por etapa",
+    ["stage"]
+)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_STATM = Path("/proc/self/statm")
+
+
+def current_rss() -> int:
+    """RSS atual do processo em bytes (Linux: /proc; outros: pico do getrusage; 0 se indisponível)"""
+    try:
+        with open(_STATM, "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: KB no Linux, bytes no macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class MemoryBudgetExceededError(MemoryError):
+    """Requisição ultrapassou MEMORY_REQUEST_BUDGET_MB"""
+
+
+class RequestBudget:
+    """Orçamento de uma requisição: crescimento máximo do RSS desde o início"""
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+
+    def used(self) -> int:
+        return self.peak_rss - self.start_rss
+
+    def check(self, stage: str, rss: int, expected: int = 0):
+        """
+        Interrompe a requisição se o orçamento foi (ou seria) ultrapassado
+
+        Args:
+            stage: Etapa em que a verificação acontece
+            rss: RSS atual (ou pico observado na etapa)
+            expected: Bytes que a etapa ainda vai alocar (estimativa)
+        """
+        self.peak_rss = max(self.peak_rss, rss)
+        needed = max(self.used(), rss - self.start_rss + expected)
+        if needed <= self.limit_bytes:
+            return
+        BUDGET_EXCEEDED.inc(1, stage)
+        estimated = " estimados" if expected else ""
+        raise MemoryBudgetExceededError(
+            f"Orçamento de memória da requisição excedido em {stage}: {needed / MB:.0f} MB{estimated} de "
+            f"{self.limit_bytes / MB:.0f} MB (MEMORY_REQUEST_BUDGET_MB). Reduza o dataset ou use ?engine=duckdb"
+        )
+
+
+_request_budget: contextvars.ContextVar[Optional[RequestBudget]] = contextvars.ContextVar("request_budget", default=None)
+
+
+class _OpenStage:
+    __slots__ = ("stage", "start_rss", "peak_rss")
+
+    def __init__(self, stage: str, rss: int):
+        self.stage = stage
+        self.start_rss = rss
+        self.peak_rss = rss
+
+
+class MemoryAccountant:
+    """
+    Observador de stage_timer que mede pico e memória retida por etapa
+
+    Uma thread amostra o RSS a cada MEMORY_SAMPLE_INTERVAL segundos, apenas
+    enquanto houver etapas em execução.
+    """
+
+    def __init__(self, interval: float, log_min_mb: float):
+        self.interval = interval
+        self.log_min_bytes = log_min_mb * MB
+        self._open: List[_OpenStage] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stack(self) -> List[_OpenStage]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def stage_started(self, stage: str):
+        rss = current_rss()
+        budget = _request_budget.get()
+        if budget is not None:
+            budget.check(stage, rss)
+
+        entry = _OpenStage(stage, rss)
+        self._stack().append(entry)
+        with self._lock:
+            self._open.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stage_finished(self, stage: str, seconds: float):
+        stack = self._stack()
+        if not stack or stack[-1].stage != stage:
+            return
+        entry = stack.pop()
+        rss = current_rss()
+        with self._lock:
+            self._open.remove(entry)
+            if not self._open:
+                self._wake.clear()
+        peak = max(entry.peak_rss, rss) - entry.start_rss
+        retained = rss - entry.start_rss
+
+        if settings.METRICS_ENABLED:
+            STAGE_PEAK_BYTES.observe(peak, stage)
+            STAGE_RETAINED_BYTES.set(retained, stage)
+            PROCESS_RSS_BYTES.set(rss)
+        message = (
+            f"🧠 Memória {stage}: pico +{peak / MB:.1f} MB, retido {retained / MB:+.1f} MB "
+            f"(RSS {rss / MB:.0f} MB, {seconds:.2f}s)"
+        )
+        if peak >= self.log_min_bytes:
+            logger.info(message)
+        else:
+            logger.debug(message)
+
+        budget = _request_budget.get()
+        if budget is not None:
+            budget.check(stage, max(entry.peak_rss, rss))
+
+    def _sample(self):
+        while True:
+            self._wake.wait()
+            rss = current_rss()
+            with self._lock:
+                for entry in self._open:
+                    if rss > entry.peak_rss:
+                        entry.peak_rss = rss
+            time.sleep(self.interval)
+
+
+memory_accountant = MemoryAccountant(settings.MEMORY_SAMPLE_INTERVAL, settings.MEMORY_LOG_MIN_MB)
+if settings.MEMORY_TRACKING_ENABLED and current_rss() > 0:
+    stage_listeners.append(memory_accountant)
+
+
+def check_file_budget(path, dataset: str):
+    """
+    Falha antes de ler um CSV que não cabe no orçamento da requisição
+
+    A estimativa é o tamanho do arquivo vezes MEMORY_CSV_EXPANSION
+    (DataFrame + colunas de texto em memória).
+    """
+    budget = _request_budget.get()
+    if budget is None:
+        return
+    try:
+        expected = int(os.path.getsize(path) * settings.MEMORY_CSV_EXPANSION)
+    except (OSError, TypeError):
+        return
+    budget.check(f"extract.{dataset}", current_rss(), expected)
+
+
+class MemoryBudgetMiddleware:
+    """Middleware ASGI que abre o orçamento de memória de cada requisição da API"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit_mb = settings.MEMORY_REQUEST_BUDGET_MB
+        if scope["type"] != "http" or limit_mb <= 0 or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_budget.set(RequestBudget(int(limit_mb * MB)))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_budget.reset(token)
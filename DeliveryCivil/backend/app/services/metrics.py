@@ -0,0 +1,458 @@
+"""
+Métricas de latência por etapa e por rota (formato texto do Prometheus)
+
+Implementação mínima e sem dependências: contadores e histogramas com
+rótulos, protegidos por lock e expostos em /metrics. Registrar uma
+observação custa um perf_counter, uma busca binária nos buckets e um
+lock.
+
+Cada worker do uvicorn tem seus próprios valores. Com
+METRICS_SHARE_SECONDS > 0, cada worker grava uma cópia das suas métricas
+em METRICS_SHARED_DIR a esse intervalo, e /metrics (em qualquer worker)
+soma contadores e histogramas de todos os workers, inclusive dos já
+encerrados, para que os totais não voltem atrás. Os gauges saem por
+worker, com o rótulo pid, e só dos workers que gravaram recentemente.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets (segundos) de 1 ms a 60 s: cobrem desde a descoberta de arquivos até análises grandes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Contador monotônico com rótulos"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def collect(self, values: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        items = sorted((self.snapshot() if values is None else values).items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(Counter):
+    """Valor instantâneo com rótulos (último valor registrado)"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    """Histograma com buckets fixos e rótulos"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagem por bucket (não acumulada) ..., +Inf, soma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return int(sum(series[:-1])) if series else 0
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def collect(self, series_by_labels: Optional[Dict[Tuple[str, ...], List[float]]] = None) -> List[str]:
+        items = sorted((self.snapshot() if series_by_labels is None else series_by_labels).items())
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas expostas em /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica já registrada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _all(self) -> list:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def dump(self) -> dict:
+        """Valores deste worker em formato JSON (cópia lida pelos outros workers)"""
+        return {
+            "pid": os.getpid(),
+            "written_at": time.time(),
+            "metrics": {
+                metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                for metric in self._all()
+            }
+        }
+
+    def render(self) -> str:
+        """Todas as métricas no formato de exposição em texto do Prometheus"""
+        others = metrics_sharing.read_others()
+        lines = []
+        for metric in self._all():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if not others:
+                lines.extend(metric.collect())
+            elif metric.kind == "gauge":
+                lines.extend(_collect_gauge_by_worker(metric, others))
+            else:
+                lines.extend(metric.collect(_merge_workers(metric, others)))
+        return "\n".join(lines) + "\n"
+
+
+def _merge_workers(metric, others: List[dict]) -> dict:
+    """Soma dos valores deste worker e dos demais (contadores e histogramas)"""
+    merged = metric.snapshot()
+    for dump in others:
+        for labels, value in dump["metrics"].get(metric.name, []):
+            labels = tuple(labels)
+            current = merged.get(labels)
+            if current is None:
+                merged[labels] = value
+            elif isinstance(current, list):
+                if len(current) == len(value):
+                    merged[labels] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[labels] = current + value
+    return merged
+
+
+def _collect_gauge_by_worker(metric, others: List[dict]) -> List[str]:
+    """Gauges de cada worker ativo, com o rótulo pid"""
+    live_after = time.time() - 3 * max(settings.METRICS_SHARE_SECONDS, 1.0)
+    workers = [(os.getpid(), metric.snapshot())] + [
+        (dump["pid"], {tuple(labels): value for labels, value in dump["metrics"].get(metric.name, [])})
+        for dump in others
+        if dump["written_at"] >= live_after
+    ]
+    lines = []
+    for pid, values in workers:
+        for labels, value in sorted(values.items()):
+            label_text = _format_labels(metric.labelnames, labels, f'pid="{pid}"')
+            lines.append(f"{metric.name}{label_text} {_format_value(value)}")
+    return lines
+
+
+# Cópias de workers sem gravar há mais que isto são removidas (os totais somados passam a desconsiderá-las)
+STALE_DUMP_SECONDS = 24 * 3600
+
+
+class MetricsSharing:
+    """Grava periodicamente as métricas deste worker e lê as dos demais"""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._boot = (None, None)
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.METRICS_ENABLED and settings.METRICS_SHARE_SECONDS > 0
+
+    @staticmethod
+    def directory() -> Path:
+        if settings.METRICS_SHARED_DIR:
+            return Path(settings.METRICS_SHARED_DIR)
+        shm = Path("/dev/shm")
+        if shm.is_dir() and os.access(shm, os.W_OK):
+            return shm / "deliverycivil" / "metrics"
+        return Path(settings.DATA_PROCESSED_DIR) / "metrics"
+
+    def _own_name(self) -> str:
+        # Um arquivo por inicialização do processo: um pid reaproveitado não sobrescreve os totais anteriores
+        if self._boot[0] != os.getpid():
+            self._boot = (os.getpid(), uuid.uuid4().hex[:12])
+        return f"{self._boot[0]}-{self._boot[1]}.json"
+
+    def start(self):
+        if not self.enabled() or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-sharing", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.enabled():
+            self.write()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.write()
+            self._stop.wait(settings.METRICS_SHARE_SECONDS)
+
+    def write(self):
+        directory = self.directory()
+        path = directory / self._own_name()
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(registry.dump(), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível gravar as métricas compartilhadas: {str(e)}")
+
+    def read_others(self) -> List[dict]:
+        """Cópias das métricas dos outros workers (vazio se o compartilhamento está desativado)"""
+        if not self.enabled():
+            return []
+        own = self._own_name()
+        dumps = []
+        try:
+            paths = list(self.directory().glob("*.json"))
+        except OSError:
+            return []
+        for path in paths:
+            if path.name == own:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    dump = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if dump.get("written_at", 0) < time.time() - STALE_DUMP_SECONDS:
+                path.unlink(missing_ok=True)
+                continue
+            dumps.append(dump)
+        return dumps
+
+
+metrics_sharing = MetricsSharing()
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "deliverycivil_stage_duration_seconds",
+    "Duração de cada etapa do ETL e da serialização",
+    ["stage"]
+)
+HTTP_SECONDS = registry.histogram(
+    "deliverycivil_http_request_duration_seconds",
+    "Duração das requisições por rota",
+    ["method", "route", "status"]
+)
+ROWS_PROCESSED = registry.counter(
+    "deliverycivil_rows_processed_total",
+    "Registros processados por etapa",
+    ["stage"]
+)
+BYTES_READ = registry.counter(
+    "deliverycivil_bytes_read_total",
+    "Bytes lidos dos arquivos de entrada por dataset",
+    ["dataset"]
+)
+CACHE_REQUESTS = registry.counter(
+    "deliverycivil_response_cache_requests_total",
+    "Consultas ao cache de respostas por resultado (hit, miss)",
+    ["result"]
+)
+
+# Observadores das etapas além do histograma (ex: perfil de uma requisição);
+# cada um implementa stage_started(stage) e stage_finished(stage, seconds)
+stage_listeners: List = []
+
+
+class stage_timer:
+    """
+    Mede uma etapa no histograma de etapas (context manager ou decorador)
+
+        with stage_timer("extract.vendas"):
+            ...
+
+        @stage_timer("aggregate.promocao")
+        def aggregate_sales(...):
+            ...
+    """
+
+    __slots__ = ("stage", "_start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._start = 0.0
+
+    def __enter__(self):
+        for listener in stage_listeners:
+            listener.stage_started(self.stage)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        if settings.METRICS_ENABLED:
+            STAGE_SECONDS.observe(elapsed, self.stage)
+        for listener in stage_listeners:
+            listener.stage_finished(self.stage, elapsed)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Um timer por chamada: o decorador pode ser usado em várias threads ao mesmo tempo
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def count_rows(stage: str, rows: int):
+    if settings.METRICS_ENABLED:
+        ROWS_PROCESSED.inc(rows, stage)
+
+
+def count_bytes_read(dataset: str, path: Optional[str]):
+    """Soma o tamanho do arquivo lido (ignorado se não for um caminho local)"""
+    if not settings.METRICS_ENABLED:
+        return
+    try:
+        BYTES_READ.inc(os.path.getsize(path), dataset)
+    except (OSError, TypeError):
+        pass
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede a duração das requisições HTTP
+
+    O rótulo route é o template da rota (ex: /api/exports/{job_id}), não o
+    caminho da URL, para não criar uma série por ID; caminhos sem rota
+    entram como "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - start, scope["method"], _route_template(scope), str(status["code"]))
+
+
+def _route_template(scope) -> str:
+    """Caminho com os parâmetros no lugar dos valores (o APIRoute não traz o prefixo do include_router)"""
+    if scope.get("route") is None:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    names = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    return "/".join("{" + names[segment] + "}" if segment in names else segment for segment in segments)
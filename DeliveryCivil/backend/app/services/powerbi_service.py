@@ -1,50 +1,116 @@
 """
 Serviço de integração com Power BI
 """
-import os
+import asyncio
+import functools
 import logging
-from typing import Dict, Optional
-from msal import ConfidentialClientApplication
-import requests
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import pandas as pd
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Respostas que valem nova tentativa (limite de taxa e falhas temporárias do serviço)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Backoff exponencial com jitter, respeitando Retry-After quando enviado"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    base = settings.POWER_BI_RETRY_BACKOFF * (2 ** attempt)
+    return base + random.uniform(0, base / 2)
+
+
+# Métodos que podem ser repetidos mesmo que a requisição tenha chegado ao serviço
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Falhas de rede em que a requisição com certeza não foi enviada
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _transport_retryable(method: str, error: httpx.TransportError) -> bool:
+    """
+    Falha de rede vale nova tentativa? Um POST de linhas que pode ter
+    chegado ao Power BI (ex: timeout de leitura) não é repetido, para não
+    inserir o lote duas vezes
+    """
+    return method.upper() in IDEMPOTENT_METHODS or isinstance(error, NOT_SENT_ERRORS)
+
+
+def _rows_payload(batch: pd.DataFrame) -> bytes:
+    """Corpo {"rows": [...]} serializado direto pelo pandas (NaN vira null)"""
+    rows = batch.to_json(orient="records", date_format="iso", force_ascii=False)
+    return b'{"rows":' + rows.encode("utf-8") + b"}"
+
+
 class PowerBIService:
-    """Serviço para autenticação e geração de embed tokens do Power BI"""
-    
-    def __init__(self):
+    """
+    Serviço para autenticação, embed tokens e push datasets do Power BI
+
+    Usa clientes httpx com pool de conexões (um síncrono e um assíncrono),
+    renova o access token antes de expirar e envia linhas para push datasets
+    em lotes concorrentes com nova tentativa e backoff.
+    """
+
+    def __init__(self, client: Optional[httpx.Client] = None, async_client: Optional[httpx.AsyncClient] = None):
         self.tenant_id = settings.AZURE_TENANT_ID or ""
         self.client_id = settings.AZURE_CLIENT_ID or ""
         self.client_secret = settings.AZURE_CLIENT_SECRET or ""
         self.workspace_id = settings.POWER_BI_WORKSPACE_ID or ""
         self.report_id = settings.POWER_BI_REPORT_ID or ""
         self.dataset_id = settings.POWER_BI_DATASET_ID or ""
-        self.api_url = settings.POWER_BI_API_URL
-        
-        # Cache de access token
+        self.api_url = settings.POWER_BI_API_URL.rstrip("/")
+        self.token_url = f"{settings.AZURE_AUTHORITY_URL.rstrip('/')}/{self.tenant_id}/oauth2/v2.0/token"
+
+        self._client = client or httpx.Client(**self._client_options())
+        self._async_client = async_client or httpx.AsyncClient(**self._client_options())
+
+        # Cache de access token (renovado POWER_BI_TOKEN_REFRESH_MARGIN segundos antes de expirar)
         self._access_token: Optional[str] = None
-    
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    @staticmethod
+    def _client_options() -> Dict:
+        return {
+            "limits": httpx.Limits(
+                max_connections=settings.POWER_BI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.POWER_BI_MAX_CONNECTIONS
+            ),
+            "timeout": httpx.Timeout(settings.POWER_BI_TIMEOUT),
+        }
+
     def is_configured(self) -> bool:
         """
         Verifica se o Power BI está configurado
-        
+
         Returns:
             True se todas as credenciais obrigatórias estão configuradas
         """
         return bool(
-            self.tenant_id and 
-            self.client_id and 
+            self.tenant_id and
+            self.client_id and
             self.client_secret and
             self.workspace_id and
             self.report_id
         )
-    
+
     def get_missing_credentials(self) -> list:
         """
         Retorna lista de credenciais faltando
-        
+
         Returns:
             Lista de nomes das credenciais que estão faltando
         """
@@ -60,11 +126,21 @@ class PowerBIService:
         if not self.report_id:
             missing.append("POWER_BI_REPORT_ID")
         return missing
-    
+
+    def _token_valid(self) -> bool:
+        margin = settings.POWER_BI_TOKEN_REFRESH_MARGIN
+        return self._access_token is not None and time.monotonic() < self._token_expires_at - margin
+
+    def invalidate_token(self):
+        """Descarta o token em cache (ex: após resposta 401)"""
+        with self._token_lock:
+            self._access_token = None
+            self._token_expires_at = 0.0
+
     def get_access_token(self) -> str:
         """
-        Obtém access token do Azure AD usando Service Principal
-        
+        Obtém access token do Azure AD usando Service Principal (client credentials)
+
         Returns:
             Access token para Power BI API
         """
@@ -75,88 +151,149 @@ class PowerBIService:
                 f"Power BI não configurado. Credenciais faltando: {', '.join(missing)}. "
                 f"Configure no arquivo backend/.env"
             )
-        
-        try:
-            # Se já temos token válido, retornar
-            if self._access_token:
-                return self._access_token
-            
-            # Criar aplicação MSAL
-            app = ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
-            # Obter token
-            result = app.acquire_token_for_client(
-                scopes=["https://analysis.windows.net/powerbi/api/.default"]
-            )
-            
-            if "access_token" in result:
-                self._access_token = result["access_token"]
-                logger.info("✅ Access token obtido com sucesso")
+
+        if self._token_valid():
+            return self._access_token
+
+        with self._token_lock:
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            if self._token_valid():
                 return self._access_token
-            else:
-                error = result.get("error_description", result.get("error", "Erro desconhecido"))
+
+            try:
+                response = self._send(
+                    "POST",
+                    self.token_url,
+                    authenticated=False,
+                    data={
+                        "grant_type": "client_credentials",
+                        "client_id": self.client_id,
+                        "client_secret": self.client_secret,
+                        "scope": settings.POWER_BI_SCOPE,
+                    }
+                )
+                result = response.json()
+            except httpx.HTTPStatusError as e:
+                result = e.response.json() if e.response.content else {}
+                error = result.get("error_description", result.get("error", str(e)))
                 error_code = result.get("error_codes", [])
                 logger.error(f"Erro ao obter access token: {error} (códigos: {error_code})")
                 raise Exception(f"Falha na autenticação Azure AD: {error}")
-                
-        except ValueError:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao obter access token: {str(e)}")
-            raise
-    
+            except Exception as e:
+                logger.error(f"Erro ao obter access token: {str(e)}")
+                raise
+
+            self._access_token = result["access_token"]
+            self._token_expires_at = time.monotonic() + float(result.get("expires_in", 3600))
+            logger.info("✅ Access token obtido com sucesso")
+            return self._access_token
+
+    async def get_access_token_async(self) -> str:
+        """Versão assíncrona: a obtenção do token (rara) roda em uma thread"""
+        if self._token_valid():
+            return self._access_token
+        return await asyncio.to_thread(self.get_access_token)
+
+    def _send(self, method: str, url: str, authenticated: bool = True, **kwargs) -> httpx.Response:
+        """
+        Requisição síncrona com nova tentativa (429/5xx; erros de rede só se
+        a requisição não foi enviada ou o método é idempotente) e renovação
+        do token em caso de 401
+        """
+        refreshed = False
+        attempt = 0
+        while True:
+            headers = dict(kwargs.pop("headers", None) or {})
+            if authenticated:
+                headers["Authorization"] = f"Bearer {self.get_access_token()}"
+            kwargs["headers"] = headers
+            try:
+                response = self._client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= settings.POWER_BI_MAX_RETRIES or not _transport_retryable(method, e):
+                    raise
+                delay = _retry_delay(attempt)
+                logger.warning(f"⚠️ Falha de rede no Power BI ({e}), nova tentativa em {delay:.1f}s")
+            else:
+                if response.status_code == 401 and authenticated and not refreshed:
+                    self.invalidate_token()
+                    refreshed = True
+                    continue
+                if response.status_code not in RETRY_STATUS or attempt >= settings.POWER_BI_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response
+                delay = _retry_delay(attempt, response)
+                logger.warning(f"⚠️ Power BI respondeu {response.status_code}, nova tentativa em {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    async def _send_async(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        """Versão assíncrona de _send (sempre autenticada)"""
+        refreshed = False
+        attempt = 0
+        while True:
+            headers = dict(kwargs.pop("headers", None) or {})
+            headers["Authorization"] = f"Bearer {await self.get_access_token_async()}"
+            kwargs["headers"] = headers
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= settings.POWER_BI_MAX_RETRIES or not _transport_retryable(method, e):
+                    raise
+                delay = _retry_delay(attempt)
+                logger.warning(f"⚠️ Falha de rede no Power BI ({e}), nova tentativa em {delay:.1f}s")
+            else:
+                if response.status_code == 401 and not refreshed:
+                    self.invalidate_token()
+                    refreshed = True
+                    continue
+                if response.status_code not in RETRY_STATUS or attempt >= settings.POWER_BI_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response
+                delay = _retry_delay(attempt, response)
+                logger.warning(f"⚠️ Power BI respondeu {response.status_code}, nova tentativa em {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
     def generate_embed_token(self, report_id: Optional[str] = None, dataset_id: Optional[str] = None) -> Dict:
         """
         Gera embed token para relatório Power BI
-        
+
         Args:
             report_id: ID do relatório (opcional, usa padrão se não fornecido)
             dataset_id: ID do dataset (opcional, usa padrão se não fornecido)
-            
+
         Returns:
             Dict com embedToken, embedUrl, reportId, etc.
         """
         try:
-            access_token = self.get_access_token()
-            
             # Usar IDs fornecidos ou padrão
             target_report_id = report_id or self.report_id
             target_dataset_id = dataset_id or self.dataset_id
-            
+
             if not target_report_id:
                 raise ValueError("report_id é obrigatório")
-            
+
             # URL da API
             url = f"{self.api_url}/groups/{self.workspace_id}/reports/{target_report_id}/GenerateToken"
-            
+
             # Payload para embed token
             payload = {
                 "accessLevel": "View",
                 "allowSaveAs": False
             }
-            
+
             if target_dataset_id:
                 payload["datasets"] = [{"id": target_dataset_id}]
-            
-            # Headers
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
+
             # Fazer requisição
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
+            response = self._send("POST", url, json=payload)
+
             token_data = response.json()
-            
+
             # Obter embed URL
             embed_url = f"https://app.powerbi.com/reportEmbed?reportId={target_report_id}&groupId={self.workspace_id}"
-            
+
             result = {
                 "embedToken": token_data.get("token"),
                 "embedUrl": embed_url,
@@ -165,44 +302,37 @@ class PowerBIService:
                 "tokenId": token_data.get("tokenId"),
                 "expiration": token_data.get("expiration")
             }
-            
+
             logger.info(f"✅ Embed token gerado para relatório {target_report_id}")
-            
+
             return result
-            
+
         except Exception as e:
             logger.error(f"Erro ao gerar embed token: {str(e)}")
             raise
-    
+
     def get_report_info(self, report_id: Optional[str] = None) -> Dict:
         """
         Obtém informações de um relatório Power BI
-        
+
         Args:
             report_id: ID do relatório (opcional, usa padrão se não fornecido)
-            
+
         Returns:
             Dict com informações do relatório
         """
         try:
-            access_token = self.get_access_token()
             target_report_id = report_id or self.report_id
-            
+
             if not target_report_id:
                 raise ValueError("report_id é obrigatório")
-            
+
             url = f"{self.api_url}/groups/{self.workspace_id}/reports/{target_report_id}"
-            
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
+
+            response = self._send("GET", url)
+
             report_info = response.json()
-            
+
             return {
                 "id": report_info.get("id"),
                 "name": report_info.get("name"),
@@ -210,8 +340,86 @@ class PowerBIService:
                 "embedUrl": report_info.get("embedUrl"),
                 "description": report_info.get("description")
             }
-            
+
         except Exception as e:
             logger.error(f"Erro ao obter informações do relatório: {str(e)}")
             raise
 
+    def _rows_url(self, table_name: str, dataset_id: Optional[str]) -> str:
+        target_dataset_id = dataset_id or self.dataset_id
+        if not target_dataset_id:
+            raise ValueError("dataset_id é obrigatório")
+        return f"{self.api_url}/groups/{self.workspace_id}/datasets/{target_dataset_id}/tables/{table_name}/rows"
+
+    async def push_rows(
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        dataset_id: Optional[str] = None,
+        replace: bool = False,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Dict:
+        """
+        Envia as linhas do DataFrame para uma tabela de push dataset
+
+        As linhas são divididas em lotes de POWER_BI_PUSH_BATCH_ROWS (limite
+        da API por requisição), enviados com até POWER_BI_PUSH_CONCURRENCY
+        requisições simultâneas sobre o pool de conexões.
+
+        Args:
+            df: Linhas a enviar
+            table_name: Tabela do push dataset
+            dataset_id: ID do dataset (opcional, usa padrão se não fornecido)
+            replace: Apagar as linhas existentes da tabela antes de enviar
+            client: Cliente assíncrono (padrão: o pool do serviço)
+
+        Returns:
+            Dict com total de linhas e lotes enviados
+        """
+        try:
+            url = self._rows_url(table_name, dataset_id)
+            client = client or self._async_client
+
+            if replace:
+                await self._send_async(client, "DELETE", url)
+
+            batch_rows = settings.POWER_BI_PUSH_BATCH_ROWS
+            semaphore = asyncio.Semaphore(settings.POWER_BI_PUSH_CONCURRENCY)
+
+            async def push_batch(start: int):
+                async with semaphore:
+                    # Serializa o lote só quando há vaga, limitando a memória em uso
+                    body = _rows_payload(df.iloc[start:start + batch_rows])
+                    await self._send_async(client, "POST", url, content=body, headers={"Content-Type": "application/json"})
+
+            starts: List[int] = list(range(0, len(df), batch_rows))
+            await asyncio.gather(*(push_batch(start) for start in starts))
+
+            logger.info(f"✅ Push Power BI: {table_name} ({len(df)} linhas em {len(starts)} lotes)")
+
+            return {"table_name": table_name, "rows": len(df), "batches": len(starts)}
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar linhas para o Power BI: {str(e)}")
+            raise
+
+    def push_rows_sync(self, df: pd.DataFrame, table_name: str, dataset_id: Optional[str] = None, replace: bool = False) -> Dict:
+        """push_rows para uso fora do event loop (ex: jobs de exportação)"""
+        async def run():
+            # AsyncClient fica preso ao event loop em que é usado: um pool por execução
+            async with httpx.AsyncClient(**self._client_options()) as client:
+                return await self.push_rows(df, table_name, dataset_id, replace, client=client)
+        return asyncio.run(run())
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        await self._async_client.aclose()
+        self._client.close()
+
+
+@functools.lru_cache(maxsize=1)
+def get_powerbi_service() -> PowerBIService:
+    """Instância compartilhada (reaproveita o pool de conexões e o token)"""
+    return PowerBIService()
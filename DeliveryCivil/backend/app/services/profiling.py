@@ -0,0 +1,407 @@
+"""
+Perfil sob demanda de uma requisição (CPU por amostragem ou alocações com tracemalloc)
+
+Ativado com ?profile=cpu|mem (ou o header X-Profile) nas rotas de análise e
+de upload, apenas com o header X-Admin-Token igual a PROFILING_ADMIN_TOKEN.
+O relatório atribui o tempo / a memória às funções do pacote app (extratores,
+analisadores, rotas) e fica disponível em GET /api/profiles/{profile_id}.
+"""
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from app.config import settings
+from app.services.metrics import stage_listeners
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cpu", "mem")
+PROFILE_HEADER = "x-profile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+# Rotas que aceitam o perfil (prefixos de caminho)
+PROFILED_PREFIXES = ("/api/analytics", "/api/datasets/upload")
+
+APP_DIR = str(Path(__file__).resolve().parent.parent) + os.sep
+
+# Funções listadas no relatório
+TOP_FUNCTIONS = 40
+TOP_STACKS = 200
+
+# tracemalloc é global ao processo: um perfil de memória por vez
+_memory_lock = threading.Lock()
+
+
+def _frame_name(code) -> str:
+    """Nome qualificado da função (módulo do app + co_qualname)"""
+    filename = code.co_filename
+    if filename.startswith(APP_DIR):
+        module = _frame_name_from_path(filename)
+    else:
+        module = os.path.basename(filename)
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _frame_name_from_path(filename: str) -> str:
+    return "app." + filename[len(APP_DIR):-3].replace(os.sep, ".")
+
+
+def _is_app_file(filename: str) -> bool:
+    return filename.startswith(APP_DIR) and not filename.endswith(("profiling.py", "metrics.py"))
+
+
+class _StageProfiler:
+    """Base dos profilers: registra as etapas (stage_timer) executadas durante o perfil"""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict] = {}
+        self._stage_lock = threading.Lock()
+
+    def start(self):
+        self._started = time.perf_counter()
+        stage_listeners.append(self)
+
+    def stop(self) -> Dict:
+        stage_listeners.remove(self)
+        return {"elapsed_seconds": round(time.perf_counter() - self._started, 4)}
+
+    def stage_started(self, stage: str):
+        pass
+
+    def stage_finished(self, stage: str, seconds: float):
+        with self._stage_lock:
+            entry = self._stage_entry(stage)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+
+    def _stage_entry(self, stage: str) -> Dict:
+        entry = self._stages.get(stage)
+        if entry is None:
+            entry = self._stages[stage] = {"stage": stage, "calls": 0, "seconds": 0.0}
+        return entry
+
+    def _stage_report(self, sort_key: str = "seconds") -> List[Dict]:
+        with self._stage_lock:
+            stages = [dict(entry) for entry in self._stages.values()]
+        for entry in stages:
+            entry["seconds"] = round(entry["seconds"], 4)
+        return sorted(stages, key=lambda entry: entry[sort_key], reverse=True)
+
+
+class CPUSampler(_StageProfiler):
+    """
+    Profiler por amostragem: uma thread lê as pilhas das outras threads a
+    cada PROFILING_SAMPLE_INTERVAL segundos (sys._current_frames)
+
+    Só entram as pilhas que passam por código do app, o que inclui a
+    thread em que o controle de admissão executa a requisição. As partições
+    do ShardedAnalyzer (?sharded=true) rodam no pool de processos e não
+    aparecem: o relatório mostra só a espera por elas. Requisições
+    simultâneas à perfilada também aparecem no relatório.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        super().start()
+        self._thread.start()
+
+    def stop(self) -> Dict:
+        self._stop.set()
+        self._thread.join()
+        report = super().stop()
+        report.update(self._report())
+        return report
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if any(_is_app_file(code.co_filename) for code in stack):
+                    self._stacks[tuple(reversed(stack))] += 1
+                    self.samples += 1
+
+    def _report(self) -> Dict:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        app_counts: Counter = Counter()
+        folded: Counter = Counter()
+
+        for stack, count in self._stacks.items():
+            names = [_frame_name(code) for code in stack]
+            self_counts[names[-1]] += count
+            for name in set(names):
+                total_counts[name] += count
+            # Função do app mais interna: a quem atribuir o tempo gasto em pandas/numpy
+            app_frame = next((code for code in reversed(stack) if _is_app_file(code.co_filename)), None)
+            if app_frame is not None:
+                app_counts[_frame_name(app_frame)] += count
+            folded[";".join(names)] += count
+
+        def share(counts: Counter, limit: int = TOP_FUNCTIONS) -> List[Dict]:
+            return [
+                {
+                    "function": name,
+                    "samples": count,
+                    "percent": round(100.0 * count / self.samples, 1) if self.samples else 0.0,
+                    "seconds": round(count * self.interval, 4)
+                }
+                for name, count in counts.most_common(limit)
+            ]
+
+        return {
+            "interval_seconds": self.interval,
+            "stages": self._stage_report(),
+            "samples": self.samples,
+            "app_functions": share(app_counts),
+            "cumulative": share(Counter({k: v for k, v in total_counts.items() if k.startswith("app.")})),
+            "self": share(self_counts),
+            # Formato "folded" (flamegraph.pl, speedscope)
+            "stacks": [f"{stack} {count}" for stack, count in folded.most_common(TOP_STACKS)],
+        }
+
+
+class MemoryProfiler(_StageProfiler):
+    """
+    Alocações (tracemalloc) durante a requisição
+
+    O pico de memória é medido por etapa (extratores, agregações, scores,
+    serialização) zerando o pico do tracemalloc no início de cada uma; em
+    etapas aninhadas ou paralelas o valor é aproximado. As alocações ainda
+    vivas ao final são atribuídas à linha do app mais interna da pilha
+    capturada (ou à linha da biblioteca, com pilhas curtas).
+    """
+
+    def __init__(self, frames: int):
+        super().__init__()
+        self.frames = frames
+        self._peak = 0
+        self._stage_base: Dict[str, int] = {}
+
+    def start(self):
+        if not _memory_lock.acquire(blocking=False):
+            raise RuntimeError("Outro perfil de memória está em andamento")
+        self._was_tracing = tracemalloc.is_tracing()
+        if not self._was_tracing:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self._baseline, _ = tracemalloc.get_traced_memory()
+        super().start()
+
+    def stage_started(self, stage: str):
+        with self._stage_lock:
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            tracemalloc.reset_peak()
+            self._stage_base[stage] = current
+
+    def stage_finished(self, stage: str, seconds: float):
+        with self._stage_lock:
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            base = self._stage_base.pop(stage, current)
+            entry = self._stage_entry(stage)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["peak_mb"] = max(entry.get("peak_mb", 0.0), round((peak - base) / 1e6, 3))
+            entry["retained_mb"] = round(entry.get("retained_mb", 0.0) + (current - base) / 1e6, 3)
+
+    def stop(self) -> Dict:
+        try:
+            report = super().stop()
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            snapshot = tracemalloc.take_snapshot()
+            if not self._was_tracing:
+                tracemalloc.stop()
+        finally:
+            _memory_lock.release()
+
+        by_line: Counter = Counter()
+        by_module: Counter = Counter()
+        for trace in snapshot.traces:
+            frame = next((f for f in trace.traceback if _is_app_file(f.filename)), None)
+            if frame is None:
+                # Sem frame do app na pilha capturada (PROFILING_TRACEMALLOC_FRAMES): linha da biblioteca
+                frame = trace.traceback[0]
+                module = os.path.basename(frame.filename)
+            else:
+                module = _frame_name_from_path(frame.filename)
+            by_line[f"{module}:{frame.lineno}"] += trace.size
+            by_module[module] += trace.size
+
+        def top(counts: Counter) -> List[Dict]:
+            return [{"location": name, "mb": round(size / 1e6, 3)} for name, size in counts.most_common(TOP_FUNCTIONS)]
+
+        report.update({
+            "peak_mb": round((self._peak - self._baseline) / 1e6, 3),
+            "retained_mb": round((current - self._baseline) / 1e6, 3),
+            "stages": self._stage_report(sort_key="peak_mb"),
+            "retained_by_line": top(by_line),
+            "retained_by_module": top(by_module),
+        })
+        return report
+
+
+class ProfileStore:
+    """Relatórios gravados em disco (os mais recentes, até PROFILING_KEEP)"""
+
+    def __init__(self, directory: Path, keep: int):
+        self.directory = directory
+        self.keep = keep
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        if not profile_id.isalnum():
+            return None
+        return self.directory / f"{profile_id}.json"
+
+    def save(self, profile_id: str, report: Dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(profile_id)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._apply_retention()
+
+    def load(self, profile_id: str) -> Optional[Dict]:
+        path = self.path(profile_id)
+        if path is None or not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def list(self) -> List[Dict]:
+        if not self.directory.exists():
+            return []
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        return [{"profile_id": p.stem, "url": f"/api/profiles/{p.stem}"} for p in files]
+
+    def _apply_retention(self):
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in files[self.keep:]:
+            old.unlink(missing_ok=True)
+
+
+profile_store = ProfileStore(Path(settings.DATA_PROCESSED_DIR) / "profiles", settings.PROFILING_KEEP)
+
+
+def is_admin(headers: Dict[str, str]) -> bool:
+    """Perfil liberado apenas com PROFILING_ADMIN_TOKEN configurado e enviado em X-Admin-Token"""
+    token = settings.PROFILING_ADMIN_TOKEN
+    sent = headers.get(ADMIN_TOKEN_HEADER)
+    # Comparação em tempo constante: o tempo da resposta não revela o prefixo correto do token
+    return bool(token) and sent is not None and hmac.compare_digest(sent.encode("utf-8"), token.encode("utf-8"))
+
+
+def is_profiling(request) -> bool:
+    """A requisição está sendo perfilada (o cache de respostas é ignorado)"""
+    return bool(request.scope.get("state", {}).get("profile"))
+
+
+def _requested_mode(scope) -> Tuple[Optional[str], Dict[str, str]]:
+    headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+    mode = headers.get(PROFILE_HEADER)
+    if mode is None and b"profile=" in scope.get("query_string", b""):
+        mode = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [None])[0]
+    return (mode.lower() if mode else None), headers
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila a requisição quando pedido
+
+    A resposta recebe X-Profile-Id e X-Profile-Url; o relatório é gravado
+    quando a resposta termina.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(PROFILED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        mode, headers = _requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        if mode not in PROFILE_MODES:
+            await _send_error(send, 400, f"Perfil inválido: {mode}. Use: {', '.join(PROFILE_MODES)}")
+            return
+        if not is_admin(headers):
+            await _send_error(send, 403, "Perfil de requisição restrito a administradores")
+            return
+
+        profiler = CPUSampler(settings.PROFILING_SAMPLE_INTERVAL) if mode == "cpu" else MemoryProfiler(settings.PROFILING_TRACEMALLOC_FRAMES)
+        try:
+            profiler.start()
+        except RuntimeError as e:
+            await _send_error(send, 409, str(e))
+            return
+
+        profile_id = uuid.uuid4().hex
+        scope.setdefault("state", {})["profile"] = mode
+
+        response = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode()),
+                    (b"x-profile-url", f"/api/profiles/{profile_id}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            report = profiler.stop()
+            report.update({
+                "profile_id": profile_id,
+                "mode": mode,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status_code": response["status"],
+                "created_at": datetime.now().isoformat(),
+            })
+            try:
+                profile_store.save(profile_id, report)
+                logger.info(f"🔬 Perfil {mode} gravado: {scope['path']} (perfil {profile_id})")
+            except Exception as e:
+                logger.error(f"❌ Erro ao gravar perfil {profile_id}: {str(e)}")
+
+
+async def _send_error(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
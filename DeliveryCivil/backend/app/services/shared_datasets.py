@@ -0,0 +1,178 @@
+"""
+Datasets compartilhados entre os workers em memória mapeada (Arrow IPC)
+
+O primeiro worker que precisa de um dataset extrai o CSV (com as validações
+do extrator) e publica o DataFrame como arquivo Arrow IPC sem compressão em
+SHARED_DATASETS_DIR (padrão /dev/shm). Os demais workers, e as requisições
+seguintes do mesmo worker, mapeiam o arquivo com mmap e montam o DataFrame
+sem copiar as colunas numéricas, de data e de texto: as páginas ficam uma
+única vez na memória do sistema, qualquer que seja o número de workers.
+
+Cada geração é identificada pelo fingerprint do CSV de origem
+(<dataset>-<fingerprint>.arrow). Quando um novo arquivo chega, a próxima
+requisição publica a nova geração e troca a referência do worker; as
+gerações que não são a publicada nem a do arquivo atual do dataset são
+removidas do diretório (um worker atrasado que republica a geração
+anterior não remove a atual), e o sistema libera as páginas quando o
+último worker deixa de usá-las.
+
+Se a publicação ou o mapeamento falhar (ex: /dev/shm cheio ou sem
+permissão), a requisição segue com o DataFrame extraído no próprio
+processo, como sem SHARED_DATASETS_ENABLED.
+
+Os DataFrames mapeados são somente leitura e compartilhados entre as
+requisições: as análises não devem alterá-los.
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from app.config import settings
+from app.services.fingerprint import dataset_fingerprint
+from app.services.metrics import registry
+from app.services.uploads import latest_dataset_file
+from app.utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Muda quando o formato dos arquivos publicados muda (invalida as gerações antigas)
+FORMAT_VERSION = 1
+
+SHARED_DATASET_BYTES = registry.gauge(
+    "deliverycivil_shared_dataset_bytes",
+    "Tamanho da geração mapeada de cada dataset compartilhado",
+    ["dataset"]
+)
+SHARED_DATASET_FALLBACKS = registry.counter(
+    "deliverycivil_shared_dataset_fallbacks_total",
+    "Extrações no próprio processo por falha ao publicar ou mapear o dataset compartilhado",
+    ["dataset"]
+)
+
+# Falhas de /dev/shm (espaço, permissão) e da escrita/leitura do Arrow IPC
+SHARED_ERRORS = (OSError, pa.ArrowException)
+
+
+def _types_mapper(arrow_type):
+    # Texto como string[pyarrow]: o pandas usa o buffer do Arrow (string[python] copiaria cada valor)
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def _default_directory() -> Path:
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm / "deliverycivil"
+    return Path(settings.DATA_PROCESSED_DIR) / "shared"
+
+
+class SharedDatasetStore:
+    """Gerações publicadas e DataFrames mapeados por este worker"""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self._directory = directory
+        self._attached: Dict[str, Tuple[str, pd.DataFrame, Path]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Path:
+        directory = Path(self._directory or settings.SHARED_DATASETS_DIR or _default_directory())
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def get(self, dataset: str, csv_path: Path, extract: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        """
+        DataFrame do CSV, mapeado da geração compartilhada (publicada se necessário)
+
+        Args:
+            dataset: Nome do dataset ("vendas", "estoque")
+            csv_path: CSV de origem (o fingerprint dele identifica a geração)
+            extract: Extrator usado na publicação (ex: SalesExtractor().from_csv)
+        """
+        generation = dataset_fingerprint([csv_path], extra=(FORMAT_VERSION,))
+        attached = self._attached.get(dataset)
+        if attached is not None and attached[0] == generation:
+            return attached[1]
+
+        with self._lock:
+            attached = self._attached.get(dataset)
+            if attached is not None and attached[0] == generation:
+                return attached[1]
+
+            extracted = None
+            try:
+                arrow_path = self.directory / f"{dataset}-{generation}.arrow"
+                if not arrow_path.exists():
+                    with FileLock(self.directory / f"{dataset}.lock"):
+                        if not arrow_path.exists():
+                            extracted = extract(str(csv_path))
+                            self._publish(dataset, arrow_path, extracted)
+                df = self.attach(arrow_path)
+            except SHARED_ERRORS as e:
+                logger.warning(
+                    f"⚠️ Dataset de {dataset} não compartilhado ({e}): extraído neste processo"
+                )
+                SHARED_DATASET_FALLBACKS.inc(1, dataset)
+                return extracted if extracted is not None else extract(str(csv_path))
+            # Troca de geração: requisições em andamento mantêm a referência antiga
+            self._attached[dataset] = (generation, df, arrow_path)
+            SHARED_DATASET_BYTES.set(arrow_path.stat().st_size, dataset)
+            logger.info(f"🔗 Dataset de {dataset} mapeado da geração {generation} ({len(df)} registros)")
+            return df
+
+    def _publish(self, dataset: str, arrow_path: Path, df: pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = arrow_path.with_name(f".{arrow_path.name}.{os.getpid()}.tmp")
+        try:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, arrow_path)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        logger.info(f"📤 Dataset de {dataset} publicado em memória compartilhada: {arrow_path.name}")
+
+        # Gerações antigas: quem ainda as mapeia continua lendo até soltar a referência.
+        # A do arquivo atual fica, mesmo que esta publicação seja de um arquivo anterior
+        keep = {arrow_path}
+        current = latest_dataset_file(dataset)
+        if current is not None:
+            keep.add(self.directory / f"{dataset}-{dataset_fingerprint([current], extra=(FORMAT_VERSION,))}.arrow")
+        for old_path in self.directory.glob(f"{dataset}-*.arrow"):
+            if old_path not in keep:
+                try:
+                    old_path.unlink()
+                except OSError:
+                    pass
+
+    def source_path(self, df: pd.DataFrame) -> Optional[Path]:
+        """
+        Arquivo Arrow da geração de onde veio o DataFrame (None se não veio
+        deste store): outros processos mapeiam o mesmo arquivo com attach()
+        """
+        for _, attached_df, arrow_path in list(self._attached.values()):
+            if attached_df is df:
+                return arrow_path
+        return None
+
+    @staticmethod
+    def attach(arrow_path: Path) -> pd.DataFrame:
+        source = pa.memory_map(str(arrow_path), "r")
+        table = pa.ipc.open_file(source).read_all()
+        # split_blocks: uma coluna por bloco, permitindo apontar direto para os buffers mapeados
+        return table.to_pandas(split_blocks=True, types_mapper=_types_mapper)
+
+    def clear(self):
+        """Solta as referências deste worker (as gerações continuam publicadas)"""
+        with self._lock:
+            self._attached.clear()
+
+
+shared_datasets = SharedDatasetStore()
@@ -0,0 +1,225 @@
+"""
+Gravação dos uploads com hash do conteúdo e deduplicação
+
+O arquivo é gravado em blocos enquanto o SHA-256 é calculado. Se o mesmo
+conteúdo já foi enviado para o mesmo dataset, o upload novo é descartado e
+a resposta reutiliza o arquivo existente e o resultado da validação
+(registros e amostra), sem extrair o CSV de novo. O arquivo existente não
+é alterado (nem o mtime): fingerprints, caches de respostas e artefatos
+derivados do arquivo (Parquet do DuckDB, sketches, Arrow compartilhado)
+continuam válidos. O dataset atual é o de envio mais recente segundo o
+índice (ou pelo mtime, para arquivos copiados direto em DATA_RAW_DIR), de
+modo que reenviar um conteúdo antigo volta a selecioná-lo.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import UploadFile
+
+from app.config import settings
+from app.etl.load.powerbi_loader import write_json_file
+from app.utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 1024 * 1024
+INDEX_FILE = "uploads_index.json"
+
+
+class StoredUpload:
+    """Upload gravado em disco (ainda em arquivo temporário) e seu hash"""
+
+    def __init__(self, dataset: str, tmp_path: Path, content_hash: str, size: int):
+        self.dataset = dataset
+        self.tmp_path = tmp_path
+        self.content_hash = content_hash
+        self.size = size
+
+
+class UploadIndex:
+    """
+    Índice hash do conteúdo -> dataset já processado (DATA_PROCESSED_DIR/uploads_index.json)
+
+    Relido do disco a cada consulta para ser compartilhado entre workers;
+    as gravações são feitas com lock entre processos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _path() -> Path:
+        return Path(settings.DATA_PROCESSED_DIR) / INDEX_FILE
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def find(self, dataset: str, content_hash: str) -> Optional[dict]:
+        """
+        Entrada do mesmo conteúdo cujo arquivo ainda existe com esse conteúdo
+
+        Arquivo com o tamanho e o mtime registrados no upload é considerado
+        intacto; se o mtime mudou, o SHA-256 do arquivo é recalculado.
+        """
+        entry = self._read().get(f"{dataset}:{content_hash}")
+        if entry is None:
+            return None
+        path = Path(settings.DATA_RAW_DIR) / entry["file_name"]
+        try:
+            stat = path.stat()
+            if stat.st_size != entry["size"]:
+                return None
+            if stat.st_mtime_ns != entry.get("mtime_ns") and file_sha256(path) != content_hash:
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def selected_at(self) -> Dict[str, float]:
+        """Nome do arquivo -> último envio (epoch) do seu conteúdo"""
+        return {
+            entry["file_name"]: entry.get("selected_at", 0.0)
+            for entry in self._read().values()
+        }
+
+    def records_count(self, dataset: str, file_name: str) -> Optional[int]:
+        """Registros validados no upload do arquivo (None se não veio pela API)"""
+        for key, entry in self._read().items():
+            if key.startswith(f"{dataset}:") and entry["file_name"] == file_name:
+                return entry["records_count"]
+        return None
+
+    def add(self, upload: StoredUpload, file_name: str, records_count: int, sample: list):
+        file_path = Path(settings.DATA_RAW_DIR) / file_name
+        with self._update() as index:
+            index[f"{upload.dataset}:{upload.content_hash}"] = {
+                "file_name": file_name,
+                "size": upload.size,
+                "mtime_ns": file_path.stat().st_mtime_ns,
+                "records_count": records_count,
+                "sample": sample,
+                "uploaded_at": datetime.now().isoformat(),
+                "selected_at": time.time()
+            }
+
+    def select(self, dataset: str, content_hash: str):
+        """Registra o reenvio do conteúdo: o arquivo volta a ser o dataset atual"""
+        with self._update() as index:
+            entry = index.get(f"{dataset}:{content_hash}")
+            if entry is not None:
+                entry["selected_at"] = time.time()
+
+    @contextmanager
+    def _update(self):
+        """Índice para alteração, gravado ao final (com lock entre processos)"""
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, FileLock(path.with_suffix(".lock")):
+            index = self._read()
+            yield index
+            write_json_file(path, index)
+
+
+upload_index = UploadIndex()
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dataset_selected_at(path: Path, selected: Optional[Dict[str, float]] = None) -> float:
+    """Momento em que o arquivo passou a ser o atual: mtime ou último envio pelo índice"""
+    if selected is None:
+        selected = upload_index.selected_at()
+    return max(path.stat().st_mtime, selected.get(path.name, 0.0))
+
+
+def latest_dataset_file(dataset: str) -> Optional[Path]:
+    """Arquivo atual de DATA_RAW_DIR para o dataset ("vendas", "estoque", "compras")"""
+    files = list(Path(settings.DATA_RAW_DIR).glob(f"{dataset}_*.csv"))
+    if not files:
+        return None
+    selected = upload_index.selected_at()
+    return max(files, key=lambda path: dataset_selected_at(path, selected))
+
+
+async def store_upload(file: UploadFile, dataset: str) -> StoredUpload:
+    """
+    Grava o upload em um temporário de DATA_RAW_DIR calculando o SHA-256
+
+    Args:
+        file: Arquivo recebido
+        dataset: Prefixo do dataset ("vendas", "estoque", "compras")
+    """
+    raw_dir = Path(settings.DATA_RAW_DIR)
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = raw_dir / f".{dataset}_{uuid.uuid4().hex}.upload"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await file.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return StoredUpload(dataset, tmp_path, digest.hexdigest(), size)
+
+
+def reuse_duplicate(upload: StoredUpload) -> Optional[dict]:
+    """
+    Descarta o upload se o conteúdo já existe e devolve a entrada do índice
+
+    Se o arquivo existente não é o atual do dataset, o reenvio é registrado
+    no índice para que volte a ser o usado nas análises (o arquivo não é
+    tocado: os caches ligados ao seu mtime continuam valendo).
+    """
+    entry = upload_index.find(upload.dataset, upload.content_hash)
+    if entry is None:
+        return None
+    upload.tmp_path.unlink(missing_ok=True)
+
+    path = Path(settings.DATA_RAW_DIR) / entry["file_name"]
+    if latest_dataset_file(upload.dataset) != path:
+        upload_index.select(upload.dataset, upload.content_hash)
+        logger.info(f"♻️ {path.name} volta a ser o dataset de {upload.dataset} mais recente")
+    return entry
+
+
+def commit_upload(upload: StoredUpload) -> Path:
+    """
+    Move o temporário para <dataset>_<timestamp>_<hash>.csv
+
+    O prefixo do hash distingue uploads diferentes no mesmo segundo; um
+    arquivo existente com o mesmo nome (mesmo conteúdo) nunca é sobrescrito.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_path = Path(settings.DATA_RAW_DIR) / f"{upload.dataset}_{timestamp}_{upload.content_hash[:12]}.csv"
+    try:
+        os.link(upload.tmp_path, file_path)
+    except FileExistsError:
+        logger.info(f"♻️ {file_path.name} já existe com o mesmo conteúdo")
+    upload.tmp_path.unlink(missing_ok=True)
+    return file_path
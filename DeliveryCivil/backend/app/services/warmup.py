@@ -0,0 +1,106 @@
+"""
+Aquecimento do worker na inicialização (lifespan) e prontidão em /ready
+
+Logo após subir, cada worker faz requisições internas (ASGI, sem rede) às
+rotas de WARMUP_PATHS: os imports pesados, a leitura dos datasets mais
+recentes e as três análises acontecem antes do primeiro cliente, e as
+respostas ficam no cache de respostas. As requisições rodam em uma thread
+com event loop próprio, pois as análises são síncronas e bloqueariam o
+loop que responde /health e /ready. /ready só responde 200 depois disso;
+/health continua indicando apenas que o processo está no ar.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """Andamento do aquecimento deste worker"""
+
+    def __init__(self):
+        self.status = "pending"  # pending, running, ready
+        self.started_at: Optional[float] = None
+        self.duration_seconds: Optional[float] = None
+        self.results: List[Dict] = []
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "duration_seconds": self.duration_seconds,
+            "requests": self.results,
+            "error": self.error
+        }
+
+
+warmup_state = WarmupState()
+
+
+async def _request_all(app, paths: List[str]):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://warmup", timeout=None) as client:
+        for path in paths:
+            start = time.perf_counter()
+            response = await client.get(path, headers={"X-Request-ID": f"warmup{path.replace('/', '-')}"})
+            warmup_state.results.append({
+                "path": path,
+                "status": response.status_code,
+                "seconds": round(time.perf_counter() - start, 3)
+            })
+            if response.status_code == 404:
+                # Sem datasets ainda: nada para aquecer nas demais rotas
+                logger.warning(f"⚠️ Aquecimento: {path} retornou 404 (datasets ausentes)")
+                return
+            if response.status_code >= 400:
+                logger.warning(f"⚠️ Aquecimento: {path} retornou {response.status_code}")
+
+
+async def _run(app):
+    start = time.perf_counter()
+    logger.info(f"🔥 Aquecendo worker: {', '.join(settings.WARMUP_PATHS)}")
+    try:
+        await asyncio.wait_for(_request_all(app, settings.WARMUP_PATHS), timeout=settings.WARMUP_TIMEOUT or None)
+    except asyncio.TimeoutError:
+        warmup_state.error = f"Tempo limite de {settings.WARMUP_TIMEOUT:.0f}s excedido"
+        logger.warning(f"⚠️ Aquecimento interrompido: {warmup_state.error}")
+    except Exception as e:
+        warmup_state.error = str(e)
+        logger.error(f"❌ Erro no aquecimento: {str(e)}")
+    finally:
+        warmup_state.duration_seconds = round(time.perf_counter() - start, 3)
+        warmup_state.status = "ready"
+    logger.info(f"✅ Worker pronto em {warmup_state.duration_seconds:.2f}s")
+
+
+def start_warmup(app):
+    """
+    Inicia o aquecimento em segundo plano; /ready fica pronto ao final
+
+    Falhas e o tempo limite (WARMUP_TIMEOUT) não impedem a prontidão: o
+    worker passa a receber tráfego como sem o aquecimento, e o erro fica
+    em /ready.
+
+    Args:
+        app: Aplicação ASGI completa (com os middlewares)
+    """
+    if not settings.WARMUP_ENABLED:
+        warmup_state.status = "ready"
+        return
+    if warmup_state.status != "pending":
+        return
+
+    warmup_state.status = "running"
+    warmup_state.started_at = time.time()
+    threading.Thread(target=asyncio.run, args=(_run(app),), name="warmup", daemon=True).start()
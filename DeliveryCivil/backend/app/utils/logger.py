@@ -1,33 +1,252 @@
 """
 Configuração de logging
+
+Os loggers da aplicação só enfileiram os registros (QueueHandler com fila
+limitada); uma thread em segundo plano (QueueListener) escreve no stdout e
+em logs/app.<pid>.log (JSON por linha, com rotação por tamanho). Cada
+processo tem o seu arquivo: com vários workers rotacionando o mesmo
+arquivo, um renomearia o arquivo em que os outros ainda escrevem e
+registros se perderiam. Com a fila cheia o registro é descartado e
+contado, nunca bloqueando o event loop.
 """
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
+import uuid
+from datetime import datetime
 from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.metrics import registry, stage_listeners
+
+LOG_RECORDS_DROPPED = registry.counter(
+    "deliverycivil_log_records_dropped_total",
+    "Registros de log descartados com a fila cheia"
+)
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# Contexto da requisição atual (preenchido pelo RequestContextMiddleware)
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_request_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_stages", default=None)
+
+# Atributos padrão do LogRecord (o restante vem de extra= e vai para o JSON)
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample_rate"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Anexa o request_id ao registro (executado na thread que gerou o log)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Amostragem determinística dos registros de alto volume
+
+    Registros até INFO dos loggers em LOG_SAMPLED_LOGGERS passam na
+    proporção LOG_SAMPLE_RATE; WARNING e acima sempre passam.
+    """
+
+    def __init__(self, prefixes, rate: float):
+        super().__init__()
+        self.prefixes = tuple(prefixes)
+        self.rate = rate
+        self._credit: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno > logging.INFO or not record.name.startswith(self.prefixes):
+            return True
+        with self._lock:
+            credit = self._credit.get(record.name, 1.0) + self.rate
+            keep = credit >= 1.0
+            self._credit[record.name] = credit - 1.0 if keep else credit
+        if keep:
+            record.sample_rate = self.rate
+        return keep
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) em vez de bloquear com a fila cheia"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class JSONFormatter(logging.Formatter):
+    """Um objeto JSON por linha: horário, nível, logger, mensagem, request_id e campos extras"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "sample_rate", None) is not None:
+            entry["sample_rate"] = record.sample_rate
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RequestStageRecorder:
+    """Observador de stage_timer: soma a duração das etapas da requisição atual"""
+
+    def stage_started(self, stage: str):
+        pass
+
+    def stage_finished(self, stage: str, seconds: float):
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
 
 def setup_logging():
     """Configura logging da aplicação"""
+    global _listener
+
     # Criar diretório de logs
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    
+    log_dir = Path(settings.LOG_DIR)
+    log_dir.mkdir(parents=True, exist_ok=True)
+
     # Configurar formato
     log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
-    
-    # Configurar handlers
-    handlers = [
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(log_dir / "app.log", encoding="utf-8")
-    ]
-    
-    # Configurar logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        datefmt=date_format,
-        handlers=handlers
+    text_formatter = logging.Formatter(log_format, datefmt=date_format)
+
+    # Handlers executados na thread do QueueListener
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter() if settings.LOG_FORMAT == "json" else text_formatter)
+    # Um arquivo por processo: a rotação de um worker não afeta os demais
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_dir / f"app.{os.getpid()}.log",
+        maxBytes=int(settings.LOG_MAX_MB * 1024 * 1024),
+        backupCount=settings.LOG_BACKUP_COUNT,
+        encoding="utf-8"
     )
-    
+    file_handler.setFormatter(JSONFormatter())
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLED_LOGGERS, settings.LOG_SAMPLE_RATE))
+
+    # Reconfiguração (ex: reload): encerrar o listener anterior
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, file_handler)
+    _listener.start()
+
+    if not any(isinstance(listener, _RequestStageRecorder) for listener in stage_listeners):
+        stage_listeners.append(_RequestStageRecorder())
+
     return logging.getLogger(__name__)
 
+
+def stop_logging():
+    """
+    Escreve os registros pendentes e encerra a thread de escrita
+
+    Os handlers passam a ficar direto no logger raiz (escrita síncrona), para
+    que os registros do encerramento não se percam.
+    """
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+            for handler_filter in handler.filters:
+                for target in listener.handlers:
+                    target.addFilter(handler_filter)
+    for target in listener.handlers:
+        root.addHandler(target)
+
+
+# Processos que terminam sem o lifespan (scripts, testes) também escrevem a fila
+atexit.register(stop_logging)
+
+
+class RequestContextMiddleware:
+    """
+    Middleware ASGI que define o request_id (header X-Request-ID ou novo) e,
+    ao final, registra a requisição com status, duração e tempo por etapa
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("app.access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        stages: Dict[str, float] = {}
+        stages_token = _request_stages.set(stages)
+        response = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            status = response["status"]
+            self.logger.log(
+                logging.WARNING if status >= 500 else logging.INFO,
+                f"📡 {scope['method']} {scope['path']} {status} ({duration_ms:.0f} ms)",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(duration_ms, 2),
+                    "stages": {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()},
+                }
+            )
+            _request_stages.reset(stages_token)
+            request_id_var.reset(id_token)
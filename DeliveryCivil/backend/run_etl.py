@@ -0,0 +1,54 @@
+"""
+Script para executar o pipeline ETL em lote (cron), sem o servidor web
+
+Exemplos:
+    python run_etl.py                      # extrai, analisa e exporta as três análises (etapas inalteradas vêm do cache)
+    python run_etl.py --since last         # só executa se os dados mudaram desde a última execução
+    python run_etl.py --since 2024-06-30   # só executa se algum arquivo mudou depois dessa data
+"""
+import argparse
+import json
+import sys
+
+from app.etl.batch import BatchRun, parse_since
+from app.etl.transform.analyzers import ANALYZERS
+from app.utils.logger import setup_logging
+
+
+def _print_report(run: BatchRun):
+    print(f"\nExecução: {run.status} (fingerprint {run.fingerprint or '-'})")
+    for name, stage in run.stages.items():
+        rows = f"{stage['rows']:>10} linhas" if "rows" in stage else " " * 17
+        error = f"  {stage['error']}" if stage.get("error") else ""
+        print(f"  {name:<24} {stage['status']:<10} {stage['seconds']:>9.3f}s {rows}{error}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pipeline ETL em lote: extração, análises e exportação para o Power BI")
+    parser.add_argument("--analyses", default=",".join(ANALYZERS), help="Análises separadas por vírgula (padrão: todas)")
+    parser.add_argument("--since", help='"last" ou data/hora ISO: pula a execução se as entradas não mudaram')
+    parser.add_argument("--workers", type=int, default=0, help="Threads para as etapas paralelas (0 = análises + 1)")
+    parser.add_argument("--no-load", action="store_true", help="Apenas extrai e analisa, sem exportar")
+    parser.add_argument("--force", action="store_true", help="Recalcula todas as etapas, ignorando o cache")
+    parser.add_argument("--json", action="store_true", help="Relatório em JSON no stdout")
+    args = parser.parse_args()
+
+    try:
+        since = parse_since(args.since)
+        run = BatchRun([name.strip() for name in args.analyses.split(",") if name.strip()], args.workers,
+                       load=not args.no_load, force=args.force)
+    except ValueError as e:
+        parser.error(str(e))
+
+    setup_logging()
+    run.run(since)
+
+    if args.json:
+        print(json.dumps(run.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        _print_report(run)
+    return 1 if run.status == "failed" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Testes executados a partir de qualquer diretório importam o pacote app do backend
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,130 @@
+"""
+Push dataset do Power BI contra um servidor simulado (httpx.MockTransport)
+"""
+import asyncio
+import json
+
+import httpx
+import pandas as pd
+import pytest
+
+from app.config import settings
+from app.services.powerbi_service import PowerBIService
+
+
+class FakePowerBI:
+    """Endpoints de token e de linhas do Power BI, com respostas programáveis"""
+
+    def __init__(self):
+        self.tokens_issued = 0
+        self.requests = []
+        self.accepted = []
+        # Respostas a devolver antes das de sucesso (status ou exceção), por método
+        self.failures = {"POST": [], "DELETE": []}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/oauth2/v2.0/token"):
+            self.tokens_issued += 1
+            return httpx.Response(200, json={"access_token": f"token-{self.tokens_issued}", "expires_in": 3600})
+
+        self.requests.append(request)
+        pending = self.failures.get(request.method, [])
+        if pending:
+            failure = pending.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return failure
+        if request.headers["Authorization"] != f"Bearer token-{self.tokens_issued}":
+            return httpx.Response(401)
+        self.accepted.append(request)
+        return httpx.Response(200)
+
+    def posted_rows(self) -> list:
+        """Linhas aceitas pelo serviço"""
+        return [
+            row
+            for request in self.accepted
+            if request.method == "POST"
+            for row in json.loads(request.content)["rows"]
+        ]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(settings, "AZURE_TENANT_ID", "tenant")
+    monkeypatch.setattr(settings, "AZURE_CLIENT_ID", "client")
+    monkeypatch.setattr(settings, "AZURE_CLIENT_SECRET", "secret")
+    monkeypatch.setattr(settings, "POWER_BI_REPORT_ID", "report")
+    monkeypatch.setattr(settings, "POWER_BI_WORKSPACE_ID", "workspace")
+    monkeypatch.setattr(settings, "POWER_BI_DATASET_ID", "dataset")
+    monkeypatch.setattr(settings, "POWER_BI_PUSH_BATCH_ROWS", 10)
+    monkeypatch.setattr(settings, "POWER_BI_RETRY_BACKOFF", 0.0)
+    return FakePowerBI()
+
+
+def push(fake: FakePowerBI, df: pd.DataFrame, replace: bool = False) -> dict:
+    transport = httpx.MockTransport(fake.handler)
+    service = PowerBIService(client=httpx.Client(transport=transport))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await service.push_rows(df, "vendas", replace=replace, client=client)
+
+    return asyncio.run(run())
+
+
+def frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"produto_id": range(rows), "valor": [1.5] * rows})
+
+
+def test_rows_sent_in_batches(fake):
+    result = push(fake, frame(25), replace=True)
+
+    assert result == {"table_name": "vendas", "rows": 25, "batches": 3}
+    assert fake.requests[0].method == "DELETE"
+    assert [len(json.loads(r.content)["rows"]) for r in fake.requests[1:]] == [10, 10, 5]
+    assert sorted(row["produto_id"] for row in fake.posted_rows()) == list(range(25))
+    assert fake.tokens_issued == 1
+
+
+def test_rate_limit_honours_retry_after(fake, monkeypatch):
+    delays = []
+
+    async def no_sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    fake.failures["POST"].append(httpx.Response(429, headers={"Retry-After": "7"}))
+
+    push(fake, frame(5))
+
+    assert delays == [7.0]
+    assert len(fake.posted_rows()) == 5
+
+
+def test_expired_token_is_refreshed_once(fake):
+    fake.failures["POST"].append(httpx.Response(401))
+
+    push(fake, frame(5))
+
+    assert fake.tokens_issued == 2
+    assert fake.requests[-1].headers["Authorization"] == "Bearer token-2"
+    assert len(fake.posted_rows()) == 5
+
+
+def test_post_not_retried_after_it_may_have_been_sent(fake):
+    fake.failures["POST"].append(httpx.ReadTimeout("sem resposta"))
+
+    with pytest.raises(httpx.ReadTimeout):
+        push(fake, frame(5))
+
+    assert len([r for r in fake.requests if r.method == "POST"]) == 1
+
+
+def test_post_retried_when_connection_failed(fake):
+    fake.failures["POST"].append(httpx.ConnectError("recusada"))
+
+    push(fake, frame(5))
+
+    assert len([r for r in fake.requests if r.method == "POST"]) == 2
+    assert len(fake.posted_rows()) == 5
@@ -0,0 +1,238 @@
+"""
+Benchmark de escalabilidade do ETL (extratores, analisadores e /analytics/summary)
+
+Para cada escala gera (ou reutiliza) os datasets sintéticos de generate_data.py,
+mede o tempo (melhor de N execuções) e o pico de memória alocada (tracemalloc,
+em uma execução separada) de cada etapa e compara com o baseline salvo.
+O processo termina com código 1 quando alguma etapa regride além do limite.
+
+Uso (a partir de DeliveryCivil/):
+    python scripts/benchmark.py --scales xs,s --save-baseline
+    python scripts/benchmark.py --scales xs,s            # compara com o baseline
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = SCRIPTS_DIR.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+# Diretórios de trabalho da aplicação fora de data/ (definidos antes de importar app.config)
+WORK_DIR = Path(tempfile.gettempdir()) / "deliverycivil_bench"
+os.environ.setdefault("DATA_PROCESSED_DIR", str(WORK_DIR / "processed"))
+os.environ.setdefault("DATA_OUTPUT_DIR", str(WORK_DIR / "output"))
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import pandas as pd  # noqa: E402
+
+from generate_data import SCALES, generate  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.etl.extract.sales_extractor import SalesExtractor  # noqa: E402
+from app.etl.extract.stock_extractor import StockExtractor  # noqa: E402
+from app.etl.extract.purchases_extractor import PurchasesExtractor  # noqa: E402
+from app.etl.transform.analyzers import ANALYZERS  # noqa: E402
+from app.models.policy import AnalysisPolicy  # noqa: E402
+
+DEFAULT_BASELINE = SCRIPTS_DIR / "benchmarks" / "baseline.json"
+
+# Diferenças abaixo destes valores são ruído de medição, não regressão
+MIN_SECONDS_DELTA = 0.05
+MIN_MB_DELTA = 1.0
+
+
+def measure(func, repeat: int, profile_memory: bool = True) -> dict:
+    """
+    Mede uma etapa
+
+    Args:
+        func: Função sem argumentos
+        repeat: Execuções cronometradas (vale a mais rápida)
+        profile_memory: Medir o pico de memória em uma execução extra
+
+    Returns:
+        Dict com seconds, peak_mb e o resultado da última execução
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if profile_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = round(peak / 1e6, 2)
+
+    return {"seconds": round(min(timings), 4), "peak_mb": peak_mb, "result": result}
+
+
+def dataset_dir(scale: str, seed: int, data_dir: Path) -> Path:
+    """Gera os datasets da escala uma única vez por semente"""
+    target = data_dir / f"{scale}_seed{seed}"
+    marker = target / ".completo"
+    if not marker.exists():
+        sales_rows, skus = SCALES[scale]
+        print(f"🧪 Gerando escala {scale} ({sales_rows:,} vendas, {skus:,} SKUs)...")
+        generate(target, sales_rows, skus, seed=seed, suffix=scale)
+        marker.touch()
+    return target
+
+
+def bench_scale(scale: str, seed: int, data_dir: Path, repeat: int, profile_memory: bool) -> dict:
+    """Executa todas as etapas em uma escala"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    directory = dataset_dir(scale, seed, data_dir)
+    paths = {kind: str(directory / f"{kind}_{scale}.csv") for kind in ("vendas", "estoque", "compras")}
+    results = {}
+
+    def record(name, func, rows_of=len):
+        m = measure(func, repeat, profile_memory)
+        m["rows"] = rows_of(m.pop("result"))
+        results[name] = m
+        print(f"   {name:<22} {m['seconds']:>9.3f}s  {m['peak_mb'] or 0:>9.1f} MB  {m['rows']:>12,} linhas")
+
+    record("extract.vendas", lambda: SalesExtractor().from_csv(paths["vendas"]))
+    record("extract.estoque", lambda: StockExtractor().from_csv(paths["estoque"]))
+    record("extract.compras", lambda: PurchasesExtractor().from_csv(paths["compras"]))
+
+    sales_df = SalesExtractor().from_csv(paths["vendas"])
+    stock_df = StockExtractor().from_csv(paths["estoque"])
+    policy = AnalysisPolicy()
+    for name, analyzer_cls in ANALYZERS.items():
+        analyzer = analyzer_cls(policy)
+        record(f"analyze.{name}", lambda: analyzer.analyze(sales_df, stock_df))
+    del sales_df, stock_df
+
+    settings.DATA_RAW_DIR = str(directory)
+    client = TestClient(app)
+
+    def summary():
+        response = client.get("/api/analytics/summary")
+        response.raise_for_status()
+        return response.json()
+
+    record("api.summary", summary, rows_of=lambda body: body["summary"]["total_sales"])
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float, mem_threshold: float) -> list:
+    """
+    Compara as medições com o baseline
+
+    Returns:
+        Lista de mensagens de regressão (vazia se nada regrediu)
+    """
+    regressions = []
+    for scale, steps in current.items():
+        for step, m in steps.items():
+            base = baseline.get(scale, {}).get(step)
+            if not base:
+                continue
+            if (m["seconds"] > base["seconds"] * (1 + threshold)
+                    and m["seconds"] - base["seconds"] > MIN_SECONDS_DELTA):
+                regressions.append(
+                    f"{scale}/{step}: tempo {base['seconds']:.3f}s -> {m['seconds']:.3f}s "
+                    f"(+{(m['seconds'] / base['seconds'] - 1) * 100:.0f}%)"
+                )
+            if (m.get("peak_mb") is not None and base.get("peak_mb")
+                    and m["peak_mb"] > base["peak_mb"] * (1 + mem_threshold)
+                    and m["peak_mb"] - base["peak_mb"] > MIN_MB_DELTA):
+                regressions.append(
+                    f"{scale}/{step}: memória {base['peak_mb']:.1f}MB -> {m['peak_mb']:.1f}MB "
+                    f"(+{(m['peak_mb'] / base['peak_mb'] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def environment() -> dict:
+    """Ambiente da medição (baselines só são comparáveis na mesma máquina)"""
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escalabilidade do ETL")
+    parser.add_argument("--scales", default="xs,s", help=f"Escalas separadas por vírgula ({', '.join(SCALES)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções cronometradas por etapa")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="Não medir o pico de memória")
+    parser.add_argument("--data-dir", type=Path, default=WORK_DIR / "datasets", help="Cache dos datasets gerados")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Gravar as medições como novo baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Regressão de tempo tolerada (0.25 = 25%%)")
+    parser.add_argument("--mem-threshold", type=float, default=0.25, help="Regressão de memória tolerada")
+    parser.add_argument("--output", type=Path, help="Gravar as medições em JSON")
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"Escalas desconhecidas: {unknown}")
+
+    print("=" * 60)
+    print(f"⏱️  BENCHMARK DO ETL: escalas {', '.join(scales)}")
+    print("=" * 60)
+
+    current = {}
+    for scale in scales:
+        print(f"\n📊 Escala {scale}")
+        current[scale] = bench_scale(scale, args.seed, args.data_dir, args.repeat, not args.no_memory)
+
+    report = {"environment": environment(), "seed": args.seed, "results": current}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+        baseline.setdefault("results", {}).update(current)
+        baseline["environment"] = report["environment"]
+        baseline["seed"] = args.seed
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n💾 Baseline salvo em {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\n⚠️  Baseline não encontrado ({args.baseline}); use --save-baseline para criá-lo")
+        return
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("environment") != report["environment"]:
+        print("\n⚠️  Baseline gravado em outro ambiente; as comparações de tempo podem não ser confiáveis")
+
+    regressions = compare(current, baseline.get("results", {}), args.threshold, args.mem_threshold)
+    if regressions:
+        print("\n❌ REGRESSÕES")
+        for message in regressions:
+            print(f"   - {message}")
+        sys.exit(1)
+    print("\n✅ Nenhuma regressão em relação ao baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Gerador determinístico de datasets sintéticos (vendas, estoque e compras)
+
+Produz arquivos no mesmo formato dos exemplos de data/examples, em escalas de
+10 mil a 100 milhões de vendas, com distribuições realistas:
+- Popularidade dos produtos em lei de potência (poucos produtos concentram as vendas)
+- Clientes recorrentes também concentrados (e ~5% das vendas sem cliente_id)
+- Sazonalidade semanal (menos vendas no domingo) e crescimento ao longo do período
+- Parte do catálogo parada (sem vendas) e parte abaixo do estoque mínimo
+
+A mesma semente e a mesma escala geram sempre os mesmos arquivos. As vendas são
+escritas em blocos, então a memória usada não depende do total de linhas.
+
+Uso (a partir de DeliveryCivil/):
+    python scripts/generate_data.py --scale s
+    python scripts/generate_data.py --sales 2000000 --skus 50000 --stores 8 --output /tmp/dados
+"""
+import argparse
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Escalas pré-definidas: nome -> (linhas de vendas, SKUs)
+SCALES = {
+    "xs": (10_000, 1_000),
+    "s": (100_000, 10_000),
+    "m": (1_000_000, 100_000),
+    "l": (10_000_000, 500_000),
+    "xl": (100_000_000, 1_000_000),
+}
+
+# Categoria -> (preço mediano, dispersão do log-preço)
+CATEGORIES = {
+    "Cimento": (35.0, 0.3),
+    "Argamassa": (28.0, 0.3),
+    "Tijolo": (1.5, 0.4),
+    "Areia": (120.0, 0.3),
+    "Tinta": (180.0, 0.5),
+    "Ferramenta": (150.0, 0.8),
+    "Elétrica": (45.0, 0.9),
+    "Hidráulica": (38.0, 0.8),
+    "Piso": (60.0, 0.5),
+    "Ferragem": (12.0, 0.7),
+}
+
+BRANDS = ["Votoran", "Quartzolit", "Suvinil", "Coral", "Bosch", "Tramontina", "Tigre", "Amanco", "Portobello", "Gerdau"]
+SUPPLIERS = [f"Fornecedor {chr(ord('A') + i)}" for i in range(12)]
+
+# Peso de cada dia da semana (segunda = 0)
+WEEKDAY_WEIGHTS = np.array([1.0, 1.0, 1.0, 1.05, 1.15, 1.2, 0.35])
+
+CHUNK_ROWS = 1_000_000
+
+
+def _rng(seed: int, *stream: int) -> np.random.Generator:
+    """Gerador independente por fluxo (catálogo, bloco de vendas, ...), estável entre execuções"""
+    return np.random.default_rng([seed, *stream])
+
+
+def _power_law_cdf(n: int, exponent: float, rng: np.random.Generator) -> tuple:
+    """
+    Distribuição acumulada em lei de potência sobre n itens
+
+    Returns:
+        Tupla (CDF por posição de popularidade, permutação posição -> índice do item)
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    # Popularidade não correlacionada com o id do produto
+    return cdf, rng.permutation(n)
+
+
+def _sample(cdf: np.ndarray, order: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """Amostra índices de acordo com a CDF (busca binária, O(size log n))"""
+    return order[np.searchsorted(cdf, rng.random(size), side="right").clip(max=len(cdf) - 1)]
+
+
+def build_catalog(skus: int, seed: int) -> pd.DataFrame:
+    """
+    Catálogo de produtos com categoria e preço de venda
+
+    Args:
+        skus: Quantidade de produtos
+        seed: Semente
+
+    Returns:
+        DataFrame com produto_id, produto_nome, categoria, preco
+    """
+    rng = _rng(seed, 0)
+    names = list(CATEGORIES)
+    category_idx = rng.integers(0, len(names), size=skus)
+    medians = np.array([CATEGORIES[c][0] for c in names])[category_idx]
+    sigmas = np.array([CATEGORIES[c][1] for c in names])[category_idx]
+    prices = np.round(medians * np.exp(rng.normal(0.0, sigmas)), 2).clip(min=0.5)
+    brand_idx = rng.integers(0, len(BRANDS), size=skus)
+
+    produto_id = np.arange(1, skus + 1)
+    categoria = np.array(names, dtype=object)[category_idx]
+    produto_nome = [
+        f"{c} {BRANDS[b]} {pid:07d}" for c, b, pid in zip(categoria, brand_idx, produto_id)
+    ]
+    return pd.DataFrame({
+        "produto_id": produto_id,
+        "produto_nome": produto_nome,
+        "categoria": categoria,
+        "preco": prices,
+    })
+
+
+def _date_table(end_date: date, days: int) -> tuple:
+    """Datas do período e a CDF de vendas por dia (sazonalidade semanal e crescimento)"""
+    dates = pd.date_range(end=pd.Timestamp(end_date), periods=days, freq="D")
+    weights = WEEKDAY_WEIGHTS[dates.weekday] * np.linspace(0.8, 1.2, days)
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    return dates.strftime("%Y-%m-%d").to_numpy(), cdf
+
+
+def iter_sales(
+    catalog: pd.DataFrame,
+    rows: int,
+    seed: int,
+    end_date: date,
+    days: int = 365,
+    stores: int = 0,
+    skew: float = 0.9,
+    chunk_rows: int = CHUNK_ROWS
+):
+    """
+    Gera as vendas em blocos de até chunk_rows linhas
+
+    Args:
+        catalog: Catálogo de build_catalog
+        rows: Total de linhas de vendas
+        seed: Semente
+        end_date: Data da venda mais recente
+        days: Período coberto (dias)
+        stores: Quantidade de lojas (0 = sem coluna loja_id)
+        skew: Expoente da lei de potência da popularidade dos produtos
+        chunk_rows: Linhas por bloco
+
+    Yields:
+        DataFrame no formato data,produto_id,produto_nome,quantidade,valor_total,cliente_id[,loja_id]
+    """
+    skus = len(catalog)
+    # ~30% do catálogo sem vendas no período (produtos "encalhados")
+    active = max(1, int(skus * 0.7))
+    product_cdf, product_order = _power_law_cdf(active, skew, _rng(seed, 1))
+    customers = max(100, rows // 20)
+    customer_cdf, customer_order = _power_law_cdf(customers, 0.8, _rng(seed, 2))
+    dates, date_cdf = _date_table(end_date, days)
+
+    product_ids = catalog["produto_id"].to_numpy()
+    product_names = catalog["produto_nome"].to_numpy()
+    prices = catalog["preco"].to_numpy()
+
+    for chunk, start in enumerate(range(0, rows, chunk_rows)):
+        size = min(chunk_rows, rows - start)
+        rng = _rng(seed, 100, chunk)
+
+        idx = _sample(product_cdf, product_order, size, rng)
+        # Itens baratos saem em maior quantidade por venda
+        mean_qty = np.clip(200.0 / prices[idx], 1.0, 50.0)
+        quantidade = rng.poisson(mean_qty) + 1
+        desconto = 1.0 - rng.choice([0.0, 0.05, 0.10], size=size, p=[0.8, 0.15, 0.05])
+        valor_total = np.round(quantidade * prices[idx] * desconto, 2)
+
+        cliente_id = pd.array(_sample(customer_cdf, customer_order, size, rng) + 100, dtype="Int64")
+        cliente_id[rng.random(size) < 0.05] = pd.NA
+
+        data = dates[np.searchsorted(date_cdf, rng.random(size), side="right").clip(max=len(dates) - 1)]
+        order = np.argsort(data, kind="stable")
+
+        df = pd.DataFrame({
+            "data": data,
+            "produto_id": product_ids[idx],
+            "produto_nome": product_names[idx],
+            "quantidade": quantidade,
+            "valor_total": valor_total,
+            "cliente_id": cliente_id,
+        })
+        if stores > 0:
+            df["loja_id"] = rng.integers(1, stores + 1, size=size)
+        yield df.iloc[order]
+
+
+def build_stock(catalog: pd.DataFrame, seed: int) -> pd.DataFrame:
+    """
+    Posição de estoque: ~10% zerado, ~20% abaixo do mínimo e ~15% com excesso
+
+    Returns:
+        DataFrame no formato produto_id,produto_nome,quantidade_atual,quantidade_minima,custo_unitario,categoria
+    """
+    rng = _rng(seed, 3)
+    skus = len(catalog)
+    quantidade_minima = rng.integers(5, 60, size=skus)
+    situacao = rng.choice(4, size=skus, p=[0.10, 0.20, 0.55, 0.15])
+    quantidade_atual = np.select(
+        [situacao == 0, situacao == 1, situacao == 2],
+        [
+            np.zeros(skus, dtype=np.int64),
+            (quantidade_minima * rng.uniform(0.1, 0.9, size=skus)).astype(np.int64),
+            (quantidade_minima * rng.uniform(1.0, 4.0, size=skus)).astype(np.int64),
+        ],
+        (quantidade_minima * rng.uniform(8.0, 20.0, size=skus)).astype(np.int64),
+    )
+    custo_unitario = np.round(catalog["preco"].to_numpy() * rng.uniform(0.45, 0.8, size=skus), 2).clip(min=0.01)
+    return pd.DataFrame({
+        "produto_id": catalog["produto_id"],
+        "produto_nome": catalog["produto_nome"],
+        "quantidade_atual": quantidade_atual,
+        "quantidade_minima": quantidade_minima,
+        "custo_unitario": custo_unitario,
+        "categoria": catalog["categoria"],
+    })
+
+
+def build_purchases(catalog: pd.DataFrame, stock_df: pd.DataFrame, seed: int, end_date: date, days: int = 365) -> pd.DataFrame:
+    """
+    Pedidos de compra (em média dois por SKU no período)
+
+    Returns:
+        DataFrame no formato data,produto_id,fornecedor,quantidade,custo_total
+    """
+    rng = _rng(seed, 4)
+    size = len(catalog) * 2
+    idx = rng.integers(0, len(catalog), size=size)
+    dates, _ = _date_table(end_date, days)
+    quantidade = (stock_df["quantidade_minima"].to_numpy()[idx] * rng.uniform(1.0, 3.0, size=size)).astype(np.int64) + 1
+    custo_total = np.round(quantidade * stock_df["custo_unitario"].to_numpy()[idx], 2)
+    df = pd.DataFrame({
+        "data": dates[rng.integers(0, len(dates), size=size)],
+        "produto_id": catalog["produto_id"].to_numpy()[idx],
+        "fornecedor": np.array(SUPPLIERS, dtype=object)[rng.integers(0, len(SUPPLIERS), size=size)],
+        "quantidade": quantidade,
+        "custo_total": custo_total,
+    })
+    return df.sort_values("data", kind="stable")
+
+
+def generate(
+    output_dir: Path,
+    sales_rows: int,
+    skus: int,
+    seed: int = 42,
+    end_date: date = date(2024, 6, 30),
+    days: int = 365,
+    stores: int = 0,
+    skew: float = 0.9,
+    suffix: str = "sintetico"
+) -> dict:
+    """
+    Gera vendas_{suffix}.csv, estoque_{suffix}.csv e compras_{suffix}.csv
+
+    Returns:
+        Dict tipo de dataset -> caminho do arquivo
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    catalog = build_catalog(skus, seed)
+    paths = {
+        "vendas": output_dir / f"vendas_{suffix}.csv",
+        "estoque": output_dir / f"estoque_{suffix}.csv",
+        "compras": output_dir / f"compras_{suffix}.csv",
+    }
+
+    stock_df = build_stock(catalog, seed)
+    stock_df.to_csv(paths["estoque"], index=False)
+    build_purchases(catalog, stock_df, seed, end_date, days).to_csv(paths["compras"], index=False)
+
+    # Vendas escritas em blocos (arquivo temporário renomeado ao final)
+    tmp_path = paths["vendas"].with_name(f".{paths['vendas'].name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(iter_sales(catalog, sales_rows, seed, end_date, days, stores, skew)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+    tmp_path.replace(paths["vendas"])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera datasets sintéticos de vendas, estoque e compras")
+    parser.add_argument("--scale", choices=sorted(SCALES, key=lambda s: SCALES[s][0]), default="xs",
+                        help="Escala pré-definida (vendas, SKUs)")
+    parser.add_argument("--sales", type=int, help="Linhas de vendas (sobrescreve a escala)")
+    parser.add_argument("--skus", type=int, help="Quantidade de produtos (sobrescreve a escala)")
+    parser.add_argument("--stores", type=int, default=0, help="Quantidade de lojas (0 = sem loja_id)")
+    parser.add_argument("--days", type=int, default=365, help="Dias cobertos pelas vendas")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date(2024, 6, 30), help="Data da venda mais recente")
+    parser.add_argument("--skew", type=float, default=0.9, help="Expoente da popularidade dos produtos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=Path("data/raw"), help="Diretório de saída")
+    parser.add_argument("--suffix", default=None, help="Sufixo dos arquivos (padrão: sintetico_<escala>)")
+    args = parser.parse_args()
+
+    sales_rows, skus = SCALES[args.scale]
+    sales_rows = args.sales or sales_rows
+    skus = args.skus or skus
+    suffix = args.suffix or f"sintetico_{args.scale}"
+
+    print("=" * 60)
+    print(f"🧪 GERANDO DATASETS SINTÉTICOS: {sales_rows:,} vendas, {skus:,} SKUs (semente {args.seed})")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    paths = generate(args.output, sales_rows, skus, args.seed, args.end_date, args.days, args.stores, args.skew, suffix)
+    elapsed = time.perf_counter() - start
+
+    for kind, path in paths.items():
+        print(f"✅ {kind}: {path} ({path.stat().st_size / 1e6:.1f} MB)")
+    print(f"\n⏱️  Concluído em {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
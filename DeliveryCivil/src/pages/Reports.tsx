@@ -24,17 +24,31 @@ const Reports: React.FC = () => {
     loadSummary();
   }, []);
 
+  // Recarregar somente quando uma nova versão das análises ficar pronta (sem polling)
+  useEffect(() => {
+    let currentVersion: number | null = null;
+    const unsubscribe = analyticsApi.subscribeUpdates((event) => {
+      if (currentVersion !== null && event.version !== currentVersion) {
+        loadSummary();
+        setPromotionData(null);
+        setStockData(null);
+      }
+      currentVersion = event.version;
+    });
+    return unsubscribe;
+  }, []);
+
   useEffect(() => {
     if (activeTab === 'promotion' && !promotionData) {
       loadPromotionAnalysis();
     }
-  }, [activeTab]);
+  }, [activeTab, promotionData]);
 
   useEffect(() => {
     if (activeTab === 'stock' && !stockData) {
       loadStockAnalysis();
     }
-  }, [activeTab]);
+  }, [activeTab, stockData]);
 
   const loadSummary = async () => {
     try {
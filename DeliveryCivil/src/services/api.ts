@@ -44,6 +44,15 @@ export interface AnalyticsSummary {
   top_cashback: any[];
 }
 
+export interface AnalysisReadyEvent {
+  version: number;
+  fingerprint: string;
+  ready_at: string;
+  seconds: number;
+  analyses: string[];
+  changed?: Record<string, any[]>;  // Com ?top=N: linhas do topo alteradas por análise
+}
+
 // Power BI agora usa iframe público - não precisa de API
 export const reportsApi = {
   // Endpoint mantido apenas para compatibilidade
@@ -159,5 +168,16 @@ export const analyticsApi = {
     const response = await apiClient.get<AnalyticsSummary>('/api/analytics/summary');
     return response.data;
   },
+
+  /**
+   * Eventos de novas versões das análises (SSE); retorna a função que encerra a conexão
+   */
+  subscribeUpdates: (onReady: (event: AnalysisReadyEvent) => void): (() => void) => {
+    const source = new EventSource(`${API_BASE_URL}/api/events/analyses`);
+    source.addEventListener('analysis_ready', (message) => {
+      onReady(JSON.parse((message as MessageEvent).data));
+    });
+    return () => source.close();
+  },
 };
 